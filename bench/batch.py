@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Measure how many messages a server broadcasts for a stream of updates.
+
+This starts two servers (on the mock MQTT backend) and lets ``clients``
+clients write ``n`` entries to the first, concurrently. Reported are the
+number of messages the server sent to the broker and the wall time until
+the other server has all entries, with various ``server.batch``
+settings.
+
+Usage: python3 bench/batch.py [entries [clients]]
+"""
+
+import sys
+import time
+
+import trio
+
+from distkv.mock.mqtt import stdtest
+from distkv.util import P
+
+SETTINGS = (
+    ("off", dict(enabled=False)),
+    ("queued", dict(enabled=True, delay=0)),
+    ("5 ms", dict(enabled=True, delay=0.005)),
+    ("5 ms, 4k", dict(enabled=True, delay=0.005, max_len=4000)),
+)
+
+
+async def run(name, batch, n, clients):
+    cfg = {"server": {"batch": batch}}
+    async with stdtest(n=2, args={"init": 0, "cfg": cfg}, tocks=10 * n) as st:
+        s = st.s[0]
+        sent = [0]
+        send = s.serf.send
+
+        async def counting_send(*a, **kw):
+            sent[0] += 1
+            await send(*a, **kw)
+
+        s.serf.send = counting_send
+
+        async def writer(k):
+            async with st.client(0) as c:
+                for i in range(k, n, clients):
+                    await c.set(P("bench") | i, value=i)
+
+        t1 = time.perf_counter()
+        async with trio.open_nursery() as tg:
+            for k in range(clients):
+                tg.start_soon(writer, k)
+        e = st.s[1].root.follow(P("bench"))
+        while len(e) < n:
+            await trio.sleep(0.1)
+        t2 = time.perf_counter()
+        print(
+            f"{n} entries, {clients} clients, batch {name:>8}: "
+            f"{sent[0]} messages, {t2-t1:.2f} s"
+        )
+
+
+async def main(n=2000, clients=10):
+    for name, batch in SETTINGS:
+        await run(name, batch, n, clients)
+
+
+if __name__ == "__main__":
+    trio.run(main, *(int(x) for x in sys.argv[1:]))
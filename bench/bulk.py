@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Measure writing many entries through one client connection.
+
+This starts a server (on the mock MQTT backend) and writes ``n`` entries,
+once awaiting each ``set`` and once through ``client.pipeline()``.
+Reported are the writes per second.
+
+Usage: python3 bench/bulk.py [n]
+"""
+
+import sys
+import time
+
+import trio
+from trio.testing import MockClock
+
+from distkv.mock.mqtt import stdtest
+from distkv.util import P
+
+
+async def main(n=20000):
+    async with stdtest(args={"init": 0}, tocks=10 * n) as st:
+        async with st.client() as c:
+            t1 = time.perf_counter()
+            for i in range(n):
+                await c.set(P("bench.one") | i, value=i)
+            t2 = time.perf_counter()
+            print(f"{n} entries, one by one: {n / (t2 - t1):.0f} writes/s")
+
+            t1 = time.perf_counter()
+            async with c.pipeline() as pl:
+                for i in range(n):
+                    await pl.set(P("bench.pipe") | i, value=i)
+            t2 = time.perf_counter()
+            print(f"{n} entries, pipelined: {n / (t2 - t1):.0f} writes/s")
+
+
+if __name__ == "__main__":
+    # The mock clock skips the servers' delays.
+    trio.run(main, *(int(x) for x in sys.argv[1:]), clock=MockClock(autojump_threshold=0))
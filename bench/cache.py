@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Measure reading through the client-side cache.
+
+This starts a server (on the mock MQTT backend), stores ``keys`` entries,
+and reads them ``n`` times in total, once directly and once with the
+subtree cached by the client. Reported are the reads per second.
+
+Usage: python3 bench/cache.py [n [keys]]
+"""
+
+import sys
+import time
+
+import trio
+from trio.testing import MockClock
+
+from distkv.mock.mqtt import stdtest
+from distkv.util import P
+
+
+async def main(n=20000, keys=100):
+    async with stdtest(args={"init": 0}, tocks=10 * keys) as st:
+        async with st.client() as c:
+            for i in range(keys):
+                await c.set(P("bench.cfg") | i, value={"key": i, "data": "x" * 20})
+
+            t1 = time.perf_counter()
+            for i in range(n):
+                await c.get(P("bench.cfg") | i % keys)
+            t2 = time.perf_counter()
+            print(f"{n} entries, no cache: {n / (t2 - t1):.0f} reads/s")
+
+            async with c.cache(P("bench.cfg")) as cache:
+                t1 = time.perf_counter()
+                for i in range(n):
+                    await c.get(P("bench.cfg") | i % keys)
+                t2 = time.perf_counter()
+            print(
+                f"{n} entries, cached: {n / (t2 - t1):.0f} reads/s, "
+                f"{cache.stats.hits} hits, {cache.stats.misses} misses"
+            )
+
+
+if __name__ == "__main__":
+    # The mock clock skips the servers' delays.
+    trio.run(main, *(int(x) for x in sys.argv[1:]), clock=MockClock(autojump_threshold=0))
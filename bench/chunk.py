@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Measure how large values are broadcast.
+
+This starts two servers (on the mock MQTT backend) and writes ``n``
+values of ``size`` bytes to the first. Reported are the number of
+messages the server sent to the broker and the time until the other
+server has all values, with Serf's message size (which was used for
+all backends before) and with the MQTT default, for both chunk formats.
+
+Usage: python3 bench/chunk.py [size [n]]
+"""
+
+import sys
+import time
+
+import trio
+
+from distkv.mock.mqtt import stdtest
+from distkv.util import P
+
+SETTINGS = (
+    ("450 bytes, _p0", dict(max_len=450)),
+    ("450 bytes, ext", dict(max_len=450, ext=True)),
+    ("default,   _p0", dict()),
+    ("default,   ext", dict(ext=True)),
+)
+
+
+async def run(name, chunk, size, n):
+    cfg = {"server": {"chunk": chunk}}
+    kw = {"test_0": {"init": 0, "cfg": cfg}, "test_1": {"cfg": cfg}}
+    async with stdtest(n=2, tocks=10 * n, **kw) as st:
+        s = st.s[0]
+        sent = [0]
+        send = s.serf.send
+
+        async def counting_send(*a, **kw):
+            sent[0] += 1
+            await send(*a, **kw)
+
+        s.serf.send = counting_send
+
+        t1 = time.perf_counter()
+        async with st.client(0) as c:
+            for i in range(n):
+                await c.set(P("bench") | i, value="x" * size)
+        e = st.s[1].root.follow(P("bench"))
+        while len(e) < n:
+            await trio.sleep(0.01)
+        t2 = time.perf_counter()
+        print(f"{n} entries, {size} bytes, {name}: {sent[0]} messages, {t2-t1:.2f} s")
+
+
+async def main(size=100000, n=20):
+    for name, chunk in SETTINGS:
+        await run(name, chunk, size, n)
+
+
+if __name__ == "__main__":
+    trio.run(main, *(int(x) for x in sys.argv[1:]))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Measure what compression saves, and what it costs.
+
+This packs ``n`` JSON-like values, as single messages (large values on
+the client connection or in broadcasts) and in blocks of 64k (save
+files and buffered replies), with each available compression method.
+Reported are the bytes to transmit or store, relative to uncompressed
+data, and the CPU time per MB of uncompressed data for compressing and
+for decompressing.
+
+Usage: python3 bench/compress.py [n]
+"""
+
+import random
+import sys
+import time
+
+from distkv.codec import Compressor, compress_methods, expand, packer, stream_unpacker, unpacker
+from distkv.util import P
+
+
+def value(i):
+    rnd = random.Random(i)
+    return {
+        "id": i,
+        "name": f"sensor-{i % 97}",
+        "room": rnd.choice(("kitchen", "living", "bath", "bedroom", "garage")),
+        "state": {"on": rnd.random() > 0.5, "level": rnd.randrange(100), "unit": "%"},
+        "history": [{"t": 1600000000 + 60 * j, "v": rnd.randrange(1000)} for j in range(20)],
+    }
+
+
+def run(name, zip_, msgs, block):
+    if block:
+        data, b = [], []
+        for m in msgs:
+            b.append(m)
+            if sum(map(len, b)) >= 65536:
+                data.append(b"".join(b))
+                b = []
+        data.append(b"".join(b))
+    else:
+        data = msgs
+    size = sum(len(d) for d in data)
+
+    t1 = time.process_time()
+    packed = [zip_.block(d) if block else zip_.pack(d) for d in data] if zip_ else data
+    t2 = time.process_time()
+    if block:
+        s = stream_unpacker(max_buffer_size=1 << 28)
+        for p in packed:
+            s.feed(p)
+        n = sum(1 for _ in expand(s))
+    else:
+        n = sum(1 for p in packed if unpacker(p))
+    t3 = time.process_time()
+    assert n == len(msgs)
+
+    mb = size / 1e6
+    out = sum(len(p) for p in packed)
+    print(
+        f"{'block' if block else 'message':>7} {name:>7}: {out:9d} bytes ({out/size:5.1%}), "
+        f"compress {(t2-t1)/mb*1000:6.2f} ms/MB, unpack {(t3-t2)/mb*1000:6.2f} ms/MB"
+    )
+
+
+def main(n=5000):
+    msgs = [packer(dict(path=P("data") | i, value=value(i), tock=i)) for i in range(n)]
+    print(f"{n} entries, {sum(len(m) for m in msgs)} bytes")
+    methods = [("none", None)] + [(m, Compressor(m, min_size=0)) for m in compress_methods()]
+    for block in (False, True):
+        for name, zip_ in methods:
+            run(name, zip_, msgs, block)
+
+
+if __name__ == "__main__":
+    main(*(int(x) for x in sys.argv[1:]))
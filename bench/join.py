@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Measure how long a new server takes to join a network.
+
+This starts ``peers`` servers (on the mock MQTT backend). The first
+loads ``n`` entries; the others fetch them. Then another server is
+started. Reported are the time until it is ready, most of which is
+spent waiting for the mock network, and the time it took to fetch the
+data.
+
+The entries are stored in 20 subtrees at depth 2, which the new server
+may fetch in parallel if ``depth`` is 2.
+
+Usage: python3 bench/join.py [entries [peers [depth]]]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from functools import partial
+
+import anyio
+import trio
+from trio.testing import MockClock
+
+from distkv.mock.mqtt import stdtest
+from distkv.util import MsgWriter, P
+
+
+async def write_data(path, n):
+    async with MsgWriter(path=path) as w:
+        for i in range(n):
+            chain = dict(node="bench", tick=i + 1, prev=None)
+            await w(dict(path=P("bench") | i % 20 | i, value=i, tock=i + 1, chain=chain))
+
+
+async def main(n=20000, peers=2, depth=2):
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "data")
+        await write_data(path, n)
+
+        cfg = {"server": {"sync": {"depth": depth}}}
+        kw = {f"run_{peers}": False, "test_0": {"init": 0}, f"test_{peers}": {"cfg": cfg}}
+        async with stdtest(n=peers + 1, run=False, tocks=10 * n, **kw) as st:
+            await st.s[0].load(path, local=True)
+            evts = []
+            for s in st.s[:peers]:
+                evt = anyio.create_event()
+                await st.tg.spawn(partial(s.serve, ready_evt=evt))
+                evts.append(evt)
+            for evt in evts:
+                await evt.wait()
+            for s in st.s[:peers]:
+                await s._ready.wait()
+
+            s = st.s[peers]
+            fetch = []
+            fetch_data = s.fetch_data
+
+            async def timed_fetch(*a, **kw):
+                t = time.perf_counter()
+                await fetch_data(*a, **kw)
+                fetch.append(time.perf_counter() - t)
+
+            s.fetch_data = timed_fetch
+            t1 = time.perf_counter()
+            evt = anyio.create_event()
+            await st.tg.spawn(partial(s.serve, ready_evt=evt))
+            await evt.wait()
+            await s._ready.wait()
+            t2 = time.perf_counter()
+            nr = 0
+
+            async def count(_):
+                nonlocal nr
+                nr += 1
+
+            await s.root.walk(count)
+            print(
+                f"{n} entries, {peers} peers, depth {depth}: joined in {t2-t1:.2f} s, "
+                f"fetching took {sum(fetch):.2f} s, {nr} entries"
+            )
+
+
+if __name__ == "__main__":
+    # The mock clock skips the servers' startup delays.
+    trio.run(main, *(int(x) for x in sys.argv[1:]), clock=MockClock(autojump_threshold=0))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Measure how long it takes to load a server's state.
+
+This writes a save file with a tree of ``fanout ** depth`` entries and
+loads it into a (not running) server with ``Server.load``. That server
+then saves its state as a snapshot, which is loaded into another
+server.
+
+Reported are the file sizes and the time each load took.
+
+Usage: python3 bench/load.py [fanout [depth]]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import trio
+from trio.testing import MockClock
+
+from distkv.mock.mqtt import stdtest
+from distkv.util import MsgWriter, P
+
+
+async def write_data(path, fanout, depth):
+    n_entries = fanout ** depth
+    base = P("bench.data")
+    async with MsgWriter(path=path) as w:
+        for i in range(n_entries):
+            p, n = base, i
+            for _ in range(depth):
+                p |= n % fanout
+                n //= fanout
+            tick = i + 1
+            chain = dict(node="bench", tick=tick, prev=None)
+            await w(dict(path=p, value=i, tock=tick, chain=chain))
+    return n_entries
+
+
+async def load(name, path, n_entries, save=None):
+    async with stdtest(run=False, tocks=10 * n_entries) as st:
+        (s,) = st.s
+        t1 = time.perf_counter()
+        await s.load(path, local=True)
+        t2 = time.perf_counter()
+        print(
+            f"{name:>9}: {os.path.getsize(path)/n_entries:.1f} bytes/entry, "
+            f"load {(t2-t1)*1e6/n_entries:.2f} µs/entry"
+        )
+        if save is not None:
+            await s.save(save, snapshot=True)
+
+
+async def main(fanout=10, depth=4):
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "data")
+        snap = os.path.join(d, "snap")
+        n_entries = await write_data(path, fanout, depth)
+
+        await load("msgpack", path, n_entries, save=snap)
+        await load("snapshot", snap, n_entries)
+
+
+if __name__ == "__main__":
+    # The mock clock skips the server's startup delays.
+    trio.run(main, *(int(x) for x in sys.argv[1:]), clock=MockClock(autojump_threshold=0))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Measure looking up the type match and the converter of entries.
+
+This sets up a server without a network, with a number of wildcard
+``match`` and ``conv`` entries, and runs the type check and the
+encoder over ``n`` entries at depth 4, twice. The first pass searches
+the meta tree, the second one uses the remembered results.
+
+Usage: python3 bench/match.py [n [rules]]
+"""
+
+import sys
+import time
+
+import anyio
+
+from distkv.server import Server
+from distkv.util import P, Path, attrdict
+
+
+async def put(s, path, value):
+    entry = s.root.follow(Path(None, *path), nulls_ok=True)
+    async with s.next_event() as event:
+        await entry.set_data(event, value, server=s, tock=s.tock)
+
+
+async def main(n=20000, rules=20):
+    s = Server("bench", cfg={})
+    s.node.tick = 0
+    await put(s, P("type.any"), attrdict())
+    await put(s, P("codec.any"), attrdict(encode=None, decode=None))
+    for i in range(rules):
+        await put(s, P("match.bench.+") | i | "#", attrdict(type=P("any")))
+        await put(s, P("conv.bench.bench.#") | i, attrdict(codec=P("any")))
+        await put(s, P("match.bench") | i | "+" | "x", attrdict(type=P("any")))
+    match = s.root[None]["match"]
+    conv = s.root[None]["conv"]["bench"]
+    entries = [s.root.follow(P("bench") | i % 10 | i % rules | i) for i in range(n)]
+
+    for run in ("first", "second"):
+        t1 = time.perf_counter()
+        for e in entries:
+            match.check_value(1, e)
+            conv.enc_value(1, entry=e)
+        t2 = time.perf_counter()
+        print(f"{n} entries, {rules} rules, {run} pass: {(t2-t1) / n * 1e6:.1f} µs per entry")
+
+
+if __name__ == "__main__":
+    anyio.run(main, *(int(x) for x in sys.argv[1:]), backend="trio")
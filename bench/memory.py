@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Measure the memory used by a server's data.
+
+This writes a save file with a tree of ``fanout ** depth`` entries,
+then loads it into a (not running) server with ``Server.load``.
+
+Reported is the memory held by the loaded data (as seen by
+``tracemalloc``), per entry, and the time the load took.
+
+Usage: python3 bench/memory.py [fanout [depth]]
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import trio
+from trio.testing import MockClock
+
+from distkv.mock.mqtt import stdtest
+from distkv.util import MsgWriter, P
+
+
+async def write_data(path, fanout, depth):
+    n_entries = fanout ** depth
+    base = P("bench.data")
+    async with MsgWriter(path=path) as w:
+        for i in range(n_entries):
+            p, n = base, i
+            for _ in range(depth):
+                p |= n % fanout
+                n //= fanout
+            tick = i + 1
+            chain = dict(node="bench", tick=tick, prev=None)
+            await w(dict(path=p, value=i, tock=tick, chain=chain))
+    return n_entries
+
+
+async def main(fanout=10, depth=4):
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "data")
+        n_entries = await write_data(path, fanout, depth)
+
+        async with stdtest(run=False, tocks=10 * n_entries) as st:
+            (s,) = st.s
+
+            gc.collect()
+            tracemalloc.start()
+            t1 = time.perf_counter()
+            await s.load(path, local=True)
+            t2 = time.perf_counter()
+            gc.collect()
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print(
+                f"{n_entries} entries: {size/n_entries:.1f} bytes/entry, "
+                f"load {(t2-t1)*1e6/n_entries:.2f} µs/entry"
+            )
+
+
+if __name__ == "__main__":
+    # The mock clock skips the server's startup delays.
+    trio.run(main, *(int(x) for x in sys.argv[1:]), clock=MockClock(autojump_threshold=0))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Measure what a server spends on storing and forwarding large values.
+
+This sets up a server without a network and attaches ``watchers``
+clients to it. Another client writes ``n`` entries. Its messages are
+decoded like the server does it, so the time reported includes decoding
+the requests, storing the values, and packing them for the watchers;
+the values are sent plain and as opaque values (``server.opaque``, and
+``connect.opaque``, which the watchers also set).
+
+Usage: python3 bench/opaque.py [n [watchers [size]]]
+"""
+
+import sys
+import time
+
+import anyio
+
+from distkv.codec import OpaqueValue, packer, opaque_unpacker
+from distkv.server import Server, ServerClient, SCmd_watch
+from distkv.util import P, attrdict
+
+
+class NullStream:
+    """Counts the bytes it is asked to send."""
+
+    def __init__(self):
+        self.len = 0
+
+    async def send_all(self, data):
+        self.len += len(data)
+
+
+async def run(opaque, n, watchers, size):
+    s = Server("bench", cfg={"server": {"opaque": opaque}})
+    s.node.tick = 0
+    value = {"items": [{"id": i, "name": f"item {i}", "on": bool(i % 2)} for i in range(size)]}
+    clients = []
+
+    async with anyio.create_task_group() as tg:
+        for i in range(watchers):
+            c = ServerClient(s, NullStream())
+            c.user = attrdict(is_super_root=False)
+            c.opaque = opaque
+            cmd = SCmd_watch(c, attrdict(seq=1, path=P("bench"), nchain=0))
+            await tg.spawn(cmd.run)
+            clients.append(c)
+        await anyio.sleep(0.1)
+
+        w = ServerClient(s, NullStream())
+        w.user = attrdict(is_super_root=False)
+        msgs = []
+        for i in range(n):
+            v = OpaqueValue.pack(value) if opaque else value
+            msgs.append(packer(dict(action="set_value", path=P("bench") | i, value=v)))
+
+        t1 = time.perf_counter()
+        for m in msgs:
+            await w.cmd_set_value(opaque_unpacker(m))
+            await anyio.sleep(0)
+        for c in clients:
+            await c._flush()
+        t2 = time.perf_counter()
+        await tg.cancel_scope.cancel()
+
+    print(
+        f"{n} entries, {watchers} watchers, {size} items, opaque {'on ' if opaque else 'off'}: "
+        f"{(t2-t1) / n * 1e6:.0f} µs per update"
+    )
+
+
+async def main(n=2000, watchers=5, size=100):
+    for opaque in (False, True):
+        await run(opaque, n, watchers, size)
+
+
+if __name__ == "__main__":
+    anyio.run(main, *(int(x) for x in sys.argv[1:]), backend="trio")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Measure the cost of building and shortening paths when dumping a tree.
+
+This starts a single server (with the mock MQTT backend), stores a
+tree of ``fanout ** depth`` entries, and runs ``Server._save`` and the
+server side of ``get_tree`` over it, discarding the output. Each is run
+twice: the first run computes the entries' paths, the second re-uses
+them.
+
+Reported are the time taken, the peak of memory allocated while running
+(as seen by ``tracemalloc``), and the memory still held afterwards.
+
+Usage: python3 bench/paths.py [fanout [depth]]
+"""
+
+import sys
+import time
+import tracemalloc
+
+import trio
+from trio.testing import MockClock
+
+from distkv.mock.mqtt import stdtest
+from distkv.server import SCmd_get_tree
+from distkv.util import attrdict, P, PathShortener
+
+
+class NullGetTree(SCmd_get_tree):
+    async def send(self, **msg):  # pylint: disable=arguments-differ
+        pass
+
+
+async def measure(name, proc, n):
+    tracemalloc.start()
+    t1 = time.perf_counter()
+    await proc()
+    t2 = time.perf_counter()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:>14}: {(t2-t1)*1e6/n:.2f} µs/entry, "
+        f"peak {peak/n:.1f} bytes/entry, held {size/n:.1f} bytes/entry"
+    )
+
+
+async def main(fanout=10, depth=4):
+    n_entries = fanout ** depth
+    async with stdtest(args=attrdict(init=0), tocks=10 * n_entries) as st:
+        s = st.s[0]
+        async with st.client() as c:
+            base = P("bench.data")
+            items = []
+            for i in range(n_entries):
+                p = base
+                for _ in range(depth):
+                    p |= i % fanout
+                    i //= fanout
+                items.append((p, i))
+                if len(items) == 1000:
+                    await c.set_many(items)
+                    items = []
+            if items:
+                await c.set_many(items)
+
+            # Drop the paths that the server computed when storing the data
+            await s.root.walk(_clear_path)
+
+            async def writer(msg):
+                pass
+
+            async def save():
+                await s._save(writer, PathShortener([]))
+
+            (sc,) = s._clients
+
+            async def get_tree():
+                await NullGetTree(sc, attrdict(seq=0, path=P("bench"), action="get_tree")).run()
+
+            for name, proc in (("save", save), ("get_tree", get_tree)):
+                await s.root.walk(_clear_path)
+                await measure(name + " (cold)", proc, n_entries)
+                await measure(name + " (warm)", proc, n_entries)
+
+
+async def _clear_path(entry):
+    try:
+        del entry._path
+    except AttributeError:
+        pass
+
+
+if __name__ == "__main__":
+    # The mock clock skips the servers' startup delays. Throughput is
+    # measured with the real clock.
+    trio.run(main, *(int(x) for x in sys.argv[1:]), clock=MockClock(autojump_threshold=0))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Measure per-connection request throughput.
+
+This starts a single server (with the mock MQTT backend) and runs a
+number of concurrent ``set`` requests through one client connection,
+using the default settings of whichever distkv is on ``PYTHONPATH``.
+To compare two revisions, run this script against a checkout of each.
+
+Usage: python3 bench/pipeline.py [requests [concurrency [runs]]]
+"""
+
+import sys
+import time
+
+import anyio
+import trio
+from trio.testing import MockClock
+
+from distkv.mock.mqtt import stdtest
+from distkv.util import attrdict, P
+
+
+async def one_run(n_req, n_conc):
+    async with stdtest(args=attrdict(init=0), tocks=10 * n_req) as st:
+        async with st.client() as c:
+            await c.set(P("bench.warmup"), value=0)
+
+            async def worker(k):
+                for i in range(k, n_req, n_conc):
+                    await c.set(P("bench.data") | i, value=i)
+
+            t1 = time.perf_counter()
+            async with anyio.create_task_group() as tg:
+                for k in range(n_conc):
+                    await tg.spawn(worker, k)
+            t2 = time.perf_counter()
+
+    print(f"{n_req} requests in {t2-t1:.3f}s, {n_req/(t2-t1):.0f}/s")
+    return n_req / (t2 - t1)
+
+
+async def main(n_req=3000, n_conc=50, n_runs=5):
+    rates = sorted([await one_run(n_req, n_conc) for _ in range(n_runs)])
+    print(f"median: {rates[len(rates) // 2]:.0f}/s")
+
+
+if __name__ == "__main__":
+    # The mock clock skips the servers' startup delays. Throughput is
+    # measured with the real clock.
+    trio.run(main, *(int(x) for x in sys.argv[1:]), clock=MockClock(autojump_threshold=0))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Measure a pooled client.
+
+This starts two servers (on the mock MQTT backend) and a client with
+``pool`` connections to them. ``tasks`` tasks each send ``n`` requests.
+Reported are the requests per second and, the longest time any request
+took, and how many failed. In the last runs the first server drops its
+client connections while the requests are running.
+
+Everything runs in one process, so more connections don't add CPU; they
+do avoid stalls.
+
+Usage: python3 bench/pool.py [n [tasks]]
+"""
+
+import sys
+import time
+
+import trio
+from trio.testing import MockClock
+
+from distkv.exceptions import ServerClosedError
+from distkv.mock.mqtt import stdtest
+from distkv.util import P
+
+
+def _addr(s):
+    for host, port, *_ in s.ports:
+        if host[0] != ":":
+            return host, port
+
+
+async def run(st, pool, n, tasks, drop):
+    slowest = 0
+    failed = 0
+
+    async def work(c, i):
+        nonlocal slowest, failed
+        for j in range(n):
+            t = time.perf_counter()
+            try:
+                await c.set(P("bench") | i | j, value=j)
+            except ServerClosedError:
+                failed += 1
+            slowest = max(slowest, time.perf_counter() - t)
+
+    kw = dict(pool=pool, hosts=[_addr(st.s[1])]) if pool else {}
+    async with st.client(0, **kw) as c:
+        t1 = time.perf_counter()
+        async with trio.open_nursery() as tg:
+            for i in range(tasks):
+                tg.start_soon(work, c, i)
+            if drop:
+                await trio.sleep(0.01)
+                for sc in list(st.s[0]._clients):
+                    await sc.stream.aclose()
+        t2 = time.perf_counter()
+    what = f"pool {pool}" if pool else "no pool"
+    if drop:
+        print(f"{n*tasks} entries, {what}, dropped: ", end="")
+    else:
+        print(f"{n*tasks} entries, {what}: ", end="")
+    print(
+        f"{n * tasks / (t2 - t1):.0f} requests/s, slowest {slowest*1000:.1f} ms, {failed} failed"
+    )
+
+
+async def main(n=200, tasks=20):
+    for pool, drop in ((0, False), (2, False), (4, False), (2, True), (4, True)):
+        async with stdtest(n=2, args={"init": 0}, tocks=100 * n * tasks) as st:
+            await st.s[1].is_serving
+            await run(st, pool, n, tasks, drop)
+
+
+if __name__ == "__main__":
+    # The mock clock skips the servers' delays.
+    trio.run(main, *(int(x) for x in sys.argv[1:]), clock=MockClock(autojump_threshold=0))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Measure the throughput of MsgReader.
+
+This writes a file with ``n`` records that look like those in a save
+file, then reads it back with various reader settings. Reported are
+MB/s and records/s.
+
+Usage: python3 bench/reader.py [records]
+"""
+
+import inspect
+import os
+import sys
+import tempfile
+import time
+
+import trio
+
+from distkv.util import MsgReader, MsgWriter, P
+
+SETTINGS = (
+    ("4k reads", dict(buflen=4096)),
+    ("default", dict()),
+    ("mmap", dict(mmap=True)),
+)
+
+
+async def write_data(path, n):
+    async with MsgWriter(path=path) as w:
+        for i in range(n):
+            chain = dict(node="bench", tick=i + 1, prev=None)
+            await w(dict(path=P("bench.data") | i, value="x" * (i % 100), tock=i, chain=chain))
+
+
+async def read(name, path, n, size, **kw):
+    t1 = time.perf_counter()
+    nr = 0
+    async with MsgReader(path=path, **kw) as r:
+        async for _ in r:
+            nr += 1
+    t2 = time.perf_counter()
+    assert nr == n, (nr, n)
+    dt = t2 - t1
+    print(f"{name:>10}: {size/dt/1e6:7.1f} MB/s, {n/dt:9.0f} records/s")
+
+
+async def main(n=200000):
+    params = inspect.signature(MsgReader).parameters
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "data")
+        await write_data(path, n)
+        size = os.path.getsize(path)
+        print(f"{n} records, {size/1e6:.1f} MB")
+        for name, kw in SETTINGS:
+            if any(k not in params for k in kw):
+                print(f"{name:>10}: not supported")
+                continue
+            await read(name, path, n, size, **kw)
+
+
+if __name__ == "__main__":
+    trio.run(main, *(int(x) for x in sys.argv[1:]))
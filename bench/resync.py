@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Measure how long it takes to heal a network split.
+
+This starts ``n`` servers (on the mock Serf backend), splits the network
+in half, writes ``entries`` entries on one side, and joins the network
+again. Reported is the time until all servers have all entries, with
+``server.resync`` disabled and enabled. The time is that of the mock
+clock, i.e. what a real network would see if transmitting the data
+were free.
+
+Usage: python3 bench/resync.py [entries [n]]
+"""
+
+import sys
+import time
+
+import trio
+from trio.testing import MockClock
+
+from distkv.mock.serf import stdtest
+from distkv.util import P
+
+
+async def heal(enabled, entries, n):
+    cfg = {"server": {"resync": {"enabled": enabled}}}
+    kw = {f"test_{i}": {"cfg": cfg} for i in range(n)}
+    kw["test_0"]["init"] = 0
+    async with stdtest(n=n, tocks=100 * entries, **kw) as st:
+        await trio.sleep(30)
+        st.split(n // 2)
+        async with st.client(n - 1) as c:
+            for i in range(entries):
+                await c.set(P("bench") | i % 10 | i, value=i)
+        await trio.sleep(30)
+
+        t1, w1 = trio.current_time(), time.perf_counter()
+        st.join(n // 2)
+        while True:
+            await trio.sleep(1)
+            done = 0
+            for s in st.s:
+                try:
+                    e = s.root.follow(P("bench"), create=False)
+                except KeyError:
+                    continue
+                if sum(len(sub) for sub in e.values()) == entries:
+                    done += 1
+            if done == n:
+                break
+        t2, w2 = trio.current_time(), time.perf_counter()
+        print(
+            f"{entries} entries, {n} servers, resync {'on ' if enabled else 'off'}: "
+            f"healed after {t2-t1:.0f} s (mock), {w2-w1:.2f} s (wall)"
+        )
+
+
+async def main(entries=500, n=6):
+    for enabled in (False, True):
+        await heal(enabled, entries, n)
+
+
+if __name__ == "__main__":
+    # The mock clock skips the servers' delays.
+    trio.run(main, *(int(x) for x in sys.argv[1:]), clock=MockClock(autojump_threshold=0))
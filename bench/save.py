@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Measure how saving a server's state interacts with updates.
+
+This fills a server with ``n`` entries, then saves its state while a
+client keeps updating random entries. Reported are the update rate with
+and without a concurrent save, the time the save took, and how many
+entries had to be preserved for the save to remain consistent.
+
+Usage: python3 bench/save.py [entries]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+import trio
+
+from distkv.mock.mqtt import stdtest
+from distkv.util import P
+
+
+async def updater(c, n, counter):
+    while True:
+        await c.set(P("bench.data") | random.randrange(n), value=random.random())
+        counter[0] += 1
+
+
+async def rate(c, n, dt):
+    counter = [0]
+    async with trio.open_nursery() as tg:
+        tg.start_soon(updater, c, n, counter)
+        await trio.sleep(dt)
+        tg.cancel_scope.cancel()
+    return counter[0] / dt
+
+
+async def main(n=100000):
+    async with stdtest(args={"init": 0}, tocks=10 * n) as st:
+        (s,) = st.s
+        for i in range(n):
+            await s.root.follow(P("bench.data") | i).set(i)
+        async with st.client() as c:
+            print(f"{n} entries, idle: {await rate(c, n, 1):.0f} updates/s")
+
+            for snapshot in (False, True):
+                with tempfile.TemporaryDirectory() as d:
+                    path = os.path.join(d, "data")
+                    counter = [0]
+                    async with trio.open_nursery() as tg:
+                        tg.start_soon(updater, c, n, counter)
+                        t1 = time.perf_counter()
+                        await s.save(path, snapshot=snapshot)
+                        t2 = time.perf_counter()
+                        tg.cancel_scope.cancel()
+                    print(
+                        f"during save (snapshot={snapshot}): {counter[0]/(t2-t1):.0f} updates/s, "
+                        f"save took {t2-t1:.2f} s for {counter[0]} updates"
+                    )
+
+
+if __name__ == "__main__":
+    trio.run(main, *(int(x) for x in sys.argv[1:]))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Measure the cost of a large streamed reply.
+
+This starts a single server (with the mock MQTT backend), stores a
+number of entries, and retrieves them with ``get_tree``, once with an
+unbuffered connection and once with the default send buffer.
+The number of socket writes is counted.
+
+Usage: python3 bench/stream.py [entries]
+"""
+
+import sys
+import time
+
+import trio
+from trio.testing import MockClock
+
+from distkv.mock.mqtt import stdtest
+from distkv.server import ServerClient
+from distkv.util import attrdict, P
+
+SETTINGS = (
+    ("unbuffered", attrdict(send_buflen=0)),
+    ("buffered", attrdict(send_buflen=65536)),
+)
+
+
+async def one_run(name, conn, n_entries):
+    args = attrdict(init=0, cfg=attrdict(server=attrdict(conn=conn)))
+    writes = 0
+    _flush = ServerClient._flush
+
+    async def flush(self, msg=None):
+        nonlocal writes
+        if msg is not None or self._send_buf:
+            writes += 1
+        await _flush(self, msg)
+
+    ServerClient._flush = flush
+    try:
+        async with stdtest(args=args, tocks=10 * n_entries) as st:
+            async with st.client() as c:
+                for i in range(0, n_entries, 1000):
+                    await c.set_many(
+                        [(P("bench.data") | j, j) for j in range(i, min(i + 1000, n_entries))]
+                    )
+
+                writes = 0
+                t1 = time.perf_counter()
+                n = 0
+                async for _ in c.get_tree(P("bench.data"), nchain=1):
+                    n += 1
+                t2 = time.perf_counter()
+    finally:
+        ServerClient._flush = _flush
+
+    print(f"{name:>10}: {n} entries in {t2-t1:.3f}s, {writes} writes")
+
+
+async def main(n_entries=20000):
+    for name, conn in SETTINGS:
+        await one_run(name, conn, n_entries)
+
+
+if __name__ == "__main__":
+    # The mock clock skips the servers' startup delays. Throughput is
+    # measured with the real clock.
+    trio.run(main, *(int(x) for x in sys.argv[1:]), clock=MockClock(autojump_threshold=0))
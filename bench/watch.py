@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Measure how fast a server sends updates to many watchers.
+
+This sets up a server without a network, attaches ``watchers`` clients
+to it which watch the same subtree, and writes ``entries`` entries to
+that. The clients' streams discard their data, so the time reported is
+what the server spends forwarding the updates.
+
+Usage: python3 bench/watch.py [entries [watchers]]
+"""
+
+import sys
+import time
+
+import anyio
+
+from distkv.server import Server, ServerClient, SCmd_watch
+from distkv.util import P, attrdict
+
+
+class NullStream:
+    """Counts the bytes it is asked to send."""
+
+    def __init__(self):
+        self.len = 0
+
+    async def send_all(self, data):
+        self.len += len(data)
+
+
+async def main(n=5000, watchers=50):
+    s = Server("bench", cfg={})
+    s.node.tick = 0
+    value = {"data": list(range(20)), "name": "some entry"}
+    clients = []
+
+    async with anyio.create_task_group() as tg:
+        for i in range(watchers):
+            c = ServerClient(s, NullStream())
+            c.user = attrdict(is_super_root=False)
+            cmd = SCmd_watch(c, attrdict(seq=1, path=P("bench"), nchain=i % 2))
+            await tg.spawn(cmd.run)
+            clients.append(c)
+        await anyio.sleep(0.1)
+
+        t1 = time.perf_counter()
+        for i in range(n):
+            async with s.next_event() as event:
+                entry = s.root.follow(P("bench") | i % 10 | i)
+                await entry.set_data(event, value, server=s, tock=s.tock)
+            await anyio.sleep(0)
+        for c in clients:
+            await c._flush()
+        t2 = time.perf_counter()
+        await tg.cancel_scope.cancel()
+
+    sent = sum(c.stream.len for c in clients)
+    print(
+        f"{n} entries, {watchers} watchers: {t2-t1:.2f} s, "
+        f"{(t2-t1) / n / watchers * 1e6:.1f} µs per update and watcher, {sent} bytes"
+    )
+
+
+if __name__ == "__main__":
+    anyio.run(main, *(int(x) for x in sys.argv[1:]), backend="trio")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Measure how writing a log affects the event loop.
+
+This writes ``n`` records that look like those in a save file, with
+various writer settings, while another task ticks every millisecond.
+Reported are the write throughput, the longest time the ticker was
+delayed, and (for the background writer) the longest time a record
+waited to be committed, i.e. the bound on data lost in a crash.
+
+Usage: python3 bench/writer.py [records]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import trio
+
+from distkv.util import BackgroundMsgWriter, MsgWriter, P
+
+SETTINGS = (
+    ("MsgWriter", MsgWriter, dict()),
+    ("background", BackgroundMsgWriter, dict()),
+    ("bg+fdatasync", BackgroundMsgWriter, dict(sync="fdatasync")),
+    ("bg+fsync/10", BackgroundMsgWriter, dict(sync="fsync", count=10, delay=0.01)),
+)
+
+
+async def ticker(res, task_status=trio.TASK_STATUS_IGNORED):
+    task_status.started()
+    while True:
+        t = time.perf_counter()
+        await trio.sleep(0.001)
+        res[0] = max(res[0], time.perf_counter() - t - 0.001)
+
+
+async def write(name, cls, path, n, **kw):
+    stall = [0]
+    async with trio.open_nursery() as tg:
+        await tg.start(ticker, stall)
+        t1 = time.perf_counter()
+        async with cls(path=path, **kw) as w:
+            for i in range(n):
+                chain = dict(node="bench", tick=i + 1, prev=None)
+                await w(dict(path=P("bench.data") | i, value="x" * (i % 100), tock=i, chain=chain))
+                await trio.sleep(0)  # the server's saver waits for each update
+        t2 = time.perf_counter()
+        tg.cancel_scope.cancel()
+    dt = t2 - t1
+    stats = getattr(w, "stats", None)
+    lag = f"{stats.max_delay*1000:7.1f} ms" if stats else "      -"
+    print(
+        f"{name:>12}: {n/dt:8.0f} records/s, loop stall {stall[0]*1000:6.1f} ms, "
+        f"max commit delay {lag}"
+    )
+    assert os.path.getsize(path) > 0
+
+
+async def main(n=100000):
+    with tempfile.TemporaryDirectory(dir=".") as d:
+        path = os.path.join(d, "data")
+        for name, cls, kw in SETTINGS:
+            await write(name, cls, path, n, **kw)
+
+
+if __name__ == "__main__":
+    trio.run(main, *(int(x) for x in sys.argv[1:]))
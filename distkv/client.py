@@ -9,6 +9,8 @@ import outcome
 import socket
 import os
 from typing import Tuple
+from collections import OrderedDict, deque
+from collections.abc import Mapping
 from asyncscope import scope, Scope, main_scope
 
 try:
@@ -52,13 +54,23 @@ from .exceptions import (
     error_types,
     CancelledError,
 )
-from .codec import packer, stream_unpacker
+from .codec import packer, stream_unpacker, expand, Compressor, compress_methods
+from .codec import OpaqueValue, opaque_decode
 
 import logging
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["NoData", "ManyData", "open_client", "client_scope", "StreamedRequest"]
+__all__ = [
+    "NoData",
+    "ManyData",
+    "open_client",
+    "client_scope",
+    "StreamedRequest",
+    "PooledClient",
+    "ReadCache",
+    "Pipeline",
+]
 
 
 class NoData(ValueError):
@@ -74,7 +86,9 @@ async def open_client(_main_name="_distkv_client", **cfg):
     """
     This async context manager returns an opened client connection.
 
-    There is no attempt to reconnect if the connection should fail.
+    There is no attempt to reconnect if the connection should fail,
+    unless you configure a pool of connections (``connect.pool`` or
+    ``connect.hosts``); see :class:`PooledClient`.
 
     The client connection is run within a separate `asyncscope.ScopeSet`.
     If you're already using asyncscope in your code, you should use
@@ -94,11 +108,16 @@ async def client_scope(**cfg):
     The configuration's 'connect' dict may include a name to disambiguate
     multiple connections. This name must not be equal to your main code's.
 
-    There is no attempt to reconnect if the connection should fail.
+    There is no attempt to reconnect if the connection should fail,
+    unless you configure a pool of connections.
     """
 
     async def _mgr(cfg):
-        client = Client(cfg)
+        conn = combine_dict(cfg.get("connect", {}), CFG["connect"])
+        if conn["pool"] > 1 or conn["hosts"]:
+            client = PooledClient(cfg)
+        else:
+            client = Client(cfg)
         async with client._connected() as client:
             await scope.register(client)
             await scope.no_more_dependents()
@@ -120,7 +139,9 @@ class StreamedRequest:
     report_start: True if the initial state=start message of a multi-reply
                   should be included in the iterator.
                   If False, the message is available as ``.start_msg``.
-    TODO: add rate limit.
+    credit: the flow control window, i.e. the number of replies the server
+            may send before we read them. The request must have been sent
+            with the same ``credit`` value.
 
     Call ``.send(**params)`` to send something; call ``.recv()``
     or async-iterate for receiving.
@@ -129,12 +150,17 @@ class StreamedRequest:
     start_msg = None
     end_msg = None
 
-    def __init__(self, client, seq, stream: bool = False, report_start: bool = False):
+    def __init__(
+        self, client, seq, stream: bool = False, report_start: bool = False, credit: int = None
+    ):
         self._stream = stream
         self._client = client
         self.seq = seq
         self._stream = stream
-        self.q = create_queue(100)
+        self._credit = credit
+        self._consumed = 0
+        # The queue must not fill up, otherwise the reader would block.
+        self.q = create_queue(max(100, (credit or 0) + 10))
         self._client._handlers[seq] = self
         self._reply_stream = None
         self.n_msg = 0
@@ -215,6 +241,11 @@ class StreamedRequest:
             res = res.unwrap()
         except CancelledError:
             raise StopAsyncIteration  # just terminate
+        if self._credit and res.get("state") != "start":
+            self._consumed += 1
+            if self._reply_stream is True and self._consumed >= (self._credit + 1) // 2:
+                n, self._consumed = self._consumed, 0
+                await self._client._send(seq=self.seq, credit=n)
         self._path_long(res)
         logger.debug("OneResult: %s", res)
         return res
@@ -257,6 +288,10 @@ class StreamedRequest:
                         return
             req = await self._client._request(action="stop", task=self.seq, _async=True)
             return await req.get()
+        elif self._credit and self._reply_stream is True:
+            # The server is waiting for credit which we won't send.
+            req = await self._client._request(action="stop", task=self.seq, _async=True)
+            return await req.get()
 
 
 class _SingleReply:
@@ -275,7 +310,9 @@ class _SingleReply:
     async def set(self, msg):
         """Called by the read loop to process a command's result"""
         if msg.get("state") == "start":
-            res = StreamedRequest(self._conn, self.seq, stream=None)
+            res = StreamedRequest(
+                self._conn, self.seq, stream=None, credit=self._params.get("credit", None)
+            )
             await res.set(msg)
             await self.q.set(res)
             return res
@@ -295,7 +332,144 @@ class _SingleReply:
         return await self.q.get()
 
     async def cancel(self):
-        pass
+        if not self.q.is_set():
+            await self.q.set_error(ServerClosedError("Disconnected"))
+
+
+class ReadCache:
+    """
+    A client-side cache of a subtree. Use :meth:`Client.cache` to get one.
+
+    The cache is filled, and kept current, by a ``watch`` of the
+    subtree. :meth:`Client.get` answers from it while that watch is
+    running. Entries with a ``tock`` that is older than the cached one
+    are stale and thus ignored.
+
+    At most ``size`` entries are kept; the least recently used ones
+    are evicted. Until that happens, entries that are not in the cache
+    are known not to exist.
+
+    The client's own writes are stored when the server confirms them,
+    so reading an entry right after writing it returns the new value.
+
+    ``stats`` counts hits, misses, updates from the watch, stale updates
+    and evicted entries.
+    """
+
+    def __init__(self, client, path: Path, size: int, nchain: int = 0):
+        self.client = client
+        self.path = path
+        self.size = size
+        self.nchain = nchain
+        self.current = False  # the watch is running and caught up
+        self.complete = False  # nothing was evicted
+        self._data = OrderedDict()  # path > reply; None: ask the server
+        self._started = ValueEvent()
+        self.stats = attrdict(hits=0, misses=0, updates=0, stale=0, evicted=0)
+
+    def __len__(self):
+        return len(self._data)
+
+    def _set(self, path, res):
+        """Store a result. Returns False if it is stale."""
+        old = self._data.get(path, None)
+        if old is not None and old.tock > res.get("tock", 0):
+            self.stats.stale += 1
+            return False
+        rec = attrdict()
+        if "value" in res:
+            rec.value = res["value"]
+        if "chain" in res and self.nchain:
+            rec.chain = res["chain"]
+        rec.tock = res.get("tock", 0)
+        self._store(path, rec)
+        return True
+
+    def _store(self, path, rec):
+        self._data[path] = rec
+        self._data.move_to_end(path)
+        while len(self._data) > self.size:
+            self._data.popitem(last=False)
+            self.stats.evicted += 1
+            self.complete = False
+
+    def get(self, path: Path, nchain: int = 0):
+        """
+        Return the cached result of ``get_value``, or ``None`` if the
+        server needs to be asked.
+        """
+        if not self.current or nchain not in (0, self.nchain):
+            self.stats.misses += 1
+            return None
+        try:
+            rec = self._data[path]
+        except KeyError:
+            if not self.complete:
+                self.stats.misses += 1
+                return None
+            rec = attrdict()
+            if nchain:
+                rec.chain = None
+        else:
+            if rec is None:
+                self.stats.misses += 1
+                return None
+            self._data.move_to_end(path)
+            rec = attrdict(rec)
+            if not nchain:
+                rec.pop("chain", None)
+        self.stats.hits += 1
+        return rec
+
+    def fill(self, path: Path, res, nchain: int = 0):
+        """Store the server's reply to a ``get_value`` that missed."""
+        if self.current and (nchain == self.nchain or not self.nchain):
+            self._set(path, res)
+
+    def wrote(self, path: Path, value, res):
+        """
+        Store the server's reply to writing ``value`` to ``path``.
+        ``value`` is `NotGiven` if the entry was deleted.
+        """
+        if not self.current:
+            return
+        if self.nchain and "chain" not in res:
+            # we don't know the chain, so the server needs to be asked
+            if path in self._data or self.complete:
+                self._store(path, None)
+            return
+        rec = attrdict(tock=res.get("tock", 0))
+        if value is not NotGiven:
+            rec.value = opaque_decode(value)
+        if "chain" in res:
+            rec.chain = res["chain"]
+        self._set(path, rec)
+
+    async def _run(self):
+        """Watch the subtree and update the cache."""
+        retry = self.client._cfg["connect"]["retry"]
+        while True:
+            self._data.clear()
+            self.complete = True
+            try:
+                async with self.client.watch(self.path, fetch=True, nchain=self.nchain) as w:
+                    async for msg in w:
+                        if "path" in msg:
+                            self.stats.updates += 1
+                            self._set(msg.path, msg)
+                        elif msg.get("state", "") == "uptodate":
+                            self.current = True
+                            if not self._started.is_set():
+                                await self._started.set(None)
+            except (ServerClosedError, ClosedResourceError) as exc:
+                logger.info("Cache for %s: %r", self.path, exc)
+                if not self._started.is_set():
+                    await self._started.set_error(exc)
+                    return
+            finally:
+                self.current = False
+                self._data.clear()
+            await anyio.sleep(retry)
 
 
 class ClientConfig:
@@ -355,6 +529,8 @@ class Client:
 
     _server_init = None  # Server greeting
     _dh_key = None
+    _compress = None
+    _opaque = False
     _config = None
     _socket = None
     tg: anyio.abc.TaskGroup = None
@@ -371,6 +547,7 @@ class Client:
 
         self._seq = 0
         self._handlers = {}
+        self._caches = []
         self._send_lock = anyio.create_lock()
         self._helpers = {}
         self._name = "".join(random.choices("abcdefghjkmnopqrstuvwxyz23456789", k=9))
@@ -446,25 +623,34 @@ class Client:
             self._dh_key = num2byte(k.shared_secret)[0:32]
         return self._dh_key
 
+    def _pack(self, params):
+        try:
+            p = packer(params)
+        except TypeError as e:
+            raise ValueError(f"Unable to pack: {params!r}") from e
+        if self._compress is not None:
+            p = self._compress.pack(p)
+        return p
+
     async def _send(self, **params):
+        await self._send_packed(self._pack(params))
+
+    async def _send_packed(self, data):
         async with self._send_lock:
             sock = self._socket
             if sock is None:
                 raise ServerClosedError("Disconnected")
 
             try:
-                p = packer(params)
-            except TypeError as e:
-                raise ValueError(f"Unable to pack: {params!r}") from e
-            try:
-                await sock.send_all(p)
+                await sock.send_all(data)
             except AttributeError:
-                await sock.send(p)
+                await sock.send(data)
 
     async def _reader(self, *, evt=None):
         """Main loop for reading
         """
         unpacker = stream_unpacker()
+        buflen = self._cfg["connect"]["buflen"]
 
         async with anyio.open_cancel_scope():
             # XXX store the scope so that the redaer may get cancelled?
@@ -472,7 +658,7 @@ class Client:
                 await evt.set()
             try:
                 while True:
-                    for msg in unpacker:
+                    for msg in expand(unpacker):
                         # logger.debug("Recv %s", msg)
                         try:
                             await self._handle_msg(msg)
@@ -483,9 +669,9 @@ class Client:
                         break
                     try:
                         try:
-                            buf = await self._socket.receive_some(4096)
+                            buf = await self._socket.receive_some(buflen)
                         except AttributeError:
-                            buf = await self._socket.receive(4096)
+                            buf = await self._socket.receive(buflen)
                     except ClosedResourceError:
                         return  # closed by us
                     if len(buf) == 0:  # Connection was closed.
@@ -603,7 +789,7 @@ class Client:
         # logger.debug("Send %s", params)
         if self._handlers is None:
             raise ClosedResourceError("Closed already")
-        res = StreamedRequest(self, seq, stream=stream)
+        res = StreamedRequest(self, seq, stream=stream, credit=params.get("credit", None))
         if "path" in params and params.get("long_path", False):
             res._path_long = PathLongener(params["path"])
         await res.send(action=action, **params)
@@ -634,6 +820,24 @@ class Client:
             auth._length = 16
         await auth.auth(self)
 
+    async def _set_compress(self, method):
+        """
+        Compress long messages in both directions, if the server can do
+        that. ``True`` selects the best method both sides know.
+        """
+        if not method:
+            return
+        methods = self._server_init.get("compress", ())
+        if method is True:
+            method = next((m for m in methods if m in compress_methods()), None)
+        elif method not in methods:
+            method = None
+        if method is None:
+            logger.info("The server can't compress messages.")
+            return
+        await self._request("set_compress", method=method)
+        self._compress = Compressor(method)
+
     @asynccontextmanager
     async def _connected(self):
         """
@@ -675,11 +879,13 @@ class Client:
                         logger.debug("Hello %s", self._server_init)
                         self.server_name = self._server_init.node
                         self.client_name = cfg["name"] or self.server_name
+                        await self._set_compress(cfg["compress"])
+                        if cfg["opaque"] and self._server_init.get("opaque", False):
+                            await self._request("set_opaque")
+                            self._opaque = True
                         await self._run_auth(auth)
 
-                    from .config import ConfigRoot
-
-                    self._config = await ConfigRoot.as_handler(self, require_client=False)
+                    await self._init_config()
 
                 except TimeoutError:
                     raise
@@ -701,9 +907,14 @@ class Client:
             self._socket = None
             self.tg = None
 
+    async def _init_config(self):
+        from .config import ConfigRoot
+
+        self._config = await ConfigRoot.as_handler(self, require_client=False)
+
     # externally visible interface ##########################
 
-    def get(self, path, *, nchain=0):
+    async def get(self, path, *, nchain=0):
         """
         Retrieve the data at a particular subtree position.
 
@@ -717,10 +928,97 @@ class Client:
             res = await client.set("foo","bar", value=res.value+1, chain=res.chain)
 
         For lower overhead and set-directly-after-get change, nchain may be 1 or 2.
+
+        If ``path`` is in a subtree you :meth:`cache`, the result may come
+        from there.
+        """
+        if isinstance(path, str):
+            raise RuntimeError("You need a path, not a string")
+        for c in self._caches:
+            if path[: len(c.path)] == c.path:
+                res = c.get(path, nchain)
+                if res is None:
+                    res = await self._request(
+                        action="get_value", path=path, iter=False, nchain=nchain
+                    )
+                    c.fill(path, res, nchain)
+                return res
+        return await self._request(action="get_value", path=path, iter=False, nchain=nchain)
+
+    def _wrote(self, path, value, res):
+        """Tell the caches about a successful write."""
+        for c in self._caches:
+            if path[: len(c.path)] == c.path:
+                c.wrote(path, value, res)
+
+    async def _cache_write(self, req, path, value):
+        res = await req
+        self._wrote(path, value, res)
+        return res
+
+    @asynccontextmanager
+    async def cache(self, path, *, size=10000, nchain=0):
+        """
+        Cache a subtree, so that :meth:`get` can answer locally.
+
+        The cache watches the subtree; it is filled with the current state
+        before this context manager returns. See :class:`ReadCache`.
+
+        Args:
+          size (int): the maximum number of entries to keep.
+          nchain (int): also cache this many change chain entries.
+
+        Usage::
+            async with client.cache(P("some.config")) as cache:
+                ...
+                res = await client.get(P("some.config.foo"))
+                ...
+            print(cache.stats.hits, cache.stats.misses)
         """
         if isinstance(path, str):
             raise RuntimeError("You need a path, not a string")
-        return self._request(action="get_value", path=path, iter=False, nchain=nchain)
+        cache = ReadCache(self, path, size=size, nchain=nchain)
+        async with anyio.create_task_group() as tg:
+            await tg.spawn(cache._run)
+            await cache._started.get()
+            self._caches.append(cache)
+            try:
+                yield cache
+            finally:
+                self._caches.remove(cache)
+                await tg.cancel_scope.cancel()
+
+    @asynccontextmanager
+    async def pipeline(self, *, max_pending=1000):
+        """
+        Send many requests without waiting for each reply.
+
+        This returns a :class:`Pipeline`. Its ``set``, ``delete`` and
+        ``get`` methods queue a request and return a handle; ``await
+        handle.get()`` returns the reply. Queued requests are sent in
+        large writes.
+
+        At most ``max_pending`` requests may wait for a reply. When the
+        context ends, all replies have arrived. If there was an error
+        you didn't retrieve, it is raised then.
+
+        If the block raises an exception, requests that have not been
+        sent yet are discarded.
+
+        Usage::
+            async with client.pipeline() as pl:
+                for i in range(10000):
+                    await pl.set(P("some.data") | i, value=i)
+        """
+        pl = Pipeline(self, max_pending=max_pending)
+        try:
+            yield pl
+        except BaseException:
+            async with anyio.fail_after(2, shield=True):
+                await pl.discard()
+            raise
+        else:
+            await pl.wait()
 
     def set(self, path, value=NotGiven, *, chain=NotGiven, prev=NotGiven, nchain=0, idem=None):
         """
@@ -735,6 +1033,10 @@ class Client:
             prev: the previous value. Discouraged; use ``chain`` instead.
             nchain: set to retrieve the node's chain tag, for further updates.
             idem: if True, no-op if the value doesn't change
+
+        If ``connect.opaque`` is set and the server supports it, the server
+        stores the value without decoding it, unless it needs to check or
+        convert it.
         """
         if isinstance(path, str):
             raise RuntimeError("You need a path, not a string")
@@ -749,9 +1051,56 @@ class Client:
         if idem is not None:
             kw["idem"] = idem
 
-        return self._request(
-            action="set_value", path=path, value=value, iter=False, nchain=nchain, **kw
+        res = self._request(
+            action="set_value",
+            path=path,
+            value=OpaqueValue.pack(value) if self._opaque else value,
+            iter=False,
+            nchain=nchain,
+            **kw,
         )
+        if self._caches:
+            res = self._cache_write(res, path, value)
+        return res
+
+    async def set_many(self, items, *, nchain=0):
+        """
+        Set or delete multiple values with a single request.
+
+        The server checks all items before changing any of them. If one
+        of them fails, nothing is changed. (However, if the request is
+        interrupted while the changes are applied, some of them may have
+        been processed.)
+
+        Usage::
+            await client.set_many([
+                (P("foo.bar"), 1),
+                dict(path=P("foo.baz"), value=2, chain=None),
+            ])
+
+        Arguments:
+            items: an iterable of ``(path, value)`` tuples, or of mappings
+              with ``path`` and the arguments of :meth:`set`.
+              A mapping without a ``value`` deletes the entry.
+            nchain: set to retrieve the nodes' chain tags. Items may override this.
+
+        Returns a list of results, one per item.
+        """
+        req = []
+        for item in items:
+            if not isinstance(item, Mapping):
+                path, value = item
+                item = dict(path=path, value=value)
+            if isinstance(item["path"], str):
+                raise RuntimeError("You need a path, not a string")
+            if self._opaque and "value" in item:
+                item = dict(item, value=OpaqueValue.pack(item["value"]))
+            req.append(item)
+
+        res = await self._request(action="set_many", items=req, iter=False, nchain=nchain)
+        for item, r in zip(req, res.results):
+            self._wrote(item["path"], item.get("value", NotGiven), r)
+        return res.results
 
     def delete(self, path, *, chain=NotGiven, prev=NotGiven, nchain=0):
         """
@@ -773,7 +1122,10 @@ class Client:
         if chain is not NotGiven:
             kw["chain"] = chain
 
-        return self._request(action="delete_value", path=path, iter=False, nchain=nchain, **kw)
+        res = self._request(action="delete_value", path=path, iter=False, nchain=nchain, **kw)
+        if self._caches:
+            res = self._cache_write(res, path, NotGiven)
+        return res
 
     async def list(self, path, *, with_data=False, empty=None, **kw):
         """
@@ -783,6 +1135,15 @@ class Client:
           with_data (bool): Return the data along with the keys. Default False.
           empty (bool): Return [names of] empty nodes. Default True if
             with_data is not set.
+          start: Return names starting with this one.
+          after: Return names after this one.
+          end: Return names before this one.
+          limit (int): Return at most this many names.
+
+        If you use any of ``start``, ``after``, ``end`` or ``limit``, the
+        names are returned in sorted order. To page through a large
+        directory, repeat the call with ``after`` set to the last name you
+        got.
         """
         if isinstance(path, str):
             raise RuntimeError("You need a path, not a string")
@@ -797,28 +1158,40 @@ class Client:
 
         This call results in a stream of tree nodes. Storage of these nodes,
         if required, is up to the caller. Also, the server does not
-        take a snapshot for you, thus the data may be inconsistent.
+        take a snapshot for you unless you set ``consistent``, thus the
+        data may be inconsistent.
 
-        Use :meth:`mirror` if you want this tree to be kept up-to-date or
-        if you need a consistent snapshot.
+        Use :meth:`mirror` if you want this tree to be kept up-to-date.
 
         Args:
           nchain (int): Length of change chain to add to the results, for updating.
           min_depth (int): min level of nodes to retrieve.
           max_depth (int): max level of nodes to retrieve.
           long_path (bool): if set (the default), pass the result through PathLongener
+          start: Only return the subtrees of children of ``path`` starting with this one.
+          after: Only return the subtrees of children after this one.
+          end: Only return the subtrees of children before this one.
+          limit (int): Only return the subtrees of this many children.
+          credit (int): flow control window. Defaults to ``connect.credit``.
+          consistent (bool): report the tree as it was when the request
+            arrived. Don't use this if you read the results slowly.
 
         """
         if isinstance(path, str):
             raise RuntimeError("You need a path, not a string")
         if long_path:
             lp = PathLongener()
-        async for r in await self._request(
-            action="get_tree", path=path, iter=True, long_path=True, **kw
-        ):
-            if long_path:
-                lp(r)
-            yield r
+        self._add_credit(kw)
+        res = await self._request(action="get_tree", path=path, iter=True, long_path=True, **kw)
+        try:
+            async for r in res:
+                if long_path:
+                    lp(r)
+                yield r
+        finally:
+            if isinstance(res, StreamedRequest):
+                async with anyio.fail_after(2, shield=True):
+                    await res.aclose()
 
     def delete_tree(self, path, *, nchain=0):
         """
@@ -838,12 +1211,27 @@ class Client:
         Args:
             seq: the sequence number of the request in question.
 
-        TODO: DistKV doesn't do per-command flow control yet, so you should
-        call this method from a different task if you don't want to risk a
-        deadlock.
+        Streamed replies are flow controlled if the request was sent with
+        a ``credit`` value, which :meth:`get_tree` and :meth:`watch` do by
+        default. Otherwise you should call this method from a different
+        task if you don't want to risk a deadlock.
         """
         return self._request(action="stop", task=seq)
 
+    def _add_credit(self, kw):
+        """
+        Add the default flow control window to these request parameters.
+
+        Pass ``credit=None`` to turn flow control off.
+        """
+        credit = kw.pop("credit", NotGiven)
+        if credit is NotGiven:
+            if not self._server_init.get("credit", False):
+                return
+            credit = self._cfg["connect"]["credit"]
+        if credit:
+            kw["credit"] = credit
+
     def watch(self, path, *, long_path=True, **kw):
         """
         Return an async iterator of changes to a subtree.
@@ -855,6 +1243,7 @@ class Client:
           nchain: add the nodes' change chains.
           min_depth (int): min level of nodes to retrieve.
           max_depth (int): max level of nodes to retrieve.
+          credit (int): flow control window. Defaults to ``connect.credit``.
 
         The result should be passed through a :class:`distkv.util.PathLongener`.
 
@@ -866,6 +1255,7 @@ class Client:
         """
         if isinstance(path, str):
             raise RuntimeError("You need a path, not a string")
+        self._add_credit(kw)
         return self._stream(action="watch", path=path, iter=True, long_path=long_path, **kw)
 
     def mirror(self, path, *, root_type=None, **kw):
@@ -942,3 +1332,373 @@ class Client:
             return self._request(action="msg_send", topic=topic, data=data)
         else:
             return self._request(action="msg_send", topic=topic, raw=raw)
+
+
+class _PipelinedReply(_SingleReply):
+    _used = False
+
+    def __init__(self, pipeline, seq, params):
+        super().__init__(pipeline.client, seq, params)
+        self._pipeline = pipeline
+
+    @property
+    def done(self):
+        return self.q.is_set()
+
+    @property
+    def failed(self):
+        return isinstance(self.q.value, outcome.Error)
+
+    async def set(self, msg):
+        res = await super().set(msg)
+        if "error" not in msg and self._conn._caches:
+            p = self._params
+            if p["action"] == "set_value":
+                self._conn._wrote(p["path"], p["value"], msg)
+            elif p["action"] == "delete_value":
+                self._conn._wrote(p["path"], NotGiven, msg)
+        return res
+
+    async def get(self):
+        """Wait for and return the result.
+
+        This sends the pipeline's queued requests.
+        """
+        self._used = True
+        await self._pipeline.flush()
+        return await super().get()
+
+
+class Pipeline:
+    """
+    Queue simple requests and send them in bulk, without waiting for the
+    replies. Use :meth:`Client.pipeline` to get one.
+
+    ``set`` and ``delete`` accept the same arguments as the
+    :class:`Client` methods, but return a handle as soon as the request
+    is queued. ``await handle.get()`` returns the reply or raises its
+    error.
+
+    Requests are sent when the buffer reaches ``connect.buflen`` bytes,
+    when you wait for a reply, and when the pipeline ends.
+    """
+
+    def __init__(self, client, max_pending=1000):
+        self.client = client
+        self.max_pending = max_pending
+        self._buf = bytearray()
+        self._buflen = client._cfg["connect"]["buflen"]
+        self._opaque = client._opaque
+        self._pending = deque()
+        self._error = None
+        self._unsent = 0  # at the end of _pending
+        self.n_sent = 0
+
+    _caches = ()  # the replies update the client's caches
+
+    set = Client.set
+    delete = Client.delete
+
+    def get(self, path, *, nchain=0):
+        """Queue a ``get_value`` request. Caches are not used."""
+        if isinstance(path, str):
+            raise RuntimeError("You need a path, not a string")
+        return self._request(action="get_value", path=path, nchain=nchain)
+
+    async def _request(self, action, iter=None, **params):  # pylint: disable=redefined-builtin
+        """Queue a request. Only single-message replies are supported."""
+        if iter is True:
+            raise ValueError("Pipelines can't iterate")
+        client = self.client
+        if client._handlers is None:
+            raise ClosedResourceError()
+
+        client._seq += 1
+        params["action"] = action
+        params["seq"] = seq = client._seq
+        data = client._pack(params)
+        res = _PipelinedReply(self, seq, params)
+        client._handlers[seq] = res
+        self._buf += data
+        self._pending.append(res)
+        self._unsent += 1
+        self.n_sent += 1
+
+        if len(self._buf) >= self._buflen:
+            await self.flush()
+        if len(self._pending) > self.max_pending:
+            # wait until half of the replies arrived, so that we don't end
+            # up sending one request at a time
+            self._cleanup()
+            if len(self._pending) > self.max_pending:
+                await self.flush()
+                while len(self._pending) > self.max_pending // 2:
+                    await self._pending[0].q.event.wait()
+                    self._cleanup()
+        return res
+
+    def _cleanup(self):
+        """Forget about replies that arrived.
+
+        Remember the first error nobody looked at.
+        """
+        p = self._pending
+        while p and p[0].done:
+            r = p.popleft()
+            if r.failed and not r._used and self._error is None:
+                self._error = r
+
+    async def flush(self):
+        """Send all queued requests."""
+        if self._buf:
+            buf, self._buf = self._buf, bytearray()
+            self._unsent = 0
+            await self.client._send_packed(bytes(buf))
+
+    async def discard(self):
+        """Drop the queued requests that have not been sent yet.
+
+        Their replies raise `ServerClosedError`.
+        """
+        self._buf = bytearray()
+        handlers = self.client._handlers
+        while self._unsent:
+            self._unsent -= 1
+            r = self._pending.pop()
+            if handlers is not None:
+                handlers.pop(r.seq, None)
+            await r.cancel()
+
+    async def wait(self):
+        """Send all queued requests, wait for their replies.
+
+        Raise the first error you haven't retrieved.
+        """
+        await self.flush()
+        while self._pending:
+            await self._pending[0].q.event.wait()
+            self._cleanup()
+        if self._error is not None and not self._error._used:
+            err, self._error = self._error, None
+            await err.get()
+
+
+class _NotSent(ServerClosedError):
+    """The connection was closed before the message could be sent."""
+
+
+class _PoolConn(Client):
+    """
+    One of the connections of a :class:`PooledClient`.
+
+    A failing connection doesn't take the pool down with it.
+    """
+
+    def __init__(self, cfg: dict):
+        super().__init__(cfg)
+        self._dead = anyio.create_event()
+
+    @property
+    def alive(self):
+        return self._socket is not None and self._handlers is not None
+
+    async def _reader(self, *, evt=None):
+        try:
+            await super()._reader(evt=evt)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Connection to %s failed: %r", self.server_name, exc)
+        finally:
+            self._socket = None
+            await self._dead.set()
+
+    async def _send(self, **params):
+        try:
+            await super()._send(**params)
+        except ServerClosedError as exc:
+            raise _NotSent(*exc.args) from exc
+
+    async def _init_config(self):
+        pass  # the pool does this
+
+
+class PooledClient(Client):
+    """
+    A client which keeps ``connect.pool`` connections open, to
+    ``connect.host`` and the servers in ``connect.hosts``.
+
+    Each request is sent via the connection with the fewest pending
+    requests. When a connection fails, its pending requests fail with
+    :class:`ServerClosedError` (streams such as :meth:`watch` simply end)
+    and it is replaced by one to the next server.
+
+    A connection that has exchanged a Diffie-Hellman secret with its
+    server (password auth does this) is used for all requests until it
+    fails, because the server only knows the secret on that connection.
+
+    The API is that of :class:`Client`. Use `open_client` or
+    `client_scope` with a pool configuration to get one.
+    """
+
+    _pinned = None
+
+    def __init__(self, cfg: dict):
+        super().__init__(cfg)
+        self._conns = []
+        self._conns_changed = anyio.create_event()
+        self._rr = 0
+
+    def _hosts(self):
+        """The list of servers to connect to, as (host, port) tuples."""
+        cfg = self._cfg["connect"]
+        hostmap = self._cfg.get("hostmap", {})
+        res = [(cfg["host"], cfg["port"])]
+        for host in cfg["hosts"]:
+            port = cfg["port"]
+            if isinstance(host, str):
+                host = hostmap.get(host, host)
+            if not isinstance(host, str):
+                host, port = host
+            else:
+                try:
+                    host, port = host.rsplit(":", 1)
+                except ValueError:
+                    pass
+                else:
+                    port = int(port)
+            res.append((host, port))
+        return res
+
+    async def _set_changed(self):
+        evt, self._conns_changed = self._conns_changed, anyio.create_event()
+        await evt.set()
+
+    async def _keep_conn(self, n: int, first: ValueEvent):
+        """
+        Keep a connection open. Start with the ``n``'th server and, if
+        that fails, continue with the next one.
+
+        The first connection sets ``first`` to its server's greeting.
+        If connecting to all servers failed, this task sets the last
+        error instead.
+        """
+        cfg = self._cfg["connect"]
+        hosts = self._hosts()
+        delay = cfg["retry"]
+        n_err = 0
+        while True:
+            host, port = hosts[n % len(hosts)]
+            n += 1
+            conn = _PoolConn(combine_dict(dict(connect=dict(host=host, port=port)), self._cfg))
+            try:
+                async with conn._connected():
+                    self._conns.append(conn)
+                    if not first.is_set():
+                        await first.set(conn)
+                    await self._set_changed()
+                    delay = cfg["retry"]
+                    n_err = 0
+                    await conn._dead.wait()
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Connecting to %s:%s failed: %r", host, port, exc)
+                n_err += 1
+                if n_err >= len(hosts) and not first.is_set():
+                    await first.set_error(exc)
+            finally:
+                if conn in self._conns:
+                    self._conns.remove(conn)
+                if self._pinned is conn:
+                    self._pinned = None
+                await self._set_changed()
+            if n_err >= len(hosts):
+                await anyio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    async def _conn(self) -> _PoolConn:
+        """Return the connection to use for the next request.
+
+        If there is none, wait until one is available.
+        """
+        conn = self._pinned
+        if conn is not None and conn.alive:
+            return conn
+        conns = [c for c in self._conns if c.alive]
+        if not conns:
+            async with anyio.move_on_after(self._cfg["connect"]["init_timeout"]):
+                while not conns:
+                    await self._conns_changed.wait()
+                    conns = [c for c in self._conns if c.alive]
+            if not conns:
+                raise ServerClosedError("No connection")
+
+        # least busy, round robin if tied
+        self._rr = i = (self._rr + 1) % len(conns)
+        return min(conns[i:] + conns[:i], key=lambda c: len(c._handlers))
+
+    @property
+    def connections(self):
+        """The connections which are currently open."""
+        return [c for c in self._conns if c.alive]
+
+    async def _request(
+        self, action, iter=None, seq=None, _async=False, **params
+    ):  # pylint: disable=redefined-builtin
+        # A request that wasn't sent may safely be retried elsewhere.
+        while True:
+            conn = await self._conn()
+            try:
+                return await conn._request(action, iter=iter, seq=seq, _async=_async, **params)
+            except _NotSent:
+                pass
+
+    @asynccontextmanager
+    async def _stream(self, action, stream=False, **params):
+        async with AsyncExitStack() as ex:
+            while True:
+                conn = await self._conn()
+                try:
+                    res = await ex.enter_async_context(
+                        conn._stream(action, stream=stream, **params)
+                    )
+                except _NotSent:
+                    pass
+                else:
+                    break
+            yield res
+
+    async def dh_secret(self, length=1024):
+        conn = await self._conn()
+        self._pinned = conn
+        return await conn.dh_secret(length=length)
+
+    @asynccontextmanager
+    async def pipeline(self, **kw):
+        conn = await self._conn()
+        async with conn.pipeline(**kw) as pl:
+            yield pl
+
+    @asynccontextmanager
+    async def _connected(self):
+        """
+        This async context manager starts the connections and waits for
+        the first of them.
+        """
+        cfg = self._cfg["connect"]
+        self.scope = scope.get()
+        first = ValueEvent()
+        for n in range(cfg["pool"]):
+            await self.scope.spawn(self._keep_conn, n, first)
+        conn = await first.get()
+        self._server_init = conn._server_init
+        self._opaque = conn._opaque
+        self.server_name = conn.server_name
+        self.client_name = conn.client_name
+        try:
+            await self._init_config()
+            yield self
+        finally:
+            async with anyio.fail_after(2, shield=True):
+                try:
+                    del self._config
+                except AttributeError:
+                    pass
+                self.config = ClientConfig(self)
@@ -3,12 +3,95 @@ This module contains helper functions for packing+unpacking of single messages,
 plus an unpacker factory for streams.
 """
 
-import msgpack
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from functools import partial
 
+import msgpack
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
 from .util import attrdict, Path
 
-__all__ = ["packer", "unpacker", "stream_unpacker"]
+__all__ = [
+    "packer",
+    "unpacker",
+    "stream_unpacker",
+    "opaque_unpacker",
+    "opaque_stream_unpacker",
+    "expand",
+    "OpaqueValue",
+    "opaque_decode",
+    "Chunker",
+    "Compressor",
+    "compress_methods",
+    "CHUNK_EXT",
+]
+
+CHUNK_EXT = 4  # msgpack extension type of message chunks
+ZIP_EXT = 5  # msgpack extension type of a compressed message
+ZIP_BLOCK_EXT = 6  # msgpack extension type of a compressed block of messages
+VALUE_EXT = 7  # msgpack extension type of an opaque (packed) value
+ZIP_MAX = 1 << 28  # decompressed data may not be larger than this
+
+
+class OpaqueValue:
+    """
+    A value that's stored and forwarded in packed form.
+
+    The server does not decode these values unless it has to look at
+    them (type checks, codecs, or the meta tree). On the wire it's a
+    msgpack extension object of type `VALUE_EXT` which the (normal)
+    unpackers in this module decode transparently, while the opaque
+    unpackers return an instance of this class.
+
+    Opaque values compare equal to their decoded content. To avoid
+    decoding, a plain value is packed and compared first. Two opaque
+    values are equal if their packed data are.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    @classmethod
+    def pack(cls, value):
+        """Pack ``value``."""
+        return cls(packer(value))
+
+    @property
+    def value(self):
+        """The decoded value. Not cached."""
+        return unpacker(self.data)
+
+    def __eq__(self, other):
+        if isinstance(other, OpaqueValue):
+            return self.data == other.data
+        try:
+            if packer(other) == self.data:
+                return True
+        except TypeError:  # can't be packed, thus can't be equal
+            return False
+        # e.g. 1 == 1.0, or a dict in different order
+        return self.value == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "<%s:%r>" % (self.__class__.__name__, self.value)
+
+
+def opaque_decode(value):
+    """Return ``value``, decoded if it's an `OpaqueValue`."""
+    if type(value) is OpaqueValue:
+        return unpacker(value.data)
+    return value
 
 
 def _encode(data):
@@ -16,19 +99,40 @@ def _encode(data):
         return msgpack.ExtType(2, data.to_bytes((data.bit_length() + 7) // 8, "big"))
     elif isinstance(data, Path):
         return msgpack.ExtType(3, b"".join(packer(x) for x in data))
+    elif isinstance(data, OpaqueValue):
+        return msgpack.ExtType(VALUE_EXT, data.data)
     return data
 
 
+# path element unpackers (creating one is expensive)
+_path_unpackers = []
+
+
 def _decode(code, data):
     if code == 2:
         return int.from_bytes(data, "big")
     elif code == 3:
-        s = stream_unpacker()
+        s = _path_unpackers.pop() if _path_unpackers else stream_unpacker()
         s.feed(data)
-        return Path(*s)
+        res = Path(*s)
+        # not returned to the pool if decoding fails
+        _path_unpackers.append(s)
+        return res
+    elif code == ZIP_EXT:
+        return unpacker(_decompress(data))
+    elif code == VALUE_EXT:
+        return unpacker(data)
     return msgpack.ExtType(code, data)
 
 
+def _decode_opaque(code, data):
+    if code == VALUE_EXT:
+        return OpaqueValue(data)
+    elif code == ZIP_EXT:
+        return opaque_unpacker(_decompress(data))
+    return _decode(code, data)
+
+
 # single message packer
 _packers = []
 
@@ -53,3 +157,224 @@ unpacker = partial(
 stream_unpacker = partial(
     msgpack.Unpacker, object_pairs_hook=attrdict, raw=False, use_list=False, ext_hook=_decode
 )
+
+# the same, but opaque values are not decoded
+opaque_unpacker = partial(unpacker, ext_hook=_decode_opaque)
+opaque_stream_unpacker = partial(stream_unpacker, ext_hook=_decode_opaque)
+
+
+def expand(msgs, opaque=False):
+    """
+    Iterate over ``msgs``, typically a stream unpacker, replacing
+    compressed blocks with the messages they contain.
+
+    If ``opaque`` is set, values in these blocks are not decoded.
+    """
+    for msg in msgs:
+        if isinstance(msg, msgpack.ExtType) and msg.code == ZIP_BLOCK_EXT:
+            s = (opaque_stream_unpacker if opaque else stream_unpacker)(max_buffer_size=ZIP_MAX)
+            s.feed(_decompress(msg.data))
+            yield from s
+        else:
+            yield msg
+
+
+# Compression methods. The ID is the first byte of compressed data.
+_ZIP_IDS = {"zlib": 1, "zstd": 2}
+_ZIP_NAMES = {v: k for k, v in _ZIP_IDS.items()}
+_zstd = threading.local()  # decompressors aren't thread safe
+
+
+def compress_methods() -> list:
+    """The names of the compression methods available here, best first."""
+    res = ["zlib"]
+    if zstandard is not None:
+        res.insert(0, "zstd")
+    return res
+
+
+def _decompress(data: bytes) -> bytes:
+    method = _ZIP_NAMES.get(data[0], None)
+    if method == "zlib":
+        d = zlib.decompressobj()
+        res = d.decompress(data[1:], ZIP_MAX)
+        if d.unconsumed_tail:
+            raise ValueError("Decompressed data too large")
+        return res
+    if method == "zstd" and zstandard is not None:
+        data = data[1:]
+        if zstandard.frame_content_size(data) > ZIP_MAX:
+            raise ValueError("Decompressed data too large")
+        try:
+            d = _zstd.d
+        except AttributeError:
+            _zstd.d = d = zstandard.ZstdDecompressor()
+        return d.decompress(data, max_output_size=ZIP_MAX)
+    raise ValueError(f"Unknown compression method {data[0]}")
+
+
+class Compressor:
+    """
+    Compress packed messages.
+
+    The result is a msgpack extension object which the unpackers in this
+    module decompress transparently (single messages), or which
+    :func:`expand` replaces with its content (blocks of messages).
+
+    Data shorter than ``min_size`` bytes, and data which compression
+    doesn't shrink, are left alone.
+
+    A compressor must not be used by more than one thread at a time.
+
+    Args:
+      method: ``"zlib"``, or ``"zstd"`` if the ``zstandard`` package is
+        installed. ``True`` selects the best available method.
+      level: the compression level. The default depends on the method.
+      min_size: don't compress data shorter than this.
+    """
+
+    def __init__(self, method, level: int = None, min_size: int = 1000):
+        if method is True:
+            method = compress_methods()[0]
+        if method not in compress_methods():
+            raise ValueError(f"Compression method {method!r} is not available")
+        self.method = method
+        self.min_size = min_size
+        self._id = bytes((_ZIP_IDS[method],))
+        if method == "zstd":
+            c = zstandard.ZstdCompressor(level=level or 3)
+            self._compress = c.compress
+        else:
+            self._compress = partial(zlib.compress, level=level or 6)
+
+    def _pack(self, code, data):
+        if len(data) < self.min_size:
+            return data
+        res = packer(msgpack.ExtType(code, self._id + self._compress(data)))
+        if len(res) >= len(data):
+            return data
+        return res
+
+    def pack(self, data: bytes) -> bytes:
+        """Compress a single packed message."""
+        return self._pack(ZIP_EXT, data)
+
+    def block(self, data: bytes) -> bytes:
+        """Compress a sequence of packed messages."""
+        return self._pack(ZIP_BLOCK_EXT, data)
+
+
+class _Partial:
+    """An incompletely received message."""
+
+    __slots__ = ("time", "n", "parts", "size")
+
+    def __init__(self, t):
+        self.time = t
+        self.n = None
+        self.parts = {}
+        self.size = 0
+
+
+class Chunker:
+    """
+    Split packed messages that are too long for a transport into chunks,
+    and reassemble them.
+
+    A chunk is a msgpack extension object of type `CHUNK_EXT`. It contains
+    the sender's name, a sequence number, the chunk's index, the number of
+    chunks, and a slice of the packed message.
+
+    Incomplete messages are dropped after ``timeout`` seconds, or (oldest
+    first) when they use more than ``max_size`` bytes.
+
+    Args:
+      name: the sender's name. Sequence numbers are per sender.
+      max_len: the size limit of a transport message.
+      timeout: drop incomplete messages after this many seconds.
+      max_size: memory limit for incomplete messages, in bytes.
+    """
+
+    def __init__(self, name: str, max_len: int, timeout: float = 60, max_size: int = 1 << 24):
+        self.name = name
+        self.max_len = max_len
+        self.timeout = timeout
+        self.max_size = max_size
+        self._seq = 0
+        self._pending = OrderedDict()
+        self._size = 0
+        self.stats = attrdict(split=0, sent=0, joined=0, expired=0, dropped=0)
+
+    def split(self, data: bytes):
+        """
+        Yield the packed chunks of ``data``, which must be longer than
+        ``max_len``.
+        """
+        self._seq = seq = (self._seq + 1) & 0xFFFFFFFF
+        # framing: extension header, data length, and the other fields
+        n = len(data)
+        pl = self.max_len - (6 if self.max_len >= 1 << 16 else 4) - 3
+        pl -= len(packer((self.name, seq, n, n, b"")))
+        n = (n + pl - 1) // pl
+        self.stats.split += 1
+        self.stats.sent += n
+        for i in range(n):
+            chunk = packer((self.name, seq, i, n, data[i * pl : (i + 1) * pl]))
+            yield packer(msgpack.ExtType(CHUNK_EXT, chunk))
+
+    def feed(self, chunk: msgpack.ExtType):
+        """
+        Process a received chunk.
+
+        Returns the complete packed message, or ``None`` if chunks are
+        still missing.
+        """
+        name, seq, i, n, data = unpacker(chunk.data)
+        return self.add((name, seq), i, n, data)
+
+    def add(self, key, i: int, n: int, data: bytes):
+        """
+        Store part ``i`` (zero-based) of the message ``key``, which
+        consists of ``n`` parts. ``n`` may be ``None`` if the number is not
+        known yet.
+
+        Returns the complete message, or ``None``.
+        """
+        now = time.monotonic()
+        pending = self._pending
+        while pending:
+            p = next(iter(pending.values()))
+            if p.time + self.timeout > now:
+                break
+            self._drop()
+            self.stats.expired += 1
+
+        p = pending.get(key, None)
+        if p is None:
+            pending[key] = p = _Partial(now)
+        if n is not None:
+            p.n = n
+        if i not in p.parts:
+            p.parts[i] = data
+            p.size += len(data)
+            self._size += len(data)
+
+        if p.n is None or len(p.parts) < p.n:
+            while self._size > self.max_size:
+                self._drop()
+                self.stats.dropped += 1
+            return None
+
+        del pending[key]
+        self._size -= p.size
+        self.stats.joined += 1
+        return b"".join(p.parts[j] for j in range(p.n))
+
+    def _drop(self):
+        _, p = self._pending.popitem(last=False)
+        self._size -= p.size
+
+    @property
+    def incomplete(self) -> int:
+        """The number of messages that are waiting for more chunks."""
+        return len(self._pending)
@@ -243,6 +243,6 @@ async def watch(obj, path, state, only):
 async def update(obj, path, infile):
     """Send a list of updates to a DistKV subtree"""
     path = P(path)
-    async with MsgReader(path=infile) as reader:
+    async with MsgReader(path=infile, mmap=True) as reader, obj.client.pipeline() as pl:
         async for msg in reader:
-            await obj.client.set(*path, *msg.path, value=msg.value)
+            await pl.set(path + msg.path, value=msg.value)
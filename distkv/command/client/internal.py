@@ -31,6 +31,7 @@ async def cli():
     help="Get remote-missing-node status.",
 )
 @click.option("-p", "--present", is_flag=True, help="Get known-data status.")
+@click.option("-c", "--chunks", is_flag=True, help="Get message chunking statistics.")
 @click.option("-s", "--superseded", is_flag=True, help="Get superseded-data status.")
 @click.option("-D", "--debug", is_flag=True, help="Get internal verbosity.")
 @click.option("--debugger", is_flag=True, help="Start a remote debugger. DO NOT USE.")
@@ -50,6 +51,7 @@ async def state(obj, **flags):
         flags["deleted"] = True
         flags["missing"] = True
         flags["remote_missing"] = True
+        flags["chunks"] = True
     res = await obj.client._request("get_state", iter=False, **flags)
     k = res.pop("known", None)
     if k is not None:
@@ -19,29 +19,31 @@ async def cli():
 
 @cli.command()
 @click.option("-i", "--incremental", is_flag=True, help="Don't write the initial state")
+@click.option("-s", "--snapshot", is_flag=True, help="Write the initial state as a snapshot")
 @click.argument("path", nargs=1)
 @click.pass_obj
-async def dest(obj, path, incremental):
+async def dest(obj, path, incremental, snapshot):
     """
     Log changes to a file.
 
     Any previously open log (on the server you talk to) is closed as soon
     as the new one is opened and ready.
     """
-    res = await obj.client._request("log", path=path, fetch=not incremental)
+    res = await obj.client._request("log", path=path, fetch=not incremental, snapshot=snapshot)
     if obj.meta:
         yprint(res, stream=obj.stdout)
 
 
 @cli.command()
 @click.option("-f", "--full", is_flag=1, help="Also dump internal state")
+@click.option("-s", "--snapshot", is_flag=True, help="Use the binary snapshot format")
 @click.argument("path", nargs=1)
 @click.pass_obj
-async def save(obj, path, full):
+async def save(obj, path, full, snapshot):
     """
     Write the server's current state to a file.
     """
-    res = await obj.client._request("save", path=path, full=full)
+    res = await obj.client._request("save", path=path, full=full, snapshot=snapshot)
     if obj.meta:
         yprint(res, stream=obj.stdout)
 
@@ -62,7 +62,7 @@ async def file_(obj, file, path, filter_):
     else:
         pl = lambda _: None
     filter_ = [P(x) for x in filter_]
-    async with MsgReader(path=file) as f:
+    async with MsgReader(path=file, mmap=True) as f:
         async for msg in f:
             pl(msg)
             if filter_:
@@ -132,10 +132,13 @@ async def msg_(obj, path):
     from distkv.backend import get_backend
 
     class _Unpack:
+        _unpack = staticmethod(unpacker)
+
         def __init__(self):
-            self._part_cache = dict()
+            self._chunker = Chunker("", distkv.server.MQTT_MAXLEN)
 
     import distkv.server
+    from distkv.codec import Chunker
 
     _Unpack._unpack_multiple = distkv.server.Server._unpack_multiple
     _unpacker = _Unpack()._unpack_multiple
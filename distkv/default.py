@@ -50,6 +50,13 @@ CFG = attrdict(
         init_timeout=5,  # time to wait for connection plus greeting
         auth=None,  # no auth used by default
         name=None,  # defaults to the server's name
+        credit=100,  # flow control window for get_tree and watch replies
+        compress=None,  # compress long messages: "zlib", "zstd", or True for the best
+        buflen=65536,  # receive buffer size
+        pool=1,  # number of connections; requests go to the least busy one
+        hosts=(),  # more servers to connect to, by hostmap name or as (host, port)
+        retry=1,  # initial delay between reconnection attempts; doubles up to 30
+        opaque=False,  # send and receive values that the server stores without decoding
     ),
     config=attrdict(prefix=P(":.distkv.config")),
     errors=attrdict(prefix=P(":.distkv.error")),
@@ -82,6 +89,47 @@ CFG = attrdict(
         bind_default=attrdict(  # default values for all elements of "bind"
             host="localhost", port=PORT, ssl=False
         ),
+        conn=attrdict(  # handling of client connections
+            buflen=65536,  # receive buffer size
+            send_buflen=65536,  # send buffer size, for streamed replies
+            max_pending=100,  # simple commands run concurrently, per connection
+            max_queued=1000,  # simple commands waiting for a slot before we stop reading
+            watch_lag=1000,  # slow watchers: collapse updates to this many entries, then resync
+        ),
+        opaque=False,  # accept values that we store without decoding them
+        # set this only when all servers understand opaque values
+        batch=attrdict(  # broadcast multiple updates in one message
+            enabled=False,  # set this only when all servers understand "batch"
+            delay=0.005,  # collect updates for this many seconds
+            max_len=None,  # max message size (not Serf); default: Serf's
+        ),
+        chunk=attrdict(  # splitting messages that are too long for the backend
+            ext=False,  # set this only when all servers understand chunks
+            max_len=None,  # message size limit; default: Serf's, or 60k for MQTT
+            timeout=60,  # drop incomplete messages after this many seconds
+            max_size=1 << 24,  # or when they use more than this many bytes
+            compress=None,  # compress long messages: "zlib", "zstd", or True for the best
+            # set this only when all servers understand compressed messages
+        ),
+        save=attrdict(  # writing the change log (``distkv client log dest``)
+            count=100,  # commit after this many messages
+            delay=1,  # or this many seconds after the first uncommitted message
+            sync=None,  # "fsync" or "fdatasync" after each commit
+            max_pending=10000,  # messages queued for the I/O thread
+            compress=None,  # compress blocks of messages: "zlib", "zstd", or True for the best
+            compact=attrdict(  # rewrite a full log when it gets too large
+                enabled=False,
+                factor=2,  # ... i.e. this many times the size of its initial state
+                min_size=1 << 20,  # but at least this many bytes
+            ),
+        ),
+        sync=attrdict(  # fetching the initial data from other nodes
+            peers=3,  # fetch from this many nodes in parallel
+            depth=1,  # each subtree at this depth is fetched separately
+        ),
+        resync=attrdict(  # after a split, pull differing subtrees from the other side
+            enabled=False,  # set this only when all servers understand "get_digest"
+        ),
         change=attrdict(length=5),  # chain length: use max nr of network sections +1
         ping=attrdict(cycle=10, gap=2),  # asyncserf.Actor config timing for server sync
         # ping also controls minimum server startup time
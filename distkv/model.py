@@ -6,15 +6,20 @@ TODO: message chains should be refactored to arrays: much lower overhead.
 
 from __future__ import annotations
 
+import anyio
 import weakref
+from bisect import bisect_left, insort
+from hashlib import blake2b
 from range_set import RangeSet
-from collections import defaultdict
+from collections import defaultdict, deque
+from types import MappingProxyType
 
-from typing import List, Any
+from typing import List, Any, Mapping
 
 from distmqtt.utils import create_queue
 
 from .util import attrdict, NotGiven, Path
+from .codec import packer, OpaqueValue, opaque_decode
 from .exceptions import ACLError
 
 from logging import getLogger
@@ -129,6 +134,30 @@ class Node:
                 self._superseded.discard(tick)
                 logger.info("%s was marked as superseded", entry)
 
+    def seen_all(self, entries: dict):
+        """Bulk version of :meth:`seen`, used when loading.
+
+        Args:
+          ``entries``: maps ticks to the entries they affect.
+        """
+        r = []
+        for t in sorted(entries):
+            if r and r[-1][1] == t:
+                r[-1][1] = t + 1
+            else:
+                r.append([t, t + 1])
+        rs = RangeSet()
+        rs.__setstate__(r)
+
+        self._reported -= rs
+        self._present |= rs
+        self.entries.update(entries)
+
+        sup = self._superseded & rs
+        if len(sup):
+            self._superseded -= sup
+            logger.info("%s: %s were marked as superseded", self, sup)
+
     def is_deleted(self, tick):
         """
         Check whether this tick has been marked as deleted.
@@ -373,6 +402,8 @@ class NodeEvent:
 
     """
 
+    __slots__ = ("node", "tick", "prev")
+
     def __init__(self, node: Node, tick: int = None, prev: "NodeEvent" = None):
         self.node = node
         if tick is None:
@@ -380,9 +411,7 @@ class NodeEvent:
         self.tick = tick
         if tick is not None and tick > 0:
             node.seen(tick)
-        self.prev = None
-        if prev is not None:
-            self.prev = prev
+        self.prev = prev
 
     def __len__(self):
         """Length of this chain"""
@@ -405,6 +434,8 @@ class NodeEvent:
             c = c.prev
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if other is None:
             return False
         return self.node == other.node and self.tick == other.tick
@@ -414,6 +445,8 @@ class NodeEvent:
 
         The last two items may be missing from either chain.
         """
+        if self is other:
+            return True
         if other is None:
             return self.prev is None or len(self.prev) <= 1
         if self != other:
@@ -508,7 +541,14 @@ class NodeEvent:
         return res
 
     @classmethod
-    def deserialize(cls, msg, cache):
+    def deserialize(cls, msg, cache, known: "NodeEvent" = None):
+        """Build an event chain from its serialized form.
+
+        ``known`` is an existing chain, typically that of the entry the
+        message refers to. Links which are identical to one of its links,
+        i.e. which have the same node, tick and (identical) predecessor,
+        are re-used instead of duplicated.
+        """
         if msg is None:
             return None
         msg = msg.get("chain", msg)
@@ -517,10 +557,18 @@ class NodeEvent:
             assert "prev" not in msg
             assert tick is None
             return None
-        self = cls(node=Node(msg["node"], tick=tick, cache=cache), tick=tick)
+        node = Node(msg["node"], tick=tick, cache=cache)
+        prev = None
         if "prev" in msg:
-            self.prev = cls.deserialize(msg["prev"], cache=cache)
-        return self
+            prev = cls.deserialize(msg["prev"], cache=cache, known=known)
+
+        while known is not None:
+            if known.node is node:
+                if known.tick == tick and known.prev is prev:
+                    return known
+                break
+            known = known.prev
+        return cls(node=node, tick=tick, prev=prev)
 
     def attach(self, prev: "NodeEvent" = None, server=None):
         """Copy this node, if necessary, and attach a filtered `prev` chain to it"""
@@ -535,12 +583,17 @@ class NodeEvent:
 
 class UpdateEvent:
     """Represents an event which updates something.
+
+    ``old_value`` is only set if it is known.
     """
 
+    __slots__ = ("event", "entry", "new_value", "old_value", "tock", "packed")
+
     def __init__(self, event: NodeEvent, entry: "Entry", new_value, old_value=NotGiven, tock=None):
         self.event = event
         self.entry = entry
         self.new_value = new_value
+        self.packed = None  # cache for watchers, see distkv.server.SCmd_watch
         if old_value is not NotGiven:
             self.old_value = old_value
         if new_value is NotGiven:
@@ -592,7 +645,7 @@ class UpdateEvent:
                 from .types import ConvNull
             conv = ConvNull
         entry = root.follow(msg.path, create=True, nulls_ok=nulls_ok)
-        event = NodeEvent.deserialize(msg, cache=cache)
+        event = NodeEvent.deserialize(msg, cache=cache, known=entry.chain)
         old_value = NotGiven
         if "value" in msg:
             value = conv.dec_value(msg.value, entry=entry)
@@ -605,34 +658,163 @@ class UpdateEvent:
         return cls(event, entry, value, old_value=old_value, tock=msg.tock)
 
 
+SUB_CHUNK = 100  # children to copy at a time when iterating in sorted order
+RESYNC_STEP = 1000  # entries to visit between checkpoints when a watcher resyncs
+
+_NO_SUB = MappingProxyType({})  # shared by all entries without children
+
+_KEY_ORDER = {type(None): 0, bool: 1, int: 2, float: 2, str: 3, bytes: 4, tuple: 5, list: 5}
+
+
+def sort_key(name):
+    """
+    Return a key for ordering path elements of mixed types.
+
+    Names are ordered by type first (None, bool, numbers, str, bytes,
+    tuples) and by value within each type.
+    """
+    rank = _KEY_ORDER.get(type(name), 6)
+    if rank == 5:
+        return (rank, tuple(sort_key(n) for n in name))
+    if rank == 6:
+        return (rank, repr(name))
+    return (rank, name)
+
+
+def chain_digest(name, chain):
+    """
+    Return a hash of an entry's name and the current event in its chain.
+
+    Entries with the same hash have (almost certainly) seen the same
+    update. Entries without a chain hash to zero.
+    """
+    if chain is None:
+        return 0
+    h = blake2b(packer((name, chain.node.name, chain.tick)), digest_size=8)
+    return int.from_bytes(h.digest(), "little")
+
+
 class Entry:
     """This class represents one key/value pair
+
+    Entries use ``__slots__``. Subclasses which don't declare their own
+    get a ``__dict__`` as usual.
     """
 
-    _parent: "Entry" = None
-    name: str = None
-    _path: List[str] = None
-    _root: "Entry" = None
-    chain: NodeEvent = None
+    __slots__ = (
+        "name",
+        "tock",
+        "chain",
+        "monitors",
+        "_parent",
+        "_path",
+        "_root",
+        "_data",
+        "_sub",
+        "_sorted",
+        "_counter",
+        "_digest",
+        "_snapshots",
+        "__weakref__",
+    )
+
+    _parent: "Entry"
+    name: str
+    _path: Path
+    _root: "Entry"
+    chain: NodeEvent
     SUBTYPE = None
     SUBTYPES = {}
-    _data: Any = NotGiven
-
-    monitors = None
+    _data: Any
+    _sub: Mapping  # _NO_SUB until the first child is added
+    _sorted: List  # (sort_key, name) of children, built on demand
+    _digest: int  # of this subtree; None if it needs to be recalculated
+    _snapshots: set  # of the root: the active Snapshot objects, if any
+    monitors: set  # None until the first watcher is added
 
     def __init__(self, name: str, parent: "Entry", tock=None):
         self.name = name
-        self._sub = {}
-        self.monitors = set()
         self.tock = tock
+        self.chain = None
+        self.monitors = None
+        self._parent = None
+        self._path = None
+        self._root = None
+        self._data = NotGiven
+        self._sub = _NO_SUB
+        self._sorted = None
+        self._counter = 0
+        self._digest = 0
+        self._snapshots = ()
 
         if parent is not None:
             parent._add_subnode(self)
             self._parent = weakref.ref(parent)
 
     def _add_subnode(self, child: "Entry"):
+        if self._sub is _NO_SUB:
+            self._sub = {}
+        if self._sorted is not None and child.name not in self._sub:
+            insort(self._sorted, (sort_key(child.name), child.name))
         self._sub[child.name] = child
 
+    def _del_subnode(self, name):
+        if name not in self._sub:
+            return
+        del self._sub[name]
+        if self._sorted is None:
+            return
+        k = (sort_key(name),)
+        del self._sorted[bisect_left(self._sorted, k)]
+
+    def sub_range(self, start=NotGiven, end=NotGiven, after=NotGiven, limit=None, full=False):
+        """
+        Iterate over (some of) this entry's children, in sorted order.
+
+        Args:
+          start: Start with this name.
+          after: Start with the name after this one.
+          end: Stop before this name.
+          limit: Return at most this many children.
+          full: Include the ``None`` child (used for meta data).
+
+        The sorted index is built on first use and then kept up-to-date.
+        The caller may add or remove children while iterating.
+        """
+        keys = self._sorted
+        if keys is None:
+            keys = self._sorted = sorted((sort_key(k), k) for k in self._sub)
+        if after is not NotGiven:
+            pos, skip = sort_key(after), True
+        elif start is not NotGiven:
+            pos, skip = sort_key(start), False
+        else:
+            pos, skip = None, False
+        stop = None if end is NotGiven else sort_key(end)
+
+        while True:
+            # Work on copied chunks, and re-locate our position in between,
+            # as the index might have changed.
+            i = 0 if pos is None else bisect_left(keys, (pos,))
+            if skip and i < len(keys) and keys[i][0] == pos:
+                i += 1
+            chunk = keys[i : i + SUB_CHUNK]
+            if not chunk:
+                return
+            for pos, k in chunk:
+                if stop is not None and pos >= stop:
+                    return
+                if limit is not None and limit <= 0:
+                    return
+                skip = True
+                if k is None and not full:
+                    continue
+                child = self._sub.get(k, None)
+                if child is not None:
+                    if limit is not None:
+                        limit -= 1
+                    yield k, child
+
     def __hash__(self):
         return hash(self.name)
 
@@ -643,6 +825,36 @@ class Entry:
             other = other.name
         return self.name == other
 
+    @property
+    def digest(self):
+        """
+        A hash of this subtree's state, for comparing it with another
+        server's copy.
+
+        This is the XOR of the :func:`chain_digest` of this entry and of
+        the digests of its children. It's cached, and recalculated lazily
+        after :meth:`_changed` invalidated it.
+        """
+        d = self._digest
+        if d is None:
+            d = chain_digest(self.name, self.chain)
+            for v in self._sub.values():
+                d ^= v.digest
+            self._digest = d
+        return d
+
+    def _changed(self):
+        """
+        This entry's chain has changed: invalidate our digest and that of
+        our parents.
+
+        A parent's digest is invalid if any child's is, so we can stop at
+        the first entry that already has been invalidated.
+        """
+        while self is not None and self._digest is not None:
+            self._digest = None
+            self = self.parent  # pylint: disable=self-cls-assignment
+
     def chain_links(self):
         c = self.chain
         if c is not None:
@@ -673,7 +885,7 @@ class Entry:
             if parent is None:
                 self._path = Path()
             else:
-                self._path = parent.path + [self.name]
+                self._path = Path.build(parent.path._data + (self.name,))
         return self._path
 
     def follow_acl(self, path, *, create=True, nulls_ok=False, acl=None, acl_key=None):
@@ -818,6 +1030,8 @@ class Entry:
             e = node.mark_deleted(tick)
             assert e is None or e is self
             server.mark_deleted(node, tick)
+        for s in self.root._snapshots:
+            s._save(self)
         self._data = NotGiven
         return c
 
@@ -828,9 +1042,16 @@ class Entry:
         c, self.chain = self.chain, None
         if c is None:
             return
+        self._changed()
         for node, tick in c:
             node.clear_deleted(tick)
-        self._chop()
+        for s in self.root._snapshots:
+            if id(self) in s._old:
+                # still needed: the snapshot will remove it
+                s._purged.append(self)
+                break
+        else:
+            self._chop()
 
     def _chop(self):
         """
@@ -842,7 +1063,7 @@ class Entry:
             p = p()
             if p is None:
                 return
-            p._sub.pop(this.name, None)
+            p._del_subnode(this.name)
             if p._sub:
                 return
             this, p = p, p._parent
@@ -863,10 +1084,14 @@ class Entry:
         await self.apply(evt, server=server)
         return evt
 
-    async def apply(self, evt: UpdateEvent, server=None, root=None, loading=False):
+    async def apply(self, evt: UpdateEvent, server=None, root=None, loading=False, seen=None):
         """Apply this :cls`UpdateEvent` to me.
 
         Also, forward to watchers.
+
+        If ``seen`` is a dict, the ticks of the new chain are collected in
+        ``seen[node][tick]`` instead of being passed to :meth:`Node.seen`.
+        The caller needs to call :meth:`Node.seen_all` when it's done.
         """
         chk = None
         if root is not None and None in root:
@@ -888,6 +1113,9 @@ class Entry:
             evt_val = evt.new_value
         else:
             evt_val = evt.value
+        if type(evt_val) is OpaqueValue and self.path[:1] == (None,):
+            # the server itself uses the meta tree's values
+            evt.new_value = evt_val = opaque_decode(evt_val)
 
         if self.chain > evt.event:  # already superseded
             logger.warning("*** superseded ***")
@@ -916,20 +1144,29 @@ class Entry:
             chk.check_value(evt_val, self)
         if not hasattr(evt, "old_value"):
             evt.old_value = self._data
+        for s in self.root._snapshots:
+            s._save(self)
         await self.set(evt_val)
         self.tock = evt.tock
 
         server.drop_old_event(evt.event, self.chain)
         self.chain = evt.event
+        self._changed()
 
         if evt_val is NotGiven:
             self.mark_deleted(server)
 
-        for n, t in self.chain_links():
-            n.seen(t, self)
+        if seen is None:
+            for n, t in self.chain_links():
+                n.seen(t, self)
+        else:
+            for n, t in self.chain_links():
+                seen[n][t] = self
         await self.updated(evt)
 
-    async def walk(self, proc, acl=None, max_depth=-1, min_depth=0, _depth=0, full=False):
+    async def walk(
+        self, proc, acl=None, max_depth=-1, min_depth=0, _depth=0, full=False, sub_range=None
+    ):
         """
         Call coroutine ``proc`` on this node and all its children).
 
@@ -937,6 +1174,10 @@ class Entry:
         the acl as second argument.
 
         If `proc` raises `StopAsyncIteration`, chop this subtree.
+
+        If `sub_range` is given, it contains arguments to :meth:`sub_range`
+        which select this node's children. Their subtrees are walked in
+        sorted order.
         """
         if min_depth <= _depth:
             try:
@@ -949,31 +1190,40 @@ class Entry:
         if max_depth == _depth:
             return
         _depth += 1
-        for k, v in list(self._sub.items()):
+        if sub_range is not None:
+            items = list(self.sub_range(full=full, **sub_range))
+        else:
+            items = list(self._sub.items())
+        for k, v in items:
             if k is None and not full:
                 continue
             a = acl.step(k) if acl is not None else None
             await v.walk(proc, acl=a, max_depth=max_depth, min_depth=min_depth, _depth=_depth)
 
-    def serialize(self, chop_path=0, nchain=2, conv=None):
+    def serialize(self, chop_path=0, nchain=2, conv=None, snapshot=None):
         """Serialize this entry for msgpack.
 
         Args:
           ``chop_path``: If <0, do not return the entry's path.
                          Otherwise, do, but remove the first N entries.
           ``nchain``: how many change events to include.
+          ``snapshot``: a :class:`Snapshot` to take the entry's state from.
         """
         if conv is None:
             global ConvNull
             if ConvNull is None:
                 from .types import ConvNull  # pylint: disable=redefined-outer-name
             conv = ConvNull
+        if snapshot is None:
+            data, tock, chain = self._data, self.tock, self.chain
+        else:
+            data, tock, chain = snapshot.state(self)
         res = attrdict()
-        if self._data is not NotGiven:
-            res.value = conv.enc_value(self._data, entry=self)
-        if self.chain is not None and nchain != 0:
-            res.chain = self.chain.serialize(nchain=nchain)
-        res.tock = self.tock
+        if data is not NotGiven:
+            res.value = conv.enc_value(data, entry=self)
+        if chain is not None and nchain != 0:
+            res.chain = chain.serialize(nchain=nchain)
+        res.tock = tock
         if chop_path >= 0:
             path = self.path
             if chop_path > 0:
@@ -986,11 +1236,16 @@ class Entry:
         node = self
         while True:
             bad = set()
-            for q in list(node.monitors):
-                if q._distkv__free is None or q._distkv__free > 1:
+            for q in list(node.monitors or ()):
+                w = q._distkv__lag
+                if w is not None and w.lagging:
+                    w._lag_add(event)
+                elif q._distkv__free is None or q._distkv__free > 1:
                     if q._distkv__free is not None:
                         q._distkv__free -= 1
                     await q.put(event)
+                elif w is not None:
+                    w._lag_add(event)
                 else:
                     bad.add(q)
             for q in bad:
@@ -1007,8 +1262,6 @@ class Entry:
             if node is None:
                 break
 
-    _counter = 0
-
     @property
     def counter(self):
         self._counter += 1
@@ -1018,6 +1271,114 @@ class Entry:
 Entry.SUBTYPE = Entry
 
 
+class Snapshot:
+    """
+    A consistent view of all entries of ``entry``'s tree, as of the time
+    this context manager was entered.
+
+    While a snapshot is active, an entry's state is saved before it is
+    first changed, and entries deleted meanwhile are not removed from the
+    tree. Thus a walk through the tree, which yields to other tasks and may
+    take a while, can report what the tree looked like when it started,
+    while updates proceed normally.
+
+    Snapshots are registered with the tree's root. Each change costs
+    memory while a snapshot is active, so don't keep one for long.
+
+    Usage::
+
+        with Snapshot(root) as snap:
+
+            async def proc(entry):
+                if snap.data(entry) is NotGiven:
+                    return
+                await send(entry.serialize(snapshot=snap))
+
+            await root.walk(proc)
+    """
+
+    def __init__(self, entry: Entry):
+        self._root = entry.root
+        self._old = None
+        self._purged = []  # entries to remove from the tree when we're done
+
+    def __enter__(self):
+        if self._old is not None:
+            raise RuntimeError("You cannot enter this context more than once")
+        self._old = {}
+        root = self._root
+        if not root._snapshots:
+            root._snapshots = set()
+        root._snapshots.add(self)
+        return self
+
+    def __exit__(self, *tb):
+        snaps = self._root._snapshots
+        snaps.discard(self)
+        self._old = None
+        purged, self._purged = self._purged, []
+        for entry in purged:
+            if entry.chain is not None or entry._data is not NotGiven:
+                continue  # re-used
+            for s in snaps:
+                if id(entry) in s._old:
+                    s._purged.append(entry)
+                    break
+            else:
+                entry._chop()
+
+    def _save(self, entry: Entry):
+        """Called before ``entry`` is changed."""
+        # keyed by ID because entries compare by name; the value keeps the
+        # entry alive, thus its ID can't be re-used
+        if id(entry) not in self._old:
+            self._old[id(entry)] = (entry, entry._data, entry.tock, entry.chain)
+
+    def state(self, entry: Entry):
+        """
+        Return the ``(data, tock, chain)`` of this entry, as of the time
+        the snapshot was taken.
+        """
+        try:
+            _, data, tock, chain = self._old[id(entry)]
+        except KeyError:
+            return entry._data, entry.tock, entry.chain
+        return data, tock, chain
+
+    def data(self, entry: Entry):
+        """Return the entry's data, as of the time the snapshot was taken."""
+        return self.state(entry)[0]
+
+    def __len__(self):
+        """The number of entries that changed since the snapshot was taken."""
+        return len(self._old)
+
+
+class ResyncEvent:
+    """Reports the current state of an entry to a :class:`Watcher` which
+    could not keep up.
+    """
+
+    __slots__ = ("entry", "packed")
+
+    def __init__(self, entry: Entry):
+        self.entry = entry
+        self.packed = None
+
+    def __repr__(self):
+        return "<%s:%r>" % (self.__class__.__name__, self.entry)
+
+
+def _common_parent(a: Entry, b: Entry) -> Entry:
+    seen = set()
+    while a is not None:
+        seen.add(id(a))
+        a = a.parent
+    while id(b) not in seen:
+        b = b.parent
+    return b
+
+
 class Watcher:
     """
     This helper class is used as an async context manager plus async
@@ -1025,28 +1386,139 @@ class Watcher:
 
     If a watcher terminates, sending to its channel has blocked.
     The receiver needs to take appropriate re-syncing action.
+
+    If ``q_len`` is zero, the watcher never terminates; instead, writers
+    block when the queue is full. The queue's size is ``q_buf``, which
+    defaults to zero, i.e. each update is handed to the reader directly.
+
+    If ``lag_len`` is set, the watcher doesn't terminate when its queue is
+    full. Instead, further updates are collapsed: only the last one for
+    each entry is kept. If that affects more than ``lag_len`` entries,
+    they are discarded; when the reader catches up, it gets a
+    :class:`ResyncEvent` for each entry (below the entries' common
+    parent) which changed since then. Entries which have been deleted in
+    the meantime are reported first, as they might have been purged from
+    the tree; the others follow in no particular order.
     """
 
     root: Entry = None
     q = None
     q_len = 100
-
-    def __init__(self, root: Entry, full: bool = False, q_len: int = None):
+    q_buf = 0
+    lag_len = None
+
+    def __init__(
+        self,
+        root: Entry,
+        full: bool = False,
+        q_len: int = None,
+        q_buf: int = None,
+        lag_len: int = None,
+    ):
         self.root = root
         self.full = full
         if q_len is not None:
             self.q_len = q_len
+        if q_buf is not None:
+            self.q_buf = q_buf
+        if lag_len is not None:
+            self.lag_len = lag_len
+        self._lag = {}  # id(entry) > UpdateEvent
+        self._resync = None  # (entry, tock)
+        self._deleted = {}  # id(entry) > entry, deleted while resyncing
+        self._walk = None  # (root, todo, tock, done): the resync in progress
+        self._resync_q = deque()
+        self.n_lagged = 0
+        self.n_resynced = 0
+
+    @property
+    def lagging(self) -> bool:
+        """Flag whether updates are not queued because the reader is behind."""
+        if self._lag or self._resync_q:
+            return True
+        return self._resync is not None or self._walk is not None
+
+    def _add_deleted(self, entry: Entry):
+        if entry.data is not NotGiven:
+            return
+        # The entry may be purged before the resync reaches it.
+        # Its path must survive that.
+        entry.path  # pylint: disable=pointless-statement
+        self._deleted[id(entry)] = entry
+
+    def _lag_add(self, event: UpdateEvent):
+        entry = event.entry
+        if self._resync is not None:
+            root, tock = self._resync
+            self._resync = (_common_parent(root, entry), min(tock, entry.tock or 0))
+            self._add_deleted(entry)
+            return
+        lag = self._lag
+        if not lag:
+            self.n_lagged += 1
+        lag.pop(id(entry), None)
+        lag[id(entry)] = event
+        if len(lag) <= self.lag_len:
+            return
+
+        root, tock = entry, entry.tock or 0
+        for evt in lag.values():
+            root = _common_parent(root, evt.entry)
+            tock = min(tock, evt.entry.tock or 0)
+            self._add_deleted(evt.entry)
+        lag.clear()
+        if self._walk is not None:
+            # restart the resync that's in progress
+            root = _common_parent(root, self._walk[0])
+            tock = min(tock, self._walk[2])
+            self._walk = None
+        self._resync = (root, tock)
+        self.n_resynced += 1
+        logger.info("Watcher %r: resync %r from %d", self.root, root, tock)
+
+    def _start_resync(self):
+        root, tock = self._resync
+        self._resync = None
+        deleted, self._deleted = self._deleted, {}
+        done = set()
+        for entry in deleted.values():
+            if entry.data is NotGiven:
+                self._resync_q.append(ResyncEvent(entry))
+                done.add(id(entry))
+        self._walk = (root, [root], tock, done)
+
+    async def _resync_step(self):
+        """
+        Visit the next :data:`RESYNC_STEP` entries of the resync walk.
+        """
+        _root, todo, tock, done = self._walk
+        n = RESYNC_STEP
+        while todo and n:
+            n -= 1
+            entry = todo.pop()
+            if (entry.tock or 0) >= tock and id(entry) not in done:
+                self._resync_q.append(ResyncEvent(entry))
+            todo.extend(entry.values())
+        if not todo:
+            self._walk = None
+        await anyio.sleep(0)
 
     async def __aenter__(self):
         if self.q is not None:
             raise RuntimeError("You cannot enter this context more than once")
-        self.q = create_queue(self.q_len)
+        self.q = create_queue(self.q_len or self.q_buf)
         self.q._distkv__free = self.q_len or None
+        self.q._distkv__lag = self if self.q_len and self.lag_len else None
+        if self.root.monitors is None:
+            self.root.monitors = set()
         self.root.monitors.add(self.q)
         return self
 
     async def __aexit__(self, *tb):
-        self.root.monitors.remove(self.q)
+        monitors = self.root.monitors
+        monitors.remove(self.q)
+        if not monitors:
+            self.root.monitors = None
         self.q = None
 
     def __aiter__(self):
@@ -1058,11 +1530,32 @@ class Watcher:
         if self.q is None:
             raise RuntimeError("Aborted. Queue filled?")
         while True:
-            res = await self.q.get()
-            if self.q._distkv__free is not None:
-                self.q._distkv__free += 1
+            if self.lagging and not self.q.qsize():
+                # all of these are newer than the queue's content
+                if self._resync_q:
+                    res = self._resync_q.popleft()
+                elif self._lag:
+                    res = self._lag.pop(next(iter(self._lag)))
+                elif self._walk is not None:
+                    await self._resync_step()
+                    continue
+                else:
+                    self._start_resync()
+                    continue
+            else:
+                res = await self.q.get()
+                if self.q._distkv__free is not None:
+                    self.q._distkv__free += 1
             if res is None:
                 raise RuntimeError("Aborted. Queue filled?")
             if len(res.entry.path) and res.entry.path[0] is None and not self.full:
                 continue
             return res
+
+    def pending(self) -> int:
+        """
+        Returns the number of updates that can be read without blocking.
+        """
+        if self.q is None:
+            return 0
+        return self.q.qsize() + len(self._resync_q) + len(self._lag)
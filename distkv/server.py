@@ -26,6 +26,7 @@ except ImportError:
 
 
 from distmqtt.utils import create_queue
+from msgpack import ExtType, Packer
 
 try:
     ClosedResourceError = anyio.exceptions.ClosedResourceError
@@ -35,9 +36,10 @@ except AttributeError:
     ExceptionGroup = anyio.ExceptionGroup
 
 try:
-    from contextlib import asynccontextmanager
+    from contextlib import asynccontextmanager, AsyncExitStack
 except ImportError:
     from async_generator import asynccontextmanager
+    from async_exit_stack import AsyncExitStack
 from typing import Any, Dict
 from range_set import RangeSet
 from functools import partial
@@ -45,19 +47,34 @@ from asyncactor import Actor, GoodNodeEvent, RecoverEvent, RawMsgEvent
 from asyncactor import TagEvent, UntagEvent, DetagEvent
 from asyncactor.backend import get_transport
 from pprint import pformat
+from collections import deque, defaultdict
 from collections.abc import Mapping
 
-from .model import NodeEvent, Node, Watcher, UpdateEvent, NodeSet
-from .types import RootEntry, ConvNull, NullACL, ACLFinder, ACLStepper
+from .model import NodeEvent, Node, Watcher, UpdateEvent, NodeSet, Entry, Snapshot
+from .model import chain_digest
+from .types import RootEntry, ConvNull, NullACL, ACLFinder, ACLStepper, plain_conv
 from .actor.deletor import DeleteActor
 from .default import CFG
-from .codec import packer, unpacker, stream_unpacker
+from .codec import (
+    packer,
+    unpacker,
+    opaque_unpacker,
+    stream_unpacker,
+    opaque_stream_unpacker,
+    expand,
+    Chunker,
+    Compressor,
+    CHUNK_EXT,
+)
+from .codec import compress_methods
+from .snapshot import is_snapshot, pack_snapshot, SnapshotReader
 from .backend import get_backend
 from .util import (
     attrdict,
     PathShortener,
     PathLongener,
     MsgWriter,
+    BackgroundMsgWriter,
     MsgReader,
     combine_dict,
     drop_dict,
@@ -92,6 +109,8 @@ _client_nr = 0
 
 SERF_MAXLEN = 450
 SERF_LEN_DELTA = 15
+MQTT_MAXLEN = 60000
+WATCH_BUF = 100  # updates that may be queued for broadcasting
 
 
 def max_n(a, b):
@@ -113,6 +132,19 @@ def cmp_n(a, b):
     return b - a
 
 
+def sub_range(msg):
+    """
+    Collect the child selection arguments (``start``, ``end``, ``after``
+    and ``limit``) from a message, or return ``None`` if there are none.
+    """
+    res = {}
+    for k in ("start", "end", "after", "limit"):
+        v = msg.get(k, NotGiven)
+        if v is not NotGiven:
+            res[k] = v
+    return res or None
+
+
 class StreamCommand:
     """Represent the execution of a streamed command.
 
@@ -125,12 +157,18 @@ class StreamCommand:
     Selection of outgoing multiline-or-not must be done beforehand,
     by setting ``.multiline``: either statically in a subclass, or
     overriding ``__call__``.
+
+    If the request contains a ``credit`` value, multiline replies are
+    flow controlled: the command may send that many messages, and then
+    waits until the client grants more by sending ``credit`` messages.
     """
 
     multiline = False
     send_q = None
     _scope = None
     end_msg = None
+    _credit = None
+    _credit_evt = None
 
     def __new__(cls, client, msg):
         if cls is StreamCommand:
@@ -145,10 +183,21 @@ class StreamCommand:
         self.seq = msg.seq
         self.in_q = create_queue(1)
         self.client.in_stream[self.seq] = self
+        self._credit = msg.get("credit", None)
 
     async def received(self, msg):
         """Receive another message from the client"""
 
+        credit = msg.get("credit", None)
+        if credit is not None:
+            # flow control. Must not block.
+            if self._credit is not None:
+                self._credit += credit
+                evt, self._credit_evt = self._credit_evt, None
+                if evt is not None:
+                    await evt.set()  # wakes all waiters
+            return
+
         s = msg.get("state", "")
         err = msg.get("error", None)
         if err:
@@ -174,10 +223,23 @@ class StreamCommand:
             raise ClientError(msg.error)
         return msg
 
+    async def _use_credit(self):
+        """Wait until the client has granted credit for a message."""
+        if self._credit is None:
+            return
+        while self._credit <= 0:
+            # More than one task may wait, e.g. a watch's initial dump
+            # and its updates; they share the event.
+            if self._credit_evt is None:
+                self._credit_evt = anyio.create_event()
+            await self._credit_evt.wait()
+        self._credit -= 1
+
     async def send(self, **msg):
         """Send a message to the client.
 
-        TODO add a rate limit
+        If flow control is active, this waits for the client to grant
+        credit. Errors and state messages are not counted.
         """
         msg["seq"] = self.seq
         if not self.multiline:
@@ -186,12 +248,33 @@ class StreamCommand:
             self.multiline = None
         elif self.multiline == -1:
             raise RuntimeError("Can't explicitly send in simple interaction")
+        elif "error" not in msg and msg.get("state") not in ("start", "end"):
+            await self._use_credit()
         try:
-            await self.client.send(msg)
+            # The final message flushes the buffer.
+            buffered = bool(self.multiline) and msg.get("state") != "end"
+            await self.client.send(msg, buffered=buffered)
+        except (ClosedResourceError, trioBrokenResourceError):
+            self.client.logger.info("OERR %d", self.client._client_nr)
+
+    async def send_packed(self, data: bytes):
+        """Send an already-packed message of a multiline reply.
+
+        The message must contain this command's ``seq``.
+        """
+        await self._use_credit()
+        try:
+            await self.client.send_packed(data)
         except (ClosedResourceError, trioBrokenResourceError):
             self.client.logger.info("OERR %d", self.client._client_nr)
 
     async def __call__(self, **kw):
+        try:
+            return await self._call(**kw)
+        finally:
+            self.client.in_stream.pop(self.seq, None)
+
+    async def _call(self, **kw):
         msg = self.msg
         if msg.get("state") != "start":
             # single message
@@ -441,6 +524,9 @@ class SCmd_get_tree(StreamCommand):
     min_depth: tree depth at which to start returning results. Default 0=path location.
     max_depth: tree depth at which to not go deeper. Default +inf=everything.
     nchain: number of change chain entries to return. Default 0=don't send chain data.
+    start, end, after, limit: restrict to these children of ``path``.
+    consistent: report the state of the tree when the command started;
+      later updates are not included. Default False.
 
     The returned data is PathShortened.
     """
@@ -473,11 +559,17 @@ class SCmd_get_tree(StreamCommand):
         if min_depth is not None:
             kw["min_depth"] = min_depth
         kw["full"] = empty
+        kw["sub_range"] = sub_range(msg)
+
+        snap = None
 
         async def send_sub(entry, acl):
-            if entry.data is NotGiven and not empty:
+            data = entry.data if snap is None else snap.data(entry)
+            if data is NotGiven and not empty:
                 return
-            res = entry.serialize(chop_path=client._chop_path, nchain=nchain, conv=conv)
+            res = entry.serialize(
+                chop_path=client._chop_path, nchain=nchain, conv=conv, snapshot=snap
+            )
             if not acl.allows("r"):
                 res.pop("value", None)
             ps(res)
@@ -488,7 +580,11 @@ class SCmd_get_tree(StreamCommand):
             if not acl.allows("x"):
                 acl.block("r")
 
-        await entry.walk(send_sub, acl=acl, **kw)
+        if msg.get("consistent", False):
+            with Snapshot(entry) as snap:
+                await entry.walk(send_sub, acl=acl, **kw)
+        else:
+            await entry.walk(send_sub, acl=acl, **kw)
 
 
 class SCmd_get_tree_internal(SCmd_get_tree):
@@ -525,7 +621,8 @@ class SCmd_watch(StreamCommand):
         min_depth = msg.get("min_depth", 0)
         empty = msg.get("add_empty", False)
 
-        async with Watcher(entry) as watcher:
+        lag_len = client.server.cfg.server.conn.watch_lag or None
+        async with Watcher(entry, lag_len=lag_len) as watcher:
             async with anyio.create_task_group() as tg:
                 tock = client.server.tock
                 shorter = PathShortener(entry.path)
@@ -556,6 +653,10 @@ class SCmd_watch(StreamCommand):
 
                     await tg.spawn(orig_state)
 
+                # the message is a map: our seq, the (shortened) path, and the entry's data
+                seq = packer("seq") + packer(self.seq)
+                chop = client._chop_path
+
                 async for m in watcher:
                     ml = len(m.entry.path) - len(msg.path)
                     if ml < min_depth:
@@ -570,13 +671,41 @@ class SCmd_watch(StreamCommand):
                             a.block("r")
                         a = a.step(p)
                     else:
-                        res = m.entry.serialize(
-                            chop_path=client._chop_path, nchain=nchain, conv=conv
-                        )
-                        shorter(res)
-                        if not a.allows("r"):
-                            res.pop("value", None)
-                        await self.send(**res)
+                        n, data = _pack_update(m, nchain, conv, a.allows("r"))
+                        path = {"path": m.entry.path[chop:] if chop else m.entry.path}
+                        shorter(path)
+                        n += 1 + len(path)
+                        path = b"".join(packer(k) + packer(v) for k, v in path.items())
+                        await self.send_packed(_map_header(n) + seq + path + data)
+
+
+_map_header = Packer().pack_map_header
+
+
+def _pack_update(m, nchain, conv, readable):
+    """
+    Serialize and pack the entry that the update ``m`` refers to, except
+    for its path, as a sequence of msgpack map items.
+
+    Watchers that use the same arguments share the result, so each update
+    is serialized and packed once, not once per watcher. The cache is
+    discarded when the entry changes.
+
+    Returns the number of items and their packed form.
+    """
+    entry = m.entry
+    cache = m.packed
+    if cache is None or cache[0] != entry.tock:
+        m.packed = cache = (entry.tock, {})
+    key = (nchain, id(conv), readable)
+    res = cache[1].get(key, None)
+    if res is None or res[0] is not conv:
+        data = entry.serialize(chop_path=-1, nchain=nchain, conv=conv)
+        if not readable:
+            data.pop("value", None)
+        res = (conv, len(data), b"".join(packer(k) + packer(v) for k, v in data.items()))
+        cache[1][key] = res
+    return res[1], res[2]
 
 
 class SCmd_msg_monitor(StreamCommand):
@@ -625,7 +754,9 @@ class ServerClient:
     _user = None  # user during auth
     user = None  # authorized user
     _dh_key = None
-    conv = ConvNull
+    _compress = None
+    _conv = ConvNull
+    opaque = False  # the client can read opaque values
     acl: ACLStepper = NullACL
     tg = None
 
@@ -639,6 +770,17 @@ class ServerClient:
         self._chop_path = 0
         self._send_lock = anyio.create_lock()
 
+        cfg = server.cfg.server.conn
+        self._buflen = cfg.buflen
+        self._max_pending = cfg.max_pending
+        self._max_queued = cfg.max_queued
+        self._n_pending = 0  # simple commands running
+        self._queued = deque()  # simple commands waiting for a slot
+        self._dequeued = None  # set when the queue gets shorter
+        self._send_buflen = cfg.send_buflen
+        self._send_buf = bytearray()
+        self._flush_evt = None
+
         global _client_nr
         _client_nr += 1
         self._client_nr = _client_nr
@@ -664,46 +806,89 @@ class ServerClient:
         res["seq"] = msg.seq
         await self.send(res)
 
-    async def process(self, msg, evt=None):
+    def _dispatch(self, msg):
         """
-        Process an incoming message.
+        Set up processing of an incoming message.
+
+        This runs synchronously in the reader loop, so that a streamed
+        command is registered (and cancellable) before the next message
+        is looked at.
+
+        Returns the procedure to run and the cancel scope to run it in.
         """
         needAuth = self.user is None or self._user is not None
         self.logger.debug("IN_%d %s", self._client_nr, msg)
 
-        seq = msg.seq
-        async with anyio.open_cancel_scope() as s:
-            self.tasks[seq] = s
-            if "chain" in msg:
-                msg.chain = NodeEvent.deserialize(msg.chain, cache=self.server.node_cache)
-
-            fn = None
-            if msg.get("state", "") != "start":
-                fn = getattr(self, "cmd_" + str(msg.action), None)
-            if fn is None:
-                fn = StreamCommand(self, msg)
-                if needAuth and not getattr(fn, "noAuth", False):
-                    raise NoAuthError()
-            else:
-                if needAuth and not getattr(fn, "noAuth", False):
-                    raise NoAuthError()
-                fn = partial(self._process, fn, msg)
-            if evt is not None:
-                await evt.set()
+        if "chain" in msg:
+            msg.chain = NodeEvent.deserialize(msg.chain, cache=self.server.node_cache)
+
+        fn = None
+        if msg.get("state", "") != "start":
+            fn = getattr(self, "cmd_" + str(msg.action), None)
+        if fn is None:
+            fn = StreamCommand(self, msg)
+            if needAuth and not getattr(fn, "noAuth", False):
+                raise NoAuthError()
+        else:
+            if needAuth and not getattr(fn, "noAuth", False):
+                raise NoAuthError()
+            fn = partial(self._process, fn, msg)
 
-            try:
+        s = anyio.open_cancel_scope()
+        self.tasks[msg.seq] = s
+        return fn, s
+
+    async def process(self, msg, fn, scope, pending=False):
+        """
+        Process an incoming message.
+
+        Args:
+          msg: the message.
+          fn: the procedure to run, as returned by :meth:`_dispatch`.
+          scope: the cancel scope to run it in.
+          pending: this is a simple command. When it ends, start the
+            next queued one.
+        """
+        seq = msg.seq
+        try:
+            async with scope:
                 await fn()
 
-            except BrokenPipeError as exc:
-                self.logger.info("ERR%d: %s", self._client_nr, repr(exc))
+        except BrokenPipeError as exc:
+            self.logger.info("ERR%d: %s", self._client_nr, repr(exc))
 
-            except Exception as exc:
-                if not isinstance(exc, ClientError):
-                    self.logger.exception("ERR%d: %s", self._client_nr, repr(msg))
-                await self.send({"error": str(exc), "seq": seq})
+        except Exception as exc:
+            if not isinstance(exc, ClientError):
+                self.logger.exception("ERR%d: %s", self._client_nr, repr(msg))
+            await self.send({"error": str(exc), "seq": seq})
 
-            finally:
-                del self.tasks[seq]
+        finally:
+            del self.tasks[seq]
+            if pending:
+                await self._next_pending()
+
+    async def _start_pending(self, msg, fn, scope):
+        """
+        Run a simple command if a slot is free, else queue it.
+        """
+        if self._n_pending < self._max_pending:
+            self._n_pending += 1
+            await self.tg.spawn(self.process, msg, fn, scope, True)
+        else:
+            self._queued.append((msg, fn, scope))
+
+    async def _next_pending(self):
+        """
+        A simple command has ended: start the next queued one.
+        """
+        if not self._queued:
+            self._n_pending -= 1
+            return
+        msg, fn, scope = self._queued.popleft()
+        await self.tg.spawn(self.process, msg, fn, scope, True)
+        evt, self._dequeued = self._dequeued, None
+        if evt is not None:
+            await evt.set()
 
     def _chroot(self, root):
         if not root:
@@ -795,6 +980,32 @@ class ServerClient:
     async def cmd_delete_internal(self, msg):
         return await self.cmd_delete_value(msg, root=self.metaroot)
 
+    async def cmd_get_digest(self, msg, _nulls_ok=None, root=None):
+        """Get the digests of a subtree and of its children.
+
+        Servers use this to find the parts of their trees that differ.
+
+        Returns the entry's ``digest``, the :func:`chain_digest` of the
+        entry itself as ``own``, and a list of (name, digest, nr of
+        children) tuples in ``sub``.
+        """
+        if _nulls_ok is None:
+            _nulls_ok = self.nulls_ok
+        if root is None:
+            root = self.root
+        entry, _ = root.follow_acl(
+            msg.path, create=False, acl=self.acl, acl_key="e", nulls_ok=_nulls_ok
+        )
+        sub = [(k, v.digest, len(v)) for k, v in entry.items() if k is not None]
+        return {
+            "digest": entry.digest,
+            "own": chain_digest(entry.name, entry.chain),
+            "sub": sub,
+        }
+
+    async def cmd_get_digest_internal(self, msg):
+        return await self.cmd_get_digest(msg, root=self.metaroot, _nulls_ok=True)
+
     async def cmd_get_tock(self, msg):  # pylint: disable=unused-argument
         return {"tock": self.server.tock}
 
@@ -830,6 +1041,10 @@ class ServerClient:
 
     async def cmd_enum(self, msg, with_data=None, _nulls_ok=None, root=None):
         """Get all sub-nodes.
+
+        If any of ``start``, ``end``, ``after`` or ``limit`` are given, the
+        sub-nodes are returned in sorted order. ``limit`` applies to the
+        number of results.
         """
         if root is None:
             root = self.root
@@ -839,22 +1054,33 @@ class ServerClient:
             msg.path, acl=self.acl, acl_key="e", create=False, nulls_ok=_nulls_ok
         )
         empty = msg.get("empty", False)
+        rng = sub_range(msg)
+        limit = None
+        if rng is None:
+            items = entry.items()
+        else:
+            limit = rng.pop("limit", None)
+            items = entry.sub_range(**rng)
         if with_data:
             res = {}
-            for k, v in entry.items():
+            for k, v in items:
                 a = acl.step(k)
                 if a.allows("r"):
                     if v.data is not NotGiven and acl.allows("x"):
                         res[k] = self.conv.enc_value(v.data, entry=v)
                     elif empty:
                         res[k] = None
+                if limit is not None and len(res) >= limit:
+                    break
         else:
             res = []
-            for k, v in entry.items():
+            for k, v in items:
                 if empty or v.data is not NotGiven:
                     a = acl.step(k)
                     if a.allows("e"):
                         res.append(k)
+                        if limit is not None and len(res) >= limit:
+                            break
         return {"result": res}
 
     cmd_enumerate = cmd_enum  # backwards compat: XXX remove
@@ -914,7 +1140,58 @@ class ServerClient:
 
         return await self._set_value(msg, **kw)
 
-    async def _set_value(self, msg, value=NotGiven, root=None, _nulls_ok=False):
+    async def cmd_set_many(self, msg):
+        """Set (or delete) multiple values.
+
+        ``items`` is a list of mappings with the same fields as
+        ``set_value`` (or ``delete_value``, if there's no value). Each
+        item's ``nchain`` defaults to the message's.
+
+        All items are checked before any of them is changed. If one of the
+        checks fails, nothing is modified. However, if the command is
+        interrupted while the changes are applied (e.g. because the client
+        disconnects), only some of them may have been processed.
+
+        Returns a list of results, one for each item.
+        """
+        items = msg.get("items", ())
+        nchain = msg.get("nchain", 1)
+        todo = []
+        paths = set()
+        for item in items:
+            if item.path in paths:
+                raise ClientError(f"Duplicate path: {item.path}")
+            paths.add(item.path)
+            if "nchain" not in item:
+                item.nchain = nchain
+            if "chain" in item:
+                item.chain = NodeEvent.deserialize(item.chain, cache=self.server.node_cache)
+            todo.append((item, self._prep_value(item, item.get("value", NotGiven))))
+
+        n = sum(1 for _, (entry, _, _) in todo if entry is not None)
+        if n:
+            async with self.server.next_events(n) as events:
+                for _, (entry, value, _) in todo:
+                    if entry is None:
+                        continue
+                    await entry.set_data(
+                        events[0], value, server=self.server, tock=self.server.tock
+                    )
+                    events.popleft()
+        return {
+            "results": [
+                res if entry is None else self._set_result(item, entry, res)
+                for item, (entry, _, res) in todo
+            ]
+        }
+
+    def _prep_value(self, msg, value=NotGiven, root=None, _nulls_ok=False):
+        """
+        Check whether a value may be set.
+
+        Returns the entry to modify, the decoded value, and the (partial)
+        result. If the entry is ``None``, the value doesn't need to be set.
+        """
         # TODO drop this as soon as we have server-side user mods
         if self.user.is_super_root and root is None:
             _nulls_ok = 2
@@ -942,7 +1219,7 @@ class ServerClient:
             res = attrdict(tock=entry.tock, changed=False)
             if nchain > 0:
                 res.chain = entry.chain.serialize(nchain=nchain)
-            return res
+            return None, NotGiven, res
 
         if "prev" in msg:
             if entry.data != msg.prev:
@@ -964,25 +1241,31 @@ class ServerClient:
         if value is NotGiven:
             res.changed = entry.data is not NotGiven
         else:
-            res.changed = entry.data != value
+            res.changed = entry.data is NotGiven or entry.data != value
         if send_prev and entry.data is not NotGiven:
             res.prev = self.conv.enc_value(entry.data, entry=entry)
 
-        nchain = msg.get("nchain", 1)
         value = msg.get("value", NotGiven)
-        async with self.server.next_event() as event:
-            await entry.set_data(
-                event,
-                NotGiven if value is NotGiven else self.conv.dec_value(value, entry=entry),
-                server=self.server,
-                tock=self.server.tock,
-            )
+        if value is not NotGiven:
+            value = self.conv.dec_value(value, entry=entry)
+        return entry, value, res
+
+    def _set_result(self, msg, entry, res):
+        nchain = msg.get("nchain", 1)
         if nchain != 0:
             res.chain = entry.chain.serialize(nchain=nchain)
         res.tock = entry.tock
-
         return res
 
+    async def _set_value(self, msg, value=NotGiven, root=None, _nulls_ok=False):
+        entry, value, res = self._prep_value(msg, value, root=root, _nulls_ok=_nulls_ok)
+        if entry is None:
+            return res
+
+        async with self.server.next_event() as event:
+            await entry.set_data(event, value, server=self.server, tock=self.server.tock)
+        return self._set_result(msg, entry, res)
+
     async def cmd_update(self, msg):
         """
         Apply a stored update.
@@ -1076,12 +1359,16 @@ class ServerClient:
             return {"changed": res}
 
     async def cmd_log(self, msg):
-        await self.server.run_saver(path=msg.path, save_state=msg.get("fetch", False))
+        await self.server.run_saver(
+            path=msg.get("path", None),
+            save_state=msg.get("fetch", False),
+            snapshot=msg.get("snapshot", False),
+        )
         return True
 
     async def cmd_save(self, msg):
         full = msg.get("full", False)
-        await self.server.save(path=msg.path, full=full)
+        await self.server.save(path=msg.path, full=full, snapshot=msg.get("snapshot", False))
 
         return True
 
@@ -1093,6 +1380,39 @@ class ServerClient:
         await t.cancel()
         return True
 
+    @property
+    def conv(self):
+        """
+        The client's converter. Opaque values are decoded for clients
+        that can't read them.
+        """
+        if self.opaque:
+            return self._conv
+        return plain_conv(self._conv)
+
+    @conv.setter
+    def conv(self, conv):
+        self._conv = conv
+
+    async def cmd_set_opaque(self, msg):  # pylint: disable=unused-argument
+        """
+        The client can read opaque values, so don't decode them.
+        """
+        self.opaque = True
+
+    cmd_set_opaque.noAuth = True
+
+    async def cmd_set_compress(self, msg):
+        """
+        Compress replies with this method, if they're long enough.
+
+        The client must not use this unless the server's greeting lists
+        the method.
+        """
+        self._compress = Compressor(msg.method)
+
+    cmd_set_compress.noAuth = True
+
     async def cmd_set_auth_typ(self, msg):
         if not self.user.is_super_root:
             raise RuntimeError("You're not allowed to do that")
@@ -1112,24 +1432,88 @@ class ServerClient:
         msg.path = (None, "auth")
         return await self.cmd_set_value(msg, _nulls_ok=True)
 
-    async def send(self, msg):
+    async def send(self, msg, buffered=False):
+        """
+        Send a message to the client.
+
+        Buffered messages are collected and written when the buffer is
+        full, when an unbuffered message is sent, or when the connection
+        is otherwise idle.
+        """
         self.logger.debug("OUT%d %s", self._client_nr, msg)
         if self._send_lock is None:
             return
+        if buffered:
+            if "tock" not in msg:
+                msg["tock"] = self.server.tock
+            await self.send_packed(packer(msg))
+            return
+        await self._flush(msg)
+
+    async def send_packed(self, data: bytes):
+        """
+        Buffer an already-packed message. It must contain a ``tock``.
+        """
+        if self._send_lock is None:
+            return
+        self._send_buf += data
+        if len(self._send_buf) < self._send_buflen:
+            if self._flush_evt is not None:
+                await self._flush_evt.set()
+            return
+        await self._flush()
+
+    async def _flush(self, msg=None):
+        """
+        Write the send buffer, plus ``msg`` if given, to the client.
+        """
         async with self._send_lock:
             if self._send_lock is None:
                 # yes this can happen, when the connection is torn down
                 return
 
-            if "tock" not in msg:
-                msg["tock"] = self.server.tock
+            if msg is not None:
+                if "tock" not in msg:
+                    msg["tock"] = self.server.tock
+                self._send_buf += packer(msg)
+            buf, self._send_buf = self._send_buf, bytearray()
+            if not buf:
+                return
+            if self._compress is not None:
+                buf = self._compress.block(buf)
             try:
-                await self.stream.send_all(packer(msg))
+                await self.stream.send_all(buf)
             except (ClosedResourceError, trioBrokenResourceError):
                 self.logger.info("ERO%d %r", self._client_nr, msg)
                 self._send_lock = None
                 raise
 
+    async def _flusher(self):
+        """
+        Write buffered messages when nobody adds more of them.
+        """
+        while True:
+            # Data may have been added while we flushed the last batch;
+            # its producer has set the previous event, not a new one.
+            if not self._send_buf:
+                self._flush_evt = evt = anyio.create_event()
+                await evt.wait()
+                self._flush_evt = None
+
+            # Let the producers run until they're blocked or done,
+            # but don't delay the data indefinitely.
+            for _ in range(10):
+                n = len(self._send_buf)
+                await anyio.sleep(0)
+                if n == len(self._send_buf):
+                    break
+            try:
+                await self._flush()
+            except (ClosedResourceError, trioBrokenResourceError):
+                return
+            if self._send_lock is None:
+                return
+
     async def send_result(self, seq, res):
         res["seq"] = seq
         if "tock" in res:
@@ -1140,16 +1524,22 @@ class ServerClient:
 
     async def run(self):
         """Main loop for this client connection."""
-        unpacker_ = stream_unpacker()  # pylint: disable=redefined-outer-name
+        # values are only decoded if the server needs to look at them
+        opaque = self.server.cfg.server.opaque
+        unpacker_ = (opaque_stream_unpacker if opaque else stream_unpacker)()
 
         async with anyio.create_task_group() as tg:
             self.tg = tg
+            await tg.spawn(self._flusher)
             msg = {
                 "seq": 0,
                 "version": _version_tuple,
                 "node": self.server.node.name,
                 "tick": self.server.node.tick,
                 "tock": self.server.tock,
+                "credit": True,  # we understand flow control
+                "compress": compress_methods(),
+                "opaque": self.server.cfg.server.opaque,  # we can store values undecoded
             }
             try:
                 auth = self.root.follow(Path(None, "auth"), nulls_ok=True, create=False)
@@ -1175,17 +1565,31 @@ class ServerClient:
             await self.send(msg)
 
             while True:
-                for msg in unpacker_:
+                # Pipelining: every complete message in the buffer is
+                # dispatched before we read again. The number of simple
+                # commands that run concurrently is limited by
+                # ``max_pending``; excess commands are queued without a
+                # task and started in order when a slot frees up. The
+                # dispatcher never waits, because messages for running
+                # streams (including flow control) must not be held up.
+                # Streamed commands may run indefinitely (think "watch"),
+                # so they don't count.
+                for msg in expand(unpacker_, opaque=opaque):
                     seq = None
                     try:
                         seq = msg.seq
                         send_q = self.in_stream.get(seq, None)
                         if send_q is not None:
                             await send_q.received(msg)
+                        elif "credit" in msg and "action" not in msg:
+                            # flow control for a stream that has ended
+                            pass
                         else:
-                            evt = anyio.create_event()
-                            await self.tg.spawn(self.process, msg, evt)
-                            await evt.wait()
+                            fn, scope = self._dispatch(msg)
+                            if isinstance(fn, StreamCommand):
+                                await self.tg.spawn(self.process, msg, fn, scope)
+                            else:
+                                await self._start_pending(msg, fn, scope)
                     except Exception as exc:
                         msg = {"error": str(exc)}
                         if isinstance(exc, ClientError):  # pylint doesn't seem to see this, so …:
@@ -1199,8 +1603,15 @@ class ServerClient:
                             msg["seq"] = seq
                         await self.send(msg)
 
+                # Backpressure: don't read more while too many commands
+                # are queued. Running commands don't depend on the
+                # client, so the queue always drains.
+                while len(self._queued) >= self._max_queued:
+                    self._dequeued = anyio.create_event()
+                    await self._dequeued.wait()
+
                 try:
-                    buf = await self.stream.receive_some(4096)
+                    buf = await self.stream.receive_some(self._buflen)
                 except (ConnectionResetError, trioBrokenResourceError):
                     self.logger.info("DEAD %d", self._client_nr)
                     break
@@ -1326,8 +1737,10 @@ class Server:
             self.cfg.server.root = Path.build(self.cfg.server.root)
 
         self.paranoid_root = self.root if self.cfg.server.paranoia else None
+        self._unpack = opaque_unpacker if self.cfg.server.opaque else unpacker
 
         self._nodes: Dict[str, Node] = {}
+        self._pinged = set()  # nodes we've seen pinging
         self.node_drop = set()
         self.node = Node(name, None, cache=self.node_cache)
 
@@ -1342,10 +1755,18 @@ class Server:
         # connected clients
         self._clients = set()
 
-        # cache for partial messages
-        self._part_len = SERF_MAXLEN - SERF_LEN_DELTA - len(self.node.name)
+        # splitting and reassembling messages that are too long
+        ck = self.cfg.server.chunk
+        msg_len = ck.max_len
+        if not msg_len:
+            serf = self.cfg.server.get("backend", None) == "serf"
+            msg_len = SERF_MAXLEN if serf else MQTT_MAXLEN
+        self._chunker = Chunker(self.node.name, msg_len, timeout=ck.timeout, max_size=ck.max_size)
+        self._zip = Compressor(ck.compress) if ck.compress else None
+        self._part_len = msg_len - SERF_LEN_DELTA - len(self.node.name)
+        self._batch_len = min(self.cfg.server.batch.max_len or SERF_MAXLEN, msg_len)
+        self._batch_len -= SERF_LEN_DELTA + len(self.node.name)
         self._part_seq = 0
-        self._part_cache = dict()
 
         self._savers = []
 
@@ -1399,22 +1820,44 @@ class Server:
         needs to be marked as deleted if incomplete. Otherwise the system
         sees it as "lost" data.
         """
+        async with self.next_events(1) as events:
+            yield events[0]
+
+    @asynccontextmanager
+    async def next_events(self, n: int):
+        """A context manager which returns a list of the next ``n`` events
+        under a single lock.
+
+        The actor is only updated once, thus this is a lot cheaper than
+        calling :meth:`next_event` ``n`` times.
+
+        The events are returned in a deque. The caller should remove each
+        event from it (``popleft``) after it has been used successfully.
+        If the context is left with an exception, the events that are
+        still in the deque are marked as deleted.
+        """
         async with self._evt_lock:
-            n = None
+            events = None
             try:
-                self.node.tick += 1
                 nt = self.node.tick
+                self.node.tick += n
                 self._tock += 1
                 await self._set_tock()  # updates actor
-                n = NodeEvent(self.node)
-                yield n
+                events = deque(NodeEvent(self.node, tick=t) for t in range(nt + 1, nt + n + 1))
+                yield events
             except BaseException as exc:
-                if n is not None:
-                    self.logger.warning("Deletion %s %d due to %r", self.node, n.tick, exc)
-                    self.node.report_deleted(RangeSet((nt,)), self)
+                if events:
+                    deleted = RangeSet(evt.tick for evt in events)
+                    self.logger.warning("Deletion %s %r due to %r", self.node, deleted, exc)
+                    self.node.report_deleted(deleted, self)
                     async with anyio.move_on_after(2, shield=True):
                         await self._send_event(
-                            "info", dict(node="", tick=0, deleted={self.node.name: (nt,)})
+                            "info",
+                            dict(
+                                node="",
+                                tick=0,
+                                deleted={self.node.name: deleted.__getstate__()},
+                            ),
                         )
                 raise
             finally:
@@ -1504,16 +1947,59 @@ class Server:
     async def watcher(self):
         """
         The background task that watches a (sub)tree for changes.
+
+        If ``server.batch.enabled`` is set, updates that are already queued
+        when one is processed are broadcast as a single message, as long as
+        the result fits into ``server.batch.max_len``, or the backend's
+        size limit. If ``server.batch.delay`` is set, updates are collected
+        for that many seconds before the batch is sent. Older servers can't
+        process these messages.
         """
-        async with Watcher(self.root, q_len=0, full=True) as watch:
+        nchain = self.cfg.server.change.length
+        batching = self.cfg.server.batch.enabled
+        delay = self.cfg.server.batch.delay if batching else 0
+        async with Watcher(self.root, q_len=0, q_buf=WATCH_BUF, full=True) as watch:
             async for msg in watch:
-                self.logger.debug("Watch: %r", msg)
-                if msg.event.node != self.node:
-                    continue
-                if self.node.tick is None:
-                    continue
-                p = msg.serialize(nchain=self.cfg.server.change.length)
-                await self._send_event("update", p)
+                batch = []
+                blen = 0
+                while True:
+                    self.logger.debug("Watch: %r", msg)
+                    if msg.event.node == self.node and self.node.tick is not None:
+                        p = msg.serialize(nchain=nchain)
+                        if not batching:
+                            await self._send_event("update", p)
+                        else:
+                            if batch or delay or watch.pending():
+                                plen = len(packer(p))
+                                if batch and blen + plen > self._batch_len:
+                                    await self._send_update(batch)
+                                    batch = []
+                                    blen = 0
+                                blen += plen
+                            if not batch and delay:
+                                t_end = await anyio.current_time() + delay
+                            batch.append(p)
+                    if not watch.pending():
+                        if not batch or not delay:
+                            break
+                        # wait for more updates, but not too long
+                        msg = None
+                        t_wait = t_end - await anyio.current_time()
+                        if t_wait > 0:
+                            async with anyio.move_on_after(t_wait):
+                                msg = await watch.__anext__()
+                        if msg is None:
+                            break
+                    else:
+                        msg = await watch.__anext__()
+                if batch:
+                    await self._send_update(batch)
+
+    async def _send_update(self, batch):
+        if len(batch) == 1:
+            await self._send_event("update", batch[0])
+        else:
+            await self._send_event("update", dict(batch=batch))
 
     async def resync_deleted(self, nodes):
         """
@@ -1599,6 +2085,7 @@ class Server:
         debug=False,
         debugger=False,
         remote_missing=False,
+        chunks=False,
         **_kw,
     ):
         """
@@ -1646,6 +2133,8 @@ class Server:
                     nd[n.name] = lk.__getstate__()
         if node_drop:
             res.node_drop = list(self.node_drop)
+        if chunks:
+            res.chunks = attrdict(self._chunker.stats, incomplete=self._chunker.incomplete)
         if debug:
             nd = res.debug = attrdict()
             # TODO insert some debugging info
@@ -1665,9 +2154,14 @@ class Server:
     async def user_update(self, msg):
         """
         Process an update message: deserialize it and apply the result.
+        A message may contain a ``batch`` of updates.
         """
-        msg = UpdateEvent.deserialize(self.root, msg, cache=self.node_cache, nulls_ok=True)
-        await msg.entry.apply(msg, server=self, root=self.paranoid_root)
+        batch = msg.get("batch", None)
+        if batch is None:
+            batch = (msg,)
+        for m in batch:
+            m = UpdateEvent.deserialize(self.root, m, cache=self.node_cache, nulls_ok=True)
+            await m.entry.apply(m, server=self, root=self.paranoid_root)
 
     async def user_info(self, msg):
         """
@@ -1757,9 +2251,17 @@ class Server:
 
     def _pack_multiple(self, msg):
         """
+        Pack a message, splitting it into multiple parts if it is too long
+        for the backend.
+
+        If ``server.chunk.compress`` is set, long messages are compressed
+        first.
+
+        If ``server.chunk.ext`` is set, parts are msgpack extension objects
+        (see `distkv.codec.Chunker`). Otherwise they're ``_p0`` mappings,
+        which older servers understand.
         """
         # protect against mistakenly encoded multi-part messages
-        # TODO use a msgpack extension instead
         if isinstance(msg, Mapping):
             i = 0
             while (f"_p{i}") in msg:
@@ -1772,9 +2274,15 @@ class Server:
                 msg["_p0"] = ""
 
         p = packer(msg)
-        pl = self._part_len
-        if len(p) > SERF_MAXLEN:
+        if self._zip is not None:
+            p = self._zip.pack(p)
+        if len(p) <= self._chunker.max_len:
+            yield p
+        elif self.cfg.server.chunk.ext:
+            yield from self._chunker.split(p)
+        else:
             # Owch. We need to split this thing.
+            pl = self._part_len
             self._part_seq = seq = self._part_seq + 1
             i = 0
             while i >= 0:
@@ -1784,32 +2292,32 @@ class Server:
                     i = -i
                 px = {"_p0": (self.node.name, seq, i, px)}
                 yield packer(px)
-            return
-        yield p
 
     def _unpack_multiple(self, msg):
         """
         Undo the effects of _pack_multiple.
+
+        Returns ``None`` if parts of the message are still missing.
         """
 
+        if isinstance(msg, ExtType):
+            if msg.code != CHUNK_EXT:
+                return None
+            p = self._chunker.feed(msg)
+            if p is None:
+                return None
+            return self._unpack_multiple(self._unpack(p))
+
         if isinstance(msg, Mapping) and "_p0" in msg:
             p = msg["_p0"]
             if p != "":
                 nn, seq, i, p = p
-                s = self._part_cache.get((nn, seq), None)
-                if s is None:
-                    self._part_cache[(nn, seq)] = s = [None]
-                if i < 0:
-                    i = -i
-                    s[0] = b""
-                while len(s) <= i:
-                    s.append(None)
-                s[i] = p
-                if None in s:
+                # the last part has a negative index
+                n = -i if i < 0 else None
+                p = self._chunker.add((nn, seq), abs(i) - 1, n, p)
+                if p is None:
                     return None
-                p = b"".join(s)
-                del self._part_cache[(nn, seq)]
-                msg = unpacker(p)
+                msg = self._unpack(p)
                 msg["_p0"] = ""
 
             i = 0
@@ -1836,7 +2344,7 @@ class Server:
                     await delay.wait()
 
                 async for resp in stream:
-                    msg = unpacker(resp.payload)
+                    msg = self._unpack(resp.payload)
                     msg = self._unpack_multiple(msg)
                     if not msg:  # None, empty, whatever
                         continue
@@ -1904,6 +2412,8 @@ class Server:
                         msg_node = msg.get("history", (None,))[0]
                         if msg_node is None:
                             continue
+                    self._pinged.add(msg_node)
+                    self._pinged.update(msg.get("history", ()))
                     val = msg.get("value", None)
                     tock = None
                     if val is not None:
@@ -2003,60 +2513,217 @@ class Server:
             await self._check_ticked()
         self.fetch_running = None
 
-    async def fetch_data(self, nodes, authoritative=False):
+    @asynccontextmanager
+    async def _sync_client(self, node):
         """
-        We are newly started and don't have any data.
+        Connect to another node, for syncing.
+        """
+        # The node might not be ready, in which case this would wait.
+        async with anyio.fail_after(self.cfg.connect.init_timeout):
+            host, port = await self._get_host_port(node)
+        cfg = combine_dict(
+            {"host": host, "port": port, "name": self.node.name}, self.cfg.connect, cls=attrdict
+        )
+        auth = cfg.get("auth", None)
+        from .auth import gen_auth
 
-        Try to get the initial data from some other node.
+        cfg["auth"] = gen_auth(auth)
+
+        self.logger.info("Sync: connecting: %s", cfg)
+        async with distkv_client.open_client(connect=cfg) as client:
+            # TODO auth this client
+            yield client
+
+    async def _fetch_tree(
+        self, client, path, seen, internal=False, deleted=False, changed=None, **kw
+    ):
+        """
+        Fetch the subtree at ``path`` from this client and apply it.
+
+        If ``deleted`` is set, deleted entries (as sent when ``add_empty``
+        is used) are applied too. Entries which this changed are appended
+        to the list ``changed``, if given.
+
+        Returns the paths of the entries at ``max_depth`` (if given).
+        """
+        pl = PathLongener((None,) + path if internal else path)
+        res = await client._request(
+            "get_tree_internal" if internal else "get_tree",
+            iter=True,
+            from_server=self.node.name,
+            nchain=-1,
+            path=path,
+            consistent=True,
+            **kw,
+        )
+        max_depth = kw.get("max_depth", None)
+        edge = []
+        async for r in res:
+            pl(r)
+            if max_depth is not None and len(r.path) == len(path) + max_depth:
+                edge.append(r.path)
+            if "value" not in r and not (deleted and "chain" in r):  # add_empty
+                continue
+            r = UpdateEvent.deserialize(self.root, r, cache=self.node_cache, nulls_ok=True)
+            chain = r.entry.chain
+            await r.entry.apply(r, server=self, root=self.paranoid_root, seen=seen)
+            if changed is not None and r.entry.chain is not chain:
+                changed.append(r.entry)
+        await self.tock_seen(res.end_msg.tock)
+        return edge
+
+    @staticmethod
+    def _seen_all(seen):
+        """
+        Record the ticks which :meth:`Entry.apply` collected in ``seen``,
+        except for those which have been superseded since.
+        """
+        for node, entries in seen.items():
+            entries = {t: e for t, e in entries.items() if (node, t) in e.chain_links()}
+            if entries:
+                node.seen_all(entries)
+
+    async def _resync_tree(self, client, seen, changed, internal=False):
+        """
+        Compare our tree with the one on the other side of ``client``,
+        top-down by digest, and fetch the subtrees that differ.
+
+        Entries which the other side doesn't have are ignored; it'll get
+        them from us when it does the same thing. Subtrees that vanish on
+        the other side while we compare are skipped.
+
+        Returns the number of fetch requests.
+        """
+        root = self.root.follow(Path(None), nulls_ok=True) if internal else self.root
+        cmd = "get_digest_internal" if internal else "get_digest"
+        kw = dict(internal=internal, deleted=True, add_empty=True, changed=changed)
+        nr = 0
+
+        async def fetch(path, **k):
+            nonlocal nr
+            nr += 1
+            try:
+                await self._fetch_tree(client, path, seen, **kw, **k)
+            except ServerError as exc:
+                self.logger.info("Resync: skip %r: %r", path, exc)
+
+        todo = [()]
+        while todo:
+            path = todo.pop()
+            try:
+                res = await client._request(cmd, path=path)
+            except ServerError as exc:
+                self.logger.info("Resync: skip %r: %r", path, exc)
+                continue
+            try:
+                entry = root.follow(path, create=False)
+            except KeyError:
+                entry = None
+            if entry is None:  # deleted while we were busy
+                await fetch(path)
+                continue
+            if entry.digest == res.digest:
+                continue
+
+            n_leaves = 0
+            leaves = []
+            for name, digest, size in res.sub:
+                if not size:
+                    n_leaves += 1
+                child = entry._sub.get(name, None)
+                if (0 if child is None else child.digest) == digest:
+                    pass
+                elif child is None and size:
+                    # We don't have any of it.
+                    await fetch(path + (name,))
+                elif size:
+                    todo.append(path + (name,))
+                else:
+                    leaves.append(name)
+
+            if 2 * len(leaves) > n_leaves:
+                # Most leaves differ. Get them all, plus this entry.
+                await fetch(path, max_depth=1)
+                continue
+            if chain_digest(entry.name, entry.chain) != res.own:
+                await fetch(path, max_depth=0)
+            for name in leaves:
+                await fetch(path + (name,), max_depth=0)
+        return nr
+
+    async def _resync(self, nodes):
+        """
+        Fetch whatever differs from the first of these nodes we can reach.
+
+        The entries that changed are then broadcast in the background, for
+        the benefit of the other nodes on our side of the split.
         """
-        if self.fetch_running is not None:
-            return
-        self.fetch_running = True
         for n in nodes:
+            if n == self.node.name:
+                continue
+            seen = defaultdict(dict)
+            changed = []
             try:
-                host, port = await self._get_host_port(n)
-                cfg = combine_dict(
-                    {"host": host, "port": port, "name": self.node.name},
-                    self.cfg.connect,
-                    cls=attrdict,
-                )
-                auth = cfg.get("auth", None)
-                from .auth import gen_auth
+                async with self._sync_client(n) as client:
+                    nr = await self._resync_tree(client, seen, changed)
+                    nr += await self._resync_tree(client, seen, changed, internal=True)
 
-                cfg["auth"] = gen_auth(auth)
+            except (AttributeError, KeyError, ValueError, AssertionError, TypeError):
+                raise
+            except Exception:
+                self.logger.exception("Resync: unable to compare with %s", n)
+                continue
+            finally:
+                self._seen_all(seen)
 
-                self.logger.info("Sync: connecting: %s", cfg)
-                async with distkv_client.open_client(connect=cfg) as client:
-                    # TODO auth this client
+            self.logger.info("Resync: %d fetches from %s, %d changes", nr, n, len(changed))
+            if changed:
+                await self.spawn(self._send_entries, changed)
+            return
 
-                    pl = PathLongener(())
-                    res = await client._request(
-                        "get_tree", iter=True, from_server=self.node.name, nchain=-1, path=()
-                    )
-                    async for r in res:
-                        pl(r)
-                        r = UpdateEvent.deserialize(
-                            self.root, r, cache=self.node_cache, nulls_ok=True
-                        )
-                        await r.entry.apply(r, server=self, root=self.paranoid_root)
-                    await self.tock_seen(res.end_msg.tock)
+    async def _send_entries(self, entries):
+        """
+        Broadcast the current state of these entries.
 
-                    pl = PathLongener((None,))
-                    res = await client._request(
-                        "get_tree_internal",
-                        iter=True,
-                        from_server=self.node.name,
-                        nchain=-1,
-                        path=(),
-                    )
-                    async for r in res:
-                        pl(r)
-                        r = UpdateEvent.deserialize(
-                            self.root, r, cache=self.node_cache, nulls_ok=True
-                        )
-                        await r.entry.apply(r, server=self, root=self.paranoid_root)
-                    await self.tock_seen(res.end_msg.tock)
+        Updates are batched if ``server.batch.enabled`` is set.
+        """
+        nchain = self.cfg.server.change.length
+        batching = self.cfg.server.batch.enabled
+        batch = []
+        blen = 0
+        for entry in entries:
+            p = entry.serialize(nchain=nchain)
+            if not batching:
+                await self._send_event("update", p)
+                continue
+            plen = len(packer(p))
+            if batch and blen + plen > self._batch_len:
+                await self._send_update(batch)
+                batch = []
+                blen = 0
+            blen += plen
+            batch.append(p)
+        if batch:
+            await self._send_update(batch)
+
+    async def _fetch_shards(self, node, client, shards, seen, limiter):
+        """
+        Fetch subtrees from another node until there are none left.
 
+        If ``client`` is ``None``, connect to ``node`` first.
+        """
+        shard = None
+        try:
+            async with limiter:
+                if not shards:
+                    return
+                async with AsyncExitStack() as ex:
+                    if client is None:
+                        client = await ex.enter_async_context(self._sync_client(node))
+                    while shards:
+                        shard = shards.pop()
+                        await self._fetch_tree(client, shard, seen, min_depth=1)
+                        shard = None
                     res = await client._request(
                         "get_state",
                         nodes=True,
@@ -2067,31 +2734,83 @@ class Server:
                     )
                     await self._process_info(res)
 
+        except (AttributeError, KeyError, ValueError, AssertionError, TypeError):
+            raise
+        except Exception:
+            self.logger.exception("Sync: fetching from %s failed", node)
+            if shard is not None:
+                shards.append(shard)
+
+    async def fetch_data(self, nodes, authoritative=False):
+        """
+        We are newly started and don't have any data.
+
+        Try to get the initial data from some other node(s).
+
+        The first node which we can reach sends the entries down to
+        ``server.sync.depth``. The subtrees below these are fetched from
+        up to ``server.sync.peers`` nodes in parallel: those in ``nodes``,
+        then any other node that's up. A node that can't be reached, or
+        fails, is skipped; its work is taken over by the others. Fast
+        nodes thus serve more subtrees than slow ones.
+        """
+        if self.fetch_running is not None:
+            return
+        self.fetch_running = True
+        cfg = self.cfg.server.sync
+        for n in nodes:
+            seen = defaultdict(dict)
+            try:
+                async with self._sync_client(n) as client:
+                    shards = await self._fetch_tree(
+                        client, (), seen, max_depth=cfg.depth, add_empty=True
+                    )
+                    shards = [p for p in shards if p[0] is not None]
+                    shards.reverse()  # we pop() them
+                    await self._fetch_tree(client, (), seen, internal=True)
+
+                    # Also use other nodes that are up, as evidenced by their pings.
+                    peers = [nn for nn in nodes if nn != n]
+                    for nn in self._pinged:
+                        if nn not in peers and nn != n and nn != self.node.name:
+                            peers.append(nn)
+
+                    limiter = anyio.create_capacity_limiter(cfg.peers)
+                    async with anyio.create_task_group() as tg:
+                        await tg.spawn(self._fetch_shards, n, client, shards, seen, limiter)
+                        for nn in peers:
+                            await tg.spawn(self._fetch_shards, nn, None, shards, seen, limiter)
+                    if shards:
+                        raise RuntimeError(f"Sync: {len(shards)} subtrees not fetched")
+
             except (AttributeError, KeyError, ValueError, AssertionError, TypeError):
                 raise
             except Exception:
-                self.logger.exception("Unable to connect to %s:%d", host, port)
-            else:
-                # At this point we successfully cloned some other
-                # node's state, so we now need to find whatever that
-                # node didn't have.
-
-                if authoritative:
-                    # … or not.
-                    self._discard_all_missing()
-                for nst in self._nodes.values():
-                    if nst.tick and len(nst.local_missing):
-                        self.fetch_missing.add(nst)
-                if len(self.fetch_missing):
-                    self.fetch_running = False
-                    self.logger.error("Sync: missing: %s", self.fetch_missing)
-                    await self.spawn(self.do_send_missing)
-                if self.force_startup or not len(self.fetch_missing):
-                    if self.node.tick is None:
-                        self.node.tick = 0
-                    self.fetch_running = None
-                    await self._check_ticked()
-                return
+                self.logger.exception("Sync: unable to fetch from %s", n)
+                continue
+            finally:
+                self._seen_all(seen)
+
+            # At this point we successfully cloned some other
+            # node's state, so we now need to find whatever that
+            # node didn't have.
+
+            if authoritative:
+                # … or not.
+                self._discard_all_missing()
+            for nst in self._nodes.values():
+                if nst.tick and len(nst.local_missing):
+                    self.fetch_missing.add(nst)
+            if len(self.fetch_missing):
+                self.fetch_running = False
+                self.logger.error("Sync: missing: %s", self.fetch_missing)
+                await self.spawn(self.do_send_missing)
+            if self.force_startup or not len(self.fetch_missing):
+                if self.node.tick is None:
+                    self.node.tick = 0
+                self.fetch_running = None
+                await self._check_ticked()
+            return
 
         self.fetch_running = None
 
@@ -2181,6 +2900,11 @@ class Server:
                 await t._start()
                 clock = self.cfg.server.ping.cycle
 
+                # Step 0: fetch the data that differ directly from the other
+                # side, so that there's not much left to do for the rest.
+                if prio == 0 and self.cfg.server.resync.enabled:
+                    await self._resync(sources)
+
                 # Step 1: send an info/ticks message
                 # for prio=0 this fires immediately. That's intentional.
                 async with anyio.move_on_after(clock * (1 - 1 / (1 << prio))) as x:
@@ -2321,6 +3045,9 @@ class Server:
           ``local``: Flag whether this file contains initial data and thus
                      its contents shall not be broadcast. Don't set this if
                      the server is already operational.
+
+        A file (but not a stream) may contain a snapshot, as written by
+        ``save(snapshot=True)``.
         """
         longer = PathLongener(())
 
@@ -2328,29 +3055,87 @@ class Server:
             raise RuntimeError("This server already has data.")
         elif not local and self.node.tick is None:
             raise RuntimeError("This server is not yet operational.")
-        async with MsgReader(path=path, stream=stream) as rdr:
-            async for m in rdr:
-                if "value" in m:
-                    longer(m)
-                    if "tock" in m:
-                        await self.tock_seen(m.tock)
-                    else:
-                        m.tock = self.tock
-                    m = UpdateEvent.deserialize(self.root, m, cache=self.node_cache, nulls_ok=True)
-                    await self.tock_seen(m.tock)
-                    await m.entry.apply(m, server=self, root=self.paranoid_root, loading=True)
-                elif "info" in m:
-                    await self._process_info(m["info"])
-                elif "nodes" in m or "known" in m or "deleted" in m or "tock" in m:  # XXX LEGACY
-                    await self._process_info(m)
-                else:
-                    self.logger.warning("Unknown message in stream: %s", repr(m))
+
+        if path is not None and is_snapshot(path):
+            with SnapshotReader(path) as snap:
+                await self._load_snapshot(snap, local=local)
+                unpack = stream_unpacker()
+                unpack.feed(snap.tail())
+            for m in expand(unpack):
+                await self._load_msg(m, longer)
+        else:
+            async with MsgReader(path=path, stream=stream, mmap=True) as rdr:
+                async for m in rdr:
+                    await self._load_msg(m, longer)
 
         if authoritative:
             self._discard_all_missing()
 
         self.logger.debug("Loading finished.")
 
+    async def _load_msg(self, m, longer):
+        if "value" in m:
+            longer(m)
+            if "tock" in m:
+                await self.tock_seen(m.tock)
+            else:
+                m.tock = self.tock
+            m = UpdateEvent.deserialize(self.root, m, cache=self.node_cache, nulls_ok=True)
+            await self.tock_seen(m.tock)
+            await m.entry.apply(m, server=self, root=self.paranoid_root, loading=True)
+        elif "info" in m:
+            await self._process_info(m["info"])
+        elif "nodes" in m or "known" in m or "deleted" in m or "tock" in m:  # XXX LEGACY
+            await self._process_info(m)
+        else:
+            self.logger.warning("Unknown message in stream: %s", repr(m))
+
+    async def _load_snapshot(self, snap, local=False):
+        """
+        Load the entries of a snapshot.
+
+        If ``local`` is set and we're not paranoid, plain entries are
+        filled in directly. Otherwise, or if the entry's class has its
+        own ``set`` method, the entry is updated as usual.
+        """
+        await self._process_info(snap.info)
+        nodes = [Node(n, cache=self.node_cache) for n in snap.nodes]
+        bulk = local and self.paranoid_root is None
+        seen = {n: {} for n in nodes}
+
+        stack = [self.root]
+        for depth, names, chain, tock, value in snap:
+            del stack[depth + 1 :]  # noqa: E203
+            entry = stack[-1]
+            for name in names:
+                child = entry._sub.get(name, None)
+                if child is None:
+                    child = entry.SUBTYPES.get(name, entry.SUBTYPE)
+                    if child is None:
+                        raise ValueError(f"Cannot add {name} to {entry}")
+                    child = child(name, entry, tock=entry.tock)
+                stack.append(child)
+                entry = child
+
+            event = None
+            for i in range(len(chain) - 2, -1, -2):
+                event = NodeEvent(nodes[chain[i]], tick=chain[i + 1], prev=event)
+
+            if bulk and entry.chain is None and type(entry).set is Entry.set:
+                entry._data = value
+                entry.tock = tock
+                entry.chain = event
+                entry._changed()
+                for n, t in entry.chain_links():
+                    seen[n][t] = entry
+            else:
+                evt = UpdateEvent(event, entry, value, tock=tock)
+                await entry.apply(evt, server=self, root=self.paranoid_root, loading=True)
+
+        for n, entries in seen.items():
+            if entries:
+                n.seen_all(entries)
+
     def _discard_all_missing(self):
         for n in self._nodes.values():
             if not n.tick:
@@ -2362,25 +3147,50 @@ class Server:
 
     async def _save(self, writer, shorter, nchain=-1, full=False):
         """Save the current state.
+
+        The entries are saved as of the time this method is called;
+        updates that arrive while it runs are not included.
         """
 
+        n = 0
+
         async def saver(entry):
-            if entry.data is NotGiven:
+            nonlocal n
+            if snap.data(entry) is NotGiven:
                 return
-            res = entry.serialize(nchain=nchain)
+            res = entry.serialize(nchain=nchain, snapshot=snap)
             shorter(res)
             await writer(res)
+            n += 1
+            if not n % 100:
+                # let updates proceed; they don't affect the snapshot
+                await anyio.sleep(0)
 
-        msg = await self.get_state(nodes=True, known=True, deleted=True)
-        # await writer({"info": msg})
-        await writer(msg)  # XXX legacy
-        await self.root.walk(saver, full=full)
+        with Snapshot(self.root) as snap:
+            msg = await self.get_state(nodes=True, known=True, deleted=True)
+            # await writer({"info": msg})
+            await writer(msg)  # XXX legacy
+            await self.root.walk(saver, full=full)
 
-    async def save(self, path: str = None, stream=None, full=True):
-        """Save the current state to ``path`` or ``stream``."""
-        shorter = PathShortener([])
-        async with MsgWriter(path=path, stream=stream) as mw:
-            await self._save(mw, shorter, full=full)
+    async def _save_snapshot(self, writer, full=False):
+        """Save the current state as a snapshot."""
+        with Snapshot(self.root) as snap:
+            msg = await self.get_state(nodes=True, known=True, deleted=True)
+            data = await pack_snapshot(msg, self.root, full=full, snapshot=snap)
+        await writer.write_raw(data)
+
+    async def save(self, path: str = None, stream=None, full=True, snapshot=False):
+        """Save the current state to ``path`` or ``stream``.
+
+        If ``snapshot`` is set, use the binary format from
+        :mod:`distkv.snapshot`, which loads a lot faster.
+        """
+        compress = self.cfg.server.save.compress
+        async with MsgWriter(path=path, stream=stream, compress=compress) as mw:
+            if snapshot:
+                await self._save_snapshot(mw, full=full)
+            else:
+                await self._save(mw, PathShortener([]), full=full)
 
     async def save_stream(
         self,
@@ -2389,6 +3199,8 @@ class Server:
         save_state: bool = False,
         done: ValueEvent = None,
         done_val=None,
+        snapshot: bool = False,
+        rotate: bool = False,
     ):
         """Save the current state to ``path`` or ``stream``.
         Continue writing updates until cancelled.
@@ -2400,28 +3212,63 @@ class Server:
             If ``False`` (the default), only write changes.
           done: set when writing changes commences, signalling
             that the old save file (if any) may safely be closed.
+          snapshot: Flag whether to write the current state as a snapshot.
+          rotate: Write the current state to a temporary file, then
+            atomically rename it to ``path``.
 
         Exactly one of ``stream`` or ``path`` must be set.
 
-        This task flushes the current buffer to disk when one second
+        When saving to a file, writing happens in a separate thread, as
+        configured by ``server.save``: see :class:`distkv.util.BackgroundMsgWriter`.
+
+        Otherwise this task flushes the current buffer when one second
         passes without updates, or every 100 messages.
+
+        If ``server.save.compact.enabled`` is set, a file which starts
+        with the current state is compacted when it grows too large:
+        a new saver writes the then-current state to a new file which
+        replaces this one. Thus the file stays proportional to the size
+        of the data, as does the time required to load it.
         """
         shorter = PathShortener([])
+        cfg = self.cfg.server.save
+        compact_at = None
 
-        async with MsgWriter(path=path, stream=stream) as mw:
-            msg = await self.get_state(nodes=True, known=True, deleted=True)
-            # await mw({"info": msg})
-            await mw(msg)  # XXX legacy
+        snapshot = snapshot and save_state
+        if path is not None:
+            mw = BackgroundMsgWriter(
+                path=path + ".new" if rotate else path,
+                count=cfg.count,
+                delay=cfg.delay,
+                sync=cfg.sync,
+                max_pending=cfg.max_pending,
+                compress=cfg.compress,
+            )
+            flush_every = None  # the writer takes care of that
+        else:
+            mw = MsgWriter(stream=stream, compress=cfg.compress)
+            flush_every = 100
+        async with mw:
+            if not snapshot:  # the snapshot must be at the start of the file
+                msg = await self.get_state(nodes=True, known=True, deleted=True)
+                # await mw({"info": msg})
+                await mw(msg)  # XXX legacy
             last_saved = time.monotonic()
             last_saved_count = 0
 
             async with Watcher(self.root, full=True) as updates:
                 await self._ready.wait()
 
-                if save_state:
+                if snapshot:
+                    await self._save_snapshot(mw, full=True)
+                elif save_state:
                     await self._save(mw, shorter, full=True)
 
                 await mw.flush()
+                if rotate:
+                    os.replace(mw.path, path)
+                if path is not None and save_state and cfg.compact.enabled:
+                    compact_at = max(cfg.compact.min_size, cfg.compact.factor * mw.size)
                 if done is not None:
                     await done.set(done_val)
 
@@ -2451,14 +3298,39 @@ class Server:
                         shorter(msg)
                         last_saved_count += 1
                         await mw(msg)
-                        if cnt >= 100:
-                            await mw.flush()
-                            cnt = 0
-                        else:
-                            cnt += 1
+                        if compact_at is not None and mw.size > compact_at:
+                            self.logger.info("Compacting %s", path)
+                            compact_at = None
+                            await self.spawn(self._compact_log, path, snapshot)
+                        if flush_every is not None:
+                            if cnt >= flush_every:
+                                await mw.flush()
+                                cnt = 0
+                            else:
+                                cnt += 1
+
+    async def _compact_log(self, path, snapshot):
+        """
+        Replace the log at ``path`` with one that starts with the current
+        state. The old saver continues if that fails.
+        """
+        try:
+            await self.run_saver(path=path, save_state=True, snapshot=snapshot, rotate=True)
+        except EnvironmentError:
+            self.logger.exception("Compacting %s", path)
+            try:
+                os.unlink(path + ".new")
+            except EnvironmentError:
+                pass
 
     async def _saver(
-        self, path: str = None, stream=None, done: ValueEvent = None, save_state=False
+        self,
+        path: str = None,
+        stream=None,
+        done: ValueEvent = None,
+        save_state=False,
+        snapshot=False,
+        rotate=False,
     ):
 
         async with anyio.open_cancel_scope() as s:
@@ -2467,7 +3339,13 @@ class Server:
             self._savers.append(state)
             try:
                 await self.save_stream(
-                    path=path, stream=stream, done=done, done_val=s, save_state=save_state
+                    path=path,
+                    stream=stream,
+                    done=done,
+                    done_val=s,
+                    save_state=save_state,
+                    snapshot=snapshot,
+                    rotate=rotate,
                 )
             except EnvironmentError as err:
                 if done is None:
@@ -2477,7 +3355,15 @@ class Server:
                 async with anyio.open_cancel_scope(shield=True):
                     await sd.set()
 
-    async def run_saver(self, path: str = None, stream=None, save_state=False, wait: bool = True):
+    async def run_saver(
+        self,
+        path: str = None,
+        stream=None,
+        save_state=False,
+        wait: bool = True,
+        snapshot: bool = False,
+        rotate: bool = False,
+    ):
         """
         Start a task that continually saves to disk.
 
@@ -2492,19 +3378,31 @@ class Server:
           save_state (bool): Flag whether to write the current state.
             If ``False`` (the default), only write changes.
           wait: wait for the save to really start.
+          snapshot (bool): Flag whether to write the current state as a
+            snapshot.
+          rotate (bool): Write to a temporary file which replaces ``path``
+            when the current state has been written.
 
         """
         done = ValueEvent() if wait else None
         res = None
         if path is not None:
             await self.spawn(
-                partial(self._saver, path=path, stream=stream, save_state=save_state, done=done)
+                partial(
+                    self._saver,
+                    path=path,
+                    stream=stream,
+                    save_state=save_state,
+                    done=done,
+                    snapshot=snapshot,
+                    rotate=rotate,
+                )
             )
             if wait:
                 res = await done.get()
 
         # At this point the new saver is operational, so we cancel the old one(s).
-        while self._savers is not None and self._savers[0][0] is not res:
+        while self._savers and self._savers[0][0] is not res:
             s, sd = self._savers.pop(0)
             await s.cancel()
             await sd.wait()
@@ -0,0 +1,210 @@
+"""
+This module contains DistKV's binary snapshot format.
+
+A snapshot stores the complete state of a server. Unlike a stream of
+MsgPack records, which must be replayed one update at a time, it can be
+loaded without building and applying an update event for each entry.
+
+The file starts with a fixed-size header (see ``HEADER``), followed by
+these regions, each of which is a single MsgPack object:
+
+* info: the server's state, as returned by ``Server.get_state``.
+* nodes: a list of the node names used in the chains.
+* paths: one ``(depth, names)`` tuple per entry, in sorted order.
+  ``depth`` is the number of path elements shared with the previous
+  entry, ``names`` are the remaining ones (as in :class:`PathShortener`).
+* chains: one tuple per entry. It contains the entry's chain as a flat
+  sequence of node index and tick.
+* tocks: one tock per entry.
+* values: one value per entry.
+
+Entries without a value are not stored.
+
+The snapshot may be followed by a stream of ordinary MsgPack records,
+typically changes logged after the snapshot was written.
+"""
+
+import anyio
+import mmap
+import struct
+
+from .codec import packer, unpacker
+from .model import Snapshot, sort_key
+from .util import NotGiven
+
+__all__ = ["MAGIC", "is_snapshot", "pack_snapshot", "SnapshotReader"]
+
+MAGIC = b"DistKVs\x01"
+VERSION = 1
+
+# magic, version, number of entries, length of each region
+HEADER = struct.Struct("<8sIQ6Q")
+
+
+def is_snapshot(path) -> bool:
+    """Check whether the file at ``path`` contains a snapshot."""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _entries(root, full, snapshot):
+    """
+    Yield (path, (data, tock, chain)) for all entries with data below
+    ``root``, in sorted order, as of the time ``snapshot`` was taken.
+
+    The ``None`` subtree is only included if ``full`` is set.
+    """
+    todo = [((), root)]
+    while todo:
+        path, entry = todo.pop()
+        state = snapshot.state(entry)
+        if state[0] is not NotGiven:
+            yield path, state
+        if not len(entry):
+            continue
+        sub = sorted(entry.items(), key=lambda kv: sort_key(kv[0]), reverse=True)
+        for name, child in sub:
+            if name is None and not (full and not path):
+                continue
+            todo.append((path + (name,), child))
+
+
+async def pack_snapshot(info: dict, root, full: bool = False, snapshot=None) -> bytes:
+    """
+    Build a snapshot of the tree at ``root``, with server state ``info``.
+
+    The entries are packed as of the time ``snapshot``, a
+    :class:`distkv.model.Snapshot`, was taken. If it's not given, one is
+    taken when this function starts. Other tasks may change the tree
+    meanwhile.
+    """
+    if snapshot is None:
+        with Snapshot(root) as snapshot:
+            return await pack_snapshot(info, root, full=full, snapshot=snapshot)
+
+    nodes = {}
+    paths = []
+    chains = []
+    tocks = []
+    values = []
+
+    last = ()
+    for path, (data, tock, chain) in _entries(root, full, snapshot):
+        d = 0
+        for a, b in zip(last, path):
+            if a != b:
+                break
+            d += 1
+        paths.append((d, path[d:]))
+        last = path
+
+        links = []
+        for node, tick in () if chain is None else chain:
+            try:
+                n = nodes[node.name]
+            except KeyError:
+                n = nodes[node.name] = len(nodes)
+            links.append(n)
+            links.append(tick)
+        chains.append(links)
+        tocks.append(tock)
+        values.append(data)
+        if not len(paths) % 100:
+            # let updates proceed; they don't affect the snapshot
+            await anyio.sleep(0)
+
+    regions = [packer(x) for x in (info, list(nodes), paths, chains, tocks, values)]
+    header = HEADER.pack(MAGIC, VERSION, len(paths), *(len(r) for r in regions))
+    return b"".join([header] + regions)
+
+
+class SnapshotReader:
+    """
+    Read a snapshot file.
+
+    The file is memory-mapped; the MsgPack decoder reads each region
+    directly from the map.
+
+    Usage::
+
+        with SnapshotReader(path) as snap:
+            process_info(snap.info)
+            for depth, names, chain, tock, value in snap:
+                ...
+            process_more(snap.tail())
+
+    Attributes:
+      info: the server state stored with the snapshot.
+      nodes: the node names used in the chains.
+      n_entries: the number of entries.
+    """
+
+    info = None
+    nodes = None
+    n_entries = 0
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._map = None
+        self._regions = None
+        self._end = None
+
+    def __enter__(self):
+        self._file = open(self.path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._read_header()
+        except BaseException:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *tb):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _read_header(self):
+        if len(self._map) < HEADER.size:
+            raise ValueError(f"{self.path}: not a snapshot")
+        magic, version, self.n_entries, *lengths = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path}: not a snapshot")
+        if version != VERSION:
+            raise ValueError(f"{self.path}: snapshot version {version} is not supported")
+
+        regions = []
+        pos = HEADER.size
+        for n in lengths:
+            regions.append((pos, pos + n))
+            pos += n
+        if pos > len(self._map):
+            raise ValueError(f"{self.path}: snapshot is truncated")
+        self._regions = regions
+        self._end = pos
+
+        self.info = self._region(0)
+        self.nodes = self._region(1)
+
+    def _region(self, n):
+        a, b = self._regions[n]
+        with memoryview(self._map) as m:
+            return unpacker(m[a:b])
+
+    def __iter__(self):
+        """
+        Yield a (depth, names, chain, tock, value) tuple for each entry.
+        """
+        paths, chains, tocks, values = (self._region(n) for n in range(2, 6))
+        if not (len(paths) == len(chains) == len(tocks) == len(values) == self.n_entries):
+            raise ValueError(f"{self.path}: snapshot is inconsistent")
+        for (depth, names), chain, tock, value in zip(paths, chains, tocks, values):
+            yield depth, names, chain, tock, value
+
+    def tail(self) -> bytes:
+        """
+        Return the data following the snapshot.
+        """
+        return self._map[self._end :]  # noqa: E203
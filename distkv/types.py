@@ -2,6 +2,7 @@ import weakref
 import jsonschema
 
 from .model import Entry
+from .codec import opaque_decode
 from .util import make_proc, NotGiven, singleton, Path, P
 from .exceptions import ClientError, ACLError
 
@@ -9,6 +10,8 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+FIND_CACHE_MAX = 100000  # entries whose match/conv/ACL node MetaPathEntry remembers
+
 # TYPES
 
 
@@ -22,6 +25,15 @@ class MetaEntry(Entry):
         "Stores a link to the meta root because some do need it."
         return self._metaroot()
 
+    async def set(self, value):
+        await super().set(value)
+        self.metaroot.generation += 1
+
+    def mark_deleted(self, server):
+        res = super().mark_deleted(server)
+        self.metaroot.generation += 1
+        return res
+
 
 class TypeEntry(Entry):
     """I am a type-checking node.
@@ -112,11 +124,12 @@ class MatchEntry(MetaEntry):
             value.type = P(value.type)
         elif not isinstance(value.type, (Path, list, tuple)):
             raise ValueError("Type of %r is not a list" % (value.type,))
-        try:
-            self.metaroot["type"].follow(value.type, create=False)
-        except KeyError:
-            logger.exception("Type %r doesn't exist", value.type)
-            raise ClientError("This type does not exist")
+        if value is not NotGiven:
+            try:
+                self.metaroot["type"].follow(value.type, create=False)
+            except KeyError:
+                logger.exception("Type %r doesn't exist", value.type)
+                raise ClientError("This type does not exist")
         # crashes if nonexistent
         await super().set(value)
 
@@ -239,15 +252,32 @@ class NullACL(ACLStepper):
 
 
 class MetaPathEntry(MetaEntry):
+    _found = None  # path (as a tuple) > node
+    _found_gen = None
+
     def _find_node(self, entry):
         """Search for the most-specific match.
 
         Match entries whose values are missing are not considered.
+
+        Results are remembered until something in the meta tree changes.
         """
+        gen = self.metaroot.generation
+        found = self._found
+        if self._found_gen != gen or len(found) >= FIND_CACHE_MAX:
+            self._found = found = {}
+            self._found_gen = gen
+        path = entry.path._data
+        try:
+            return found[path]
+        except KeyError:
+            pass
+
         f = NodeFinder(self)
-        for n in entry.path:
+        for n in path:
             f.step(n)
-        return f.result
+        found[path] = res = f.result
+        return res
 
 
 class MatchRoot(MetaPathEntry):
@@ -266,7 +296,7 @@ class MatchRoot(MetaPathEntry):
         if match is None:
             return
         typ = self.parent["type"].follow(match._data["type"])
-        return typ.check_value(value, entry=entry, match=match, **kv)
+        return typ.check_value(opaque_decode(value), entry=entry, match=match, **kv)
 
 
 class CodecEntry(Entry):
@@ -278,6 +308,7 @@ class CodecEntry(Entry):
 
     def enc_value(self, value, entry=None, **kv):
         if self._enc is not None:
+            value = opaque_decode(value)
             try:
                 value = self._enc(value, entry=entry, data=self._data, **kv)
             except TypeError:
@@ -287,6 +318,7 @@ class CodecEntry(Entry):
 
     def dec_value(self, value, entry=None, **kv):
         if self._dec is not None:
+            value = opaque_decode(value)
             try:
                 value = self._dec(value, entry=entry, data=self._data, **kv)
             except TypeError:
@@ -396,6 +428,34 @@ class ConvNull:
 ConvNull = ConvNull()
 
 
+class _ConvPlain:
+    """I decode opaque values after running a converter's encoder"""
+
+    def __init__(self, conv):
+        self.conv = conv
+
+    def enc_value(self, value, **kw):
+        return opaque_decode(self.conv.enc_value(value, **kw))
+
+    def dec_value(self, value, **kw):
+        return self.conv.dec_value(value, **kw)
+
+
+def plain_conv(conv):
+    """
+    Return a converter like ``conv`` that decodes opaque values, for
+    clients that can't read them.
+
+    The result is stored on ``conv``, so that watchers which use the same
+    converter can share serialized updates.
+    """
+    try:
+        return conv._plain_conv
+    except AttributeError:
+        conv._plain_conv = res = _ConvPlain(conv)
+        return res
+
+
 class ConvName(MetaPathEntry):
     """I am a named tree for conversion entries.
     """
@@ -486,7 +546,13 @@ class ActorRoot(Entry):
 
 
 class MetaRootEntry(Entry):  # not MetaEntry
-    """I am the special node off the DistKV root that's named ``None``."""
+    """I am the special node off the DistKV root that's named ``None``.
+
+    ``generation`` is incremented whenever an entry below the match,
+    conv or ACL subtrees changes.
+    """
+
+    generation = 0
 
     SUBTYPES = {
         "type": TypeRoot,
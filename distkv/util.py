@@ -6,6 +6,9 @@ import anyio
 import sys
 import os
 import re
+import mmap as _mmap
+import threading
+import time
 import asyncclick as click
 
 import attr
@@ -328,6 +331,11 @@ async def acount(it):
     return n
 
 
+MSG_READ_MIN = 65536  # MsgReader: initial read size
+MSG_READ_MAX = 8 << 20  # MsgReader: max read size
+MSG_MAP_CHUNK = 1 << 20  # MsgReader: mmapped data are fed in chunks of this size
+
+
 class _MsgRW:
     """
     Common base class for :class:`MsgReader` and :class:`MsgWriter`.
@@ -368,22 +376,55 @@ class MsgReader(_MsgRW):
                 process(msg)
 
     Arguments:
-      buflen (int): The read buffer size. Defaults to 4k.
+      buflen (int): The read buffer size. By default, the first read is
+        64k; the size doubles while reads fill the buffer, up to 8 MB.
       path (str): the file to write to.
       stream: the stream to write to.
+      mmap (bool): Map the file (``path`` only) into memory instead of
+        reading it. Falls back to reading if that's not possible.
 
     Exactly one of ``path`` and ``stream`` must be used.
+
+    Compressed blocks, as written by :class:`MsgWriter`, are expanded.
     """
 
     _mode = "rb"
+    _map = None
 
-    def __init__(self, *a, buflen=4096, **kw):
+    def __init__(self, *a, buflen=None, mmap=False, **kw):
         super().__init__(*a, **kw)
-        self.buflen = buflen
+        if buflen is None:
+            self.buflen, self.max_buflen = MSG_READ_MIN, MSG_READ_MAX
+        else:
+            self.buflen = self.max_buflen = buflen
+        self.mmap = mmap
+        self._pos = 0
 
-        from .codec import stream_unpacker
+        from .codec import stream_unpacker, expand
 
         self.unpack = stream_unpacker()
+        self._expand = expand
+        self._msgs = iter(())
+
+    async def __aenter__(self):
+        if self.mmap and self.path is not None:
+            try:
+                with open(self.path, "rb") as f:
+                    self._map = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+            except (OSError, ValueError):  # not a plain file, or empty
+                pass
+            else:
+                self._view = memoryview(self._map)
+                return self
+        return await super().__aenter__()
+
+    async def __aexit__(self, *tb):
+        if self._map is None:
+            await super().__aexit__(*tb)
+            return
+        self._view.release()
+        self._map.close()
+        self._map = None
 
     def __aiter__(self):
         return self
@@ -391,16 +432,27 @@ class MsgReader(_MsgRW):
     async def __anext__(self):
         while True:
             try:
-                msg = next(self.unpack)
+                return next(self._msgs)
             except StopIteration:
                 pass
-            else:
-                return msg
+
+            if self._map is not None:
+                pos = self._pos
+                if pos >= len(self._view):
+                    raise StopAsyncIteration
+                self._pos = pos + MSG_MAP_CHUNK
+                self.unpack.feed(self._view[pos : self._pos])  # noqa: E203
+                self._msgs = self._expand(self.unpack)
+                await anyio.sleep(0)
+                continue
 
             d = await self.stream.read(self.buflen)
             if d == b"":
                 raise StopAsyncIteration
+            if len(d) == self.buflen and self.buflen < self.max_buflen:
+                self.buflen *= 2
             self.unpack.feed(d)
+            self._msgs = self._expand(self.unpack)
 
 
 packer = None
@@ -419,6 +471,9 @@ class MsgWriter(_MsgRW):
       buflen (int): The buffer size. Defaults to 64k.
       path (str): the file to write to.
       stream: the stream to write to.
+      compress (str): Compress each buffer's content with this method
+        (see :class:`distkv.codec.Compressor`). :class:`MsgReader`
+        decompresses them.
 
     Exactly one of ``path`` and ``stream`` must be used.
 
@@ -426,8 +481,9 @@ class MsgWriter(_MsgRW):
     """
 
     _mode = "wb"
+    _zip = None
 
-    def __init__(self, *a, buflen=65536, **kw):
+    def __init__(self, *a, buflen=65536, compress=None, **kw):
         super().__init__(*a, **kw)
 
         self.buf = []
@@ -438,21 +494,28 @@ class MsgWriter(_MsgRW):
         global packer  # pylint: disable=global-statement
         if packer is None:
             from .codec import packer  # pylint: disable=redefined-outer-name
+        if compress:
+            from .codec import Compressor
+
+            self._zip = Compressor(compress)
 
     async def __aexit__(self, *tb):
         async with anyio.fail_after(2, shield=True):
-            if self.buf:
-                await self.stream.write(b"".join(self.buf))
+            await self.flush()
             await super().__aexit__(*tb)
 
     async def __call__(self, msg):
         """Write a message (bytes) to the buffer.
 
-        Flushing writes a multiple of ``buflen`` bytes."""
+        Flushing writes a multiple of ``buflen`` bytes, or (if compressing)
+        the whole buffer."""
         msg = packer(msg)  # pylint: disable=not-callable
         self.buf.append(msg)
         self.curlen += len(msg)
-        if self.curlen + self.excess >= self.buflen:
+        if self._zip is not None:
+            if self.curlen >= self.buflen:
+                await self.flush()
+        elif self.curlen + self.excess >= self.buflen:
             buf = b"".join(self.buf)
             pos = self.buflen * int((self.curlen + self.excess) / self.buflen)
             assert pos > 0
@@ -467,9 +530,221 @@ class MsgWriter(_MsgRW):
         if self.buf:
             buf = b"".join(self.buf)
             self.buf = []
+            self.curlen = 0
+            if self._zip is not None:
+                buf = self._zip.block(buf)
             self.excess = (self.excess + len(buf)) % self.buflen
             await self.stream.write(buf)
 
+    async def write_raw(self, data: bytes):
+        """Flush the buffer, then write some already-encoded data."""
+        await self.flush()
+        self.excess = (self.excess + len(data)) % self.buflen
+        await self.stream.write(data)
+
+
+class _Raw(bytes):
+    """Data that `BackgroundMsgWriter` shall not compress."""
+
+
+class BackgroundMsgWriter(MsgWriter):
+    """Write a stream of messages to a file, using a separate I/O thread.
+
+    Messages are encoded in the caller's task, then handed to a thread
+    which writes them to disk. Writes are grouped: a batch is written (and
+    synced to disk, if requested) when ``count`` messages have accumulated
+    or ``delay`` seconds after the first of them was queued, whichever
+    comes first. Thus if the system crashes, at most the last ``count``
+    messages, or those queued during the last ``delay`` seconds, are lost
+    (plus those still waiting for the disk).
+
+    Usage::
+
+        async with BackgroundMsgWriter("/tmp/msgs.pack", sync="fdatasync") as f:
+            async for msg in some_source_of_messages():
+                await f(msg)
+
+    Arguments:
+      path (str): the file to write to.
+      count (int): Commit after this many messages. Defaults to 100.
+      delay (float): Commit this many seconds after the first uncommitted
+        message was queued. Defaults to one second.
+      sync (str): ``"fsync"`` or ``"fdatasync"`` to call the named
+        function after each commit. By default the data are left in the
+        OS's page cache.
+      max_pending (int): The number of messages that may wait for the
+        thread. If the disk can't keep up, writing a message blocks.
+      compress (str): Compress each commit's messages with this method,
+        in the I/O thread (see :class:`distkv.codec.Compressor`).
+
+    :meth:`flush` returns when all messages queued so far have been
+    committed. ``size`` is the number of bytes queued so far.
+
+    The ``stats`` attribute collects the number of ``commits``,
+    ``messages`` and ``bytes`` written, and ``max_delay``, the maximum
+    time (in seconds) between queueing a message and committing it. This
+    is the measured bound on the data that may be lost when the system
+    crashes.
+    """
+
+    _error = None
+    _thread = None
+
+    def __init__(
+        self, path, *, count=100, delay=1.0, sync=None, max_pending=10000, compress=None
+    ):
+        # pylint: disable=super-init-not-called
+        _MsgRW.__init__(self, path=path)
+        if sync not in (None, "fsync", "fdatasync"):
+            raise ValueError(f"Unknown sync method: {sync!r}")
+        self.count = count
+        self.delay = delay
+        self.sync = sync
+        self.max_pending = max_pending
+        self.size = 0
+        self.stats = attrdict(commits=0, messages=0, bytes=0, max_delay=0)
+
+        # All of these are protected by _cond.
+        self._cond = threading.Condition()
+        self.buf = []
+        # When the oldest message in ``buf`` was queued. The I/O thread
+        # waits outside the event loop, so this uses a clock of its own
+        # (``time.perf_counter``), never one which the loop may control.
+        self._first = None
+        self._queued = 0  # number of messages queued so far
+        self._written = 0  # number of messages committed so far
+        self._commit = False  # commit now
+        self._closing = False
+
+        global packer  # pylint: disable=global-statement
+        if packer is None:
+            from .codec import packer  # pylint: disable=redefined-outer-name
+        if compress:
+            from .codec import Compressor
+
+            self._zip = Compressor(compress)
+
+    async def __aenter__(self):
+        self.stream = open(self.path, "wb")
+        self._thread = threading.Thread(
+            target=self._run, name=f"MsgWriter:{self.path}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    async def __aexit__(self, *tb):
+        async with anyio.open_cancel_scope(shield=True):
+            with self._cond:
+                self._closing = True
+                self._cond.notify_all()
+            await anyio.run_sync_in_worker_thread(self._thread.join)
+            self.stream.close()
+        if self._error is not None and tb[0] is None:
+            raise self._error
+
+    async def __call__(self, msg):
+        """Queue a message for writing."""
+        await self._queue(packer(msg))  # pylint: disable=not-callable
+
+    async def write_raw(self, data: bytes):
+        """Queue some already-encoded data for writing. It's not compressed."""
+        if self._zip is not None:
+            data = _Raw(data)
+        await self._queue(data)
+
+    async def _queue(self, data: bytes):
+        with self._cond:
+            if self._error is not None:
+                raise self._error
+            buf = self.buf
+            buf.append(data)
+            self._queued += 1
+            self.size += len(data)
+            if len(buf) == 1:
+                self._first = time.perf_counter()
+                self._cond.notify_all()  # start the timer
+            elif len(buf) == self.count:
+                self._cond.notify_all()
+            full = len(buf) >= self.max_pending
+        if full:
+            await anyio.run_sync_in_worker_thread(self._wait, self._queued - self.max_pending)
+
+    async def flush(self):
+        """Commit all queued messages. Wait until that's done."""
+        with self._cond:
+            self._commit = True
+            self._cond.notify_all()
+        await anyio.run_sync_in_worker_thread(self._wait, self._queued)
+        if self._error is not None:
+            raise self._error
+
+    def _wait(self, n):
+        """Wait until at least ``n`` messages have been committed."""
+        with self._cond:
+            while self._written < n and self._error is None:
+                self._cond.wait()
+
+    def _run(self):
+        """The I/O thread."""
+        sync = getattr(os, self.sync, os.fsync) if self.sync else None
+        cond = self._cond
+
+        while True:
+            with cond:
+                while True:
+                    if self._commit or self._closing:
+                        break
+                    if not self.buf:
+                        cond.wait()
+                        continue
+                    if len(self.buf) >= self.count:
+                        break
+                    timeout = self._first + self.delay - time.perf_counter()
+                    if timeout <= 0:
+                        break
+                    cond.wait(timeout)
+                buf, first, self.buf = self.buf, self._first, []
+                self._commit = False
+                closing = self._closing
+
+            if buf and self._error is None:
+                try:
+                    if self._zip is not None:
+                        data = self._compress(buf)
+                    else:
+                        data = b"".join(buf)
+                    self.stream.write(data)
+                    self.stream.flush()
+                    if sync is not None:
+                        sync(self.stream.fileno())
+                except Exception as exc:  # pylint: disable=broad-except
+                    logger.exception("Writing %s", self.path)
+                    self._error = exc
+                else:
+                    st = self.stats
+                    st.commits += 1
+                    st.messages += len(buf)
+                    st.bytes += len(data)
+                    st.max_delay = max(st.max_delay, time.perf_counter() - first)
+
+            with cond:
+                self._written += len(buf)
+                cond.notify_all()
+                if closing and not self.buf:
+                    return
+
+    def _compress(self, buf):
+        """Compress the messages in ``buf``, except for raw data."""
+        res = []
+        start = 0
+        for i, data in enumerate(buf + [_Raw()]):
+            if isinstance(data, _Raw):
+                if start < i:
+                    res.append(self._zip.block(b"".join(buf[start:i])))
+                res.append(data)
+                start = i + 1
+        return b"".join(res)
+
 
 class _Server:
     _servers = None
@@ -964,6 +1239,8 @@ class Path(collections.abc.Sequence):
     It is an immutable list with special representation.
     """
 
+    __slots__ = ("_data",)
+
     def __init__(self, *a):
         self._data = a
 
@@ -1257,25 +1534,28 @@ class PathShortener:
     def __init__(self, prefix):
         self.prefix = prefix
         self.depth = len(prefix)
-        self.path = []
+        self._prefix = tuple(prefix)
+        self.path = self._prefix
 
     def __call__(self, res):
         try:
             p = res["path"]
         except KeyError:
             return
-        if list(p[: self.depth]) != list(self.prefix):
+        # Work on plain tuples; don't create intermediate paths
+        p = p._data if isinstance(p, Path) else tuple(p)
+        d = self.depth
+        if p[:d] != self._prefix:
             raise RuntimeError(f"Wrong prefix: has {p!r}, want {self.prefix!r}")
 
-        p = p[self.depth :]  # noqa: E203
-        cdepth = min(len(p), len(self.path))
+        last = self.path
+        cdepth = min(len(p), len(last)) - d
         for i in range(cdepth):
-            if p[i] != self.path[i]:
+            if p[d + i] != last[d + i]:
                 cdepth = i
                 break
         self.path = p
-        p = p[cdepth:]
-        res["path"] = p
+        res["path"] = p[d + cdepth :]  # noqa: E203
         res["depth"] = cdepth
 
 
@@ -33,6 +33,7 @@ setup(
         "simpleeval >= 0.9.10",
         "distmqtt >= 0.32.1",
     ],
+    extras_require={"zstd": ["zstandard"]},
     tests_require=["trustme >= 0.5", "pytest", "flake8 >= 3.7"],
     keywords=["async", "key-values", "distributed"],
     python_requires=">=3.7",
@@ -0,0 +1,152 @@
+import pytest
+import trio
+import mock
+
+from distkv.mock.mqtt import stdtest
+from distkv.client import ServerError
+from distkv.util import P
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.trio
+async def test_81_set_many(autojump_clock):  # pylint: disable=unused-argument
+    cfg = {"server": {"batch": {"enabled": True}}}
+    async with stdtest(n=2, args={"init": 123, "cfg": cfg}, tocks=300) as st:
+        s = st.s[0]
+        sent = []
+        send_event = s._send_event
+
+        async def _send_event(action, msg):
+            if action == "update":
+                sent.append(msg)
+            await send_event(action, msg)
+
+        st.ex.enter_context(mock.patch.object(s, "_send_event", new=_send_event))
+
+        async with st.client(0) as c, st.client(1) as ci:
+            r = await c.set(P("foo.one"), value=1, nchain=1)
+            chain = r.chain
+
+            r = await c.set_many(
+                [
+                    (P("foo.two"), 2),
+                    dict(path=P("foo.one"), value=11, chain=chain),
+                    dict(path=P("foo.three"), value=3, nchain=2),
+                    dict(path=P("foo.four")),
+                ],
+                nchain=1,
+            )
+            assert len(r) == 4
+            assert r[0].changed
+            assert r[1].changed
+            assert "prev" not in r[1]
+            assert r[1].chain.tick == r[0].chain.tick + 1
+            assert r[2].chain.prev is None
+            assert not r[3].changed
+            assert r[3].chain.tick == r[2].chain.tick + 1
+
+            # One of these fails, thus none are changed
+            with pytest.raises(ServerError):
+                await c.set_many(
+                    [(P("foo.five"), 5), dict(path=P("foo.one"), value=111, chain=chain)]
+                )
+            assert (await c.get(P("foo.five"))).get("value", None) is None
+            assert (await c.get(P("foo.one"))).value == 11
+
+            with pytest.raises(ServerError):
+                await c.set_many([(P("foo.five"), 5), (P("foo.five"), 6)])
+            assert (await c.get(P("foo.five"))).get("value", None) is None
+
+            await trio.sleep(1)
+            assert (await ci.get(P("foo.one"))).value == 11
+            assert (await ci.get(P("foo.two"))).value == 2
+            assert (await ci.get(P("foo.three"))).value == 3
+
+            n = len(sent)
+            await c.set_many([(P("bar") | i, i) for i in range(50)])
+            await trio.sleep(1)
+            assert 1 < len(sent) - n < 50
+            assert any("batch" in m for m in sent[n:])
+            for i in range(50):
+                assert (await ci.get(P("bar") | i)).value == i
+
+
+@pytest.mark.trio
+async def test_82_next_events(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(args={"init": 123}, tocks=50) as st:
+        s = st.s[0]
+        deleted = []
+
+        def report_deleted(r, server):  # pylint: disable=unused-argument
+            deleted.append(r.__getstate__())
+
+        st.ex.enter_context(mock.patch.object(s.node, "report_deleted", new=report_deleted))
+        with pytest.raises(RuntimeError):
+            async with s.next_events(3) as events:
+                t = events[0].tick
+                events.popleft()
+                raise RuntimeError("Test")
+        assert deleted == [[(t + 1, t + 3)]]
+
+
+@pytest.mark.trio
+async def test_83_no_batch(autojump_clock):  # pylint: disable=unused-argument
+    """Batched broadcasts are off by default"""
+    async with stdtest(n=2, args={"init": 123}, tocks=300) as st:
+        s = st.s[0]
+        sent = []
+        send_event = s._send_event
+
+        async def _send_event(action, msg):
+            if action == "update":
+                sent.append(msg)
+            await send_event(action, msg)
+
+        st.ex.enter_context(mock.patch.object(s, "_send_event", new=_send_event))
+
+        async with st.client(0) as c, st.client(1) as ci:
+            await c.set_many([(P("bar") | i, i) for i in range(20)])
+            await trio.sleep(1)
+            assert len(sent) == 20
+            assert not any("batch" in m for m in sent)
+            for i in range(20):
+                assert (await ci.get(P("bar") | i)).value == i
+
+
+@pytest.mark.trio
+async def test_84_batch_delay(autojump_clock):  # pylint: disable=unused-argument
+    """Updates are collected for a while, up to the configured size"""
+    cfg = {"server": {"batch": {"enabled": True, "delay": 1, "max_len": 2000}}}
+    async with stdtest(n=2, args={"init": 123, "cfg": cfg}, tocks=300) as st:
+        s = st.s[0]
+        sent = []
+        send_event = s._send_event
+
+        async def _send_event(action, msg):
+            if action == "update":
+                sent.append(msg)
+            await send_event(action, msg)
+
+        st.ex.enter_context(mock.patch.object(s, "_send_event", new=_send_event))
+
+        async with st.client(1) as ci:
+            for i in range(10):
+                async with s.next_event() as event:
+                    await s.root.follow(P("baz") | i).set_data(event, i, server=s, tock=s.tock)
+                await trio.sleep(0.01)
+            await trio.sleep(2)
+            assert len(sent) == 1
+            assert len(sent[0]["batch"]) == 10
+
+            n = len(sent)
+            async with st.client(0) as c:
+                await c.set_many([(P("bar") | i, i) for i in range(50)])
+            await trio.sleep(2)
+            assert 1 < len(sent) - n < 5
+            for i in range(10):
+                assert (await ci.get(P("baz") | i)).value == i
+            for i in range(50):
+                assert (await ci.get(P("bar") | i)).value == i
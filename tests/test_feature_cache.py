@@ -0,0 +1,147 @@
+import pytest
+import trio
+import mock
+
+from distkv.mock.mqtt import stdtest
+from distkv.exceptions import ServerClosedError
+from distkv.util import P
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.trio
+async def test_81_cache(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(args={"init": 123}, tocks=200) as st:
+        async with st.client() as c, st.client() as cw:
+            for i in range(5):
+                await cw.set(P("foo") | i, value=i)
+            await cw.set(P("bar"), value="baz")
+
+            async with c.cache(P("foo")) as cache:
+                assert len(cache) == 5
+                assert (await c.get(P("foo") | 2)).value == 2
+                assert "value" not in await c.get(P("foo.nope"))
+                assert (await c.get(P("bar"))).value == "baz"  # not cached
+                assert cache.stats.hits == 2
+                assert cache.stats.misses == 0
+
+                await cw.set(P("foo") | 2, value=22)
+                await cw.delete(P("foo") | 3)
+                await cw.set(P("foo.new"), value="new")
+                await trio.sleep(1)
+                assert cache.stats.updates == 5 + 3
+                assert (await c.get(P("foo") | 2)).value == 22
+                assert "value" not in await c.get(P("foo") | 3)
+                assert (await c.get(P("foo.new"))).value == "new"
+
+                r = await c.get(P("foo") | 2, nchain=2)  # not cached
+                assert r.chain.node == "test_0"
+                assert cache.stats.misses == 1
+                assert cache.stats.hits == 5
+
+            assert not c._caches
+            assert (await c.get(P("foo") | 2)).value == 22
+            assert cache.stats.hits == 5
+
+
+@pytest.mark.trio
+async def test_82_evict(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(args={"init": 123}, tocks=200) as st:
+        async with st.client() as c:
+            for i in range(10):
+                await c.set(P("foo") | i, value=i)
+
+            async with c.cache(P("foo"), size=5) as cache:
+                assert len(cache) == 5
+                assert cache.stats.evicted == 5
+                assert not cache.complete
+
+                cached = [p[-1] for p in cache._data]
+                for i in cached:
+                    assert (await c.get(P("foo") | i)).value == i
+                assert cache.stats.hits == 5
+                assert cache.stats.misses == 0
+
+                # evicted: ask the server, then cache
+                evicted = [i for i in range(10) if i not in cached]
+                for i in evicted:
+                    assert (await c.get(P("foo") | i)).value == i
+                assert cache.stats.misses == 5
+                assert sorted(p[-1] for p in cache._data) == evicted
+                assert (await c.get(P("foo") | 9)).value == 9
+                assert cache.stats.hits + cache.stats.misses == 11
+
+                # unknown entries need to be checked
+                misses = cache.stats.misses
+                assert "value" not in await c.get(P("foo.nope"))
+                assert cache.stats.misses == misses + 1
+
+                # stale data is ignored
+                tock = (await c.get(P("foo") | 9)).tock
+                assert not cache._set(P("foo") | 9, dict(value=99, tock=tock - 1))
+                assert cache.stats.stale == 1
+                assert (await c.get(P("foo") | 9)).value == 9
+
+
+@pytest.mark.trio
+async def test_83_own_writes(autojump_clock):  # pylint: disable=unused-argument
+    """Reading right after writing returns the new value"""
+    async with stdtest(args={"init": 123}, tocks=500) as st:
+        async with st.client() as c:
+            await c.set(P("foo.a"), value=0)
+            async with c.cache(P("foo")) as cache:
+                for i in range(1, 50):
+                    await c.set(P("foo.a"), value=i)
+                    assert (await c.get(P("foo.a"))).value == i
+                await c.delete(P("foo.a"))
+                assert "value" not in await c.get(P("foo.a"))
+                await c.set_many([(P("foo.b"), 1), dict(path=P("foo.c"), value=2)])
+                assert (await c.get(P("foo.c"))).value == 2
+                async with c.pipeline() as pl:
+                    await pl.set(P("foo.d"), value=3)
+                assert (await c.get(P("foo.d"))).value == 3
+                assert cache.stats.misses == 0
+
+            async with c.cache(P("foo"), nchain=1) as cache:
+                await c.set(P("foo.b"), value=5)  # no chain in the reply
+                r = await c.get(P("foo.b"), nchain=1)
+                assert r.value == 5
+                assert r.chain.node == "test_0"
+                assert cache.stats.misses == 1
+                assert cache.stats.hits == 0
+
+
+@pytest.mark.trio
+async def test_84_cache_fails(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(args={"init": 123}, tocks=200) as st:
+        async with st.client() as c:
+
+            def watch(*a, **kw):
+                raise ServerClosedError("gone")
+
+            with mock.patch.object(c, "watch", new=watch):
+                with pytest.raises(ServerClosedError):
+                    async with c.cache(P("foo")):
+                        pass
+            assert not c._caches
+
+
+@pytest.mark.trio
+async def test_85_fill_writes(autojump_clock):  # pylint: disable=unused-argument
+    """The initial fill completes while the subtree is written to"""
+    async with stdtest(args={"init": 123}, tocks=500) as st:
+        async with st.client(credit=4) as c, st.client() as cw:
+            await cw.set_many([(P("foo") | i, i) for i in range(20)])
+
+            async def writer():
+                for i in range(100):
+                    await cw.set(P("foo") | (i % 20), value=100 + i)
+
+            async with trio.open_nursery() as tg:
+                tg.start_soon(writer)
+                with trio.fail_after(60):
+                    async with c.cache(P("foo")) as cache:
+                        assert len(cache) == 20
+            assert (await c.get(P("foo") | 19)).value == 199
@@ -0,0 +1,27 @@
+from distkv.model import Node, NodeEvent
+
+
+def test_91_chain_shared():
+    cache = {}
+    a = Node("a", cache=cache)
+    b = Node("b", cache=cache)
+    c = Node("c", cache=cache)
+    old = NodeEvent(b, tick=2, prev=NodeEvent(a, tick=1))
+    msg = NodeEvent(c, tick=3, prev=old).serialize()
+
+    new = NodeEvent.deserialize(msg, cache=cache, known=old)
+    assert new.prev is old
+    assert NodeEvent.deserialize(msg, cache=cache, known=new) is new
+
+    # a link is only shared if its predecessors are, too
+    msg = NodeEvent(a, tick=4, prev=old.filter(a)).serialize()
+    new = NodeEvent.deserialize(msg, cache=cache, known=old)
+    assert new.prev == old and new.prev is not old
+
+    # without a known chain, or with a chopped one, nothing is shared
+    msg = NodeEvent(c, tick=3, prev=old).serialize()
+    new = NodeEvent.deserialize(msg, cache=cache)
+    assert new.prev == old and new.prev is not old
+    msg = NodeEvent(c, tick=3, prev=old).serialize(nchain=2)
+    new = NodeEvent.deserialize(msg, cache=cache, known=old)
+    assert new.prev == old and new.prev is not old
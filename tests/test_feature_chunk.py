@@ -0,0 +1,88 @@
+import pytest
+import trio
+import mock
+
+from distkv.mock.serf import stdtest
+from distkv.codec import Chunker, unpacker
+from distkv.util import P
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def test_81_split():
+    c = Chunker("me", 100)
+    data = bytes(range(256)) * 4
+    parts = list(c.split(data))
+    assert len(parts) > 1
+    assert all(len(p) <= 100 for p in parts)
+    assert c.stats.split == 1
+    assert c.stats.sent == len(parts)
+
+    r = Chunker("you", 100)
+    parts.reverse()
+    for p in parts[:-1]:
+        assert r.feed(unpacker(p)) is None
+    assert r.incomplete == 1
+    assert r.feed(unpacker(parts[-1])) == data
+    assert r.incomplete == 0
+    assert r.stats.joined == 1
+
+
+def test_82_drop():
+    c = Chunker("me", 100, timeout=10, max_size=500)
+    r = Chunker("you", 100, timeout=10, max_size=500)
+    t = [100]
+    with mock.patch("distkv.codec.time.monotonic", new=lambda: t[0]):
+        a = list(c.split(b"a" * 300))
+        b = list(c.split(b"b" * 300))
+        assert r.feed(unpacker(a[0])) is None
+        t[0] += 20
+        assert r.feed(unpacker(b[0])) is None
+        assert r.stats.expired == 1
+        assert r.feed(unpacker(a[1])) is None
+
+        # memory limit
+        for p in list(c.split(b"c" * 1000))[:-1]:
+            r.feed(unpacker(p))
+        assert r.stats.dropped > 0
+        assert r._size <= 500
+
+
+@pytest.mark.trio
+async def test_83_large_value(autojump_clock):  # pylint: disable=unused-argument
+    cfg = {"server": {"chunk": {"ext": True}}}
+    kw = {"test_0": {"init": 123, "cfg": cfg}, "test_1": {"cfg": cfg}}
+    async with stdtest(n=2, tocks=100, **kw) as st:
+        s = st.s[0]
+        sent = []
+        send = s.serf.send
+
+        async def _send(*a, payload, **kw):
+            if a[-1] == "update":
+                sent.append(payload)
+            await send(*a, payload=payload, **kw)
+
+        st.ex.enter_context(mock.patch.object(s.serf, "send", new=_send))
+
+        value = "x" * 5000
+        async with st.client(0) as c, st.client(1) as ci:
+            await c.set(P("foo.big"), value=value)
+            await trio.sleep(1)
+            assert (await ci.get(P("foo.big"))).value == value
+
+            assert 10 < len(sent) < 15
+            assert all(len(p) <= 450 for p in sent)
+            r = await ci._request("get_state", iter=False, chunks=True)
+            assert r.chunks.joined == 1
+            assert r.chunks.incomplete == 0
+
+
+def test_84_legacy_parts():
+    """Reassembly of old-style parts doesn't grow without bound"""
+    r = Chunker("you", 100, max_size=1000)
+    for seq in range(100):
+        r.add(("old", seq), 0, None, b"x" * 100)
+    assert r.incomplete <= 10
+    assert r.add(("old", 99), 1, 2, b"y") == b"x" * 100 + b"y"
@@ -0,0 +1,58 @@
+import pytest
+import trio
+import mock
+
+from distkv.mock.mqtt import stdtest
+from distkv.codec import compress_methods
+from distkv.util import P
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("method", compress_methods() + [True])
+async def test_81_client(autojump_clock, method):  # pylint: disable=unused-argument
+    async with stdtest(args={"init": 123}, tocks=200) as st:
+        (s,) = st.s
+        value = {"data": ("abc" * 10,) * 100}
+        async with st.client(compress=method) as c:
+            assert c._compress is not None
+            (sc,) = s._clients
+            assert sc._compress.method == c._compress.method
+            for i in range(20):
+                await c.set(P("foo") | i, value=value)
+            assert (await c.get(P("foo") | 1)).value == value
+            n = 0
+            async for r in c.get_tree(P("foo")):
+                assert r.value == value
+                n += 1
+            assert n == 20
+
+        async with st.client() as c:
+            assert c._compress is None
+            assert (await c.get(P("foo") | 1)).value == value
+
+
+@pytest.mark.trio
+async def test_82_broadcast(autojump_clock):  # pylint: disable=unused-argument
+    cfg = {"server": {"chunk": {"ext": True, "max_len": 450, "compress": "zlib"}}}
+    async with stdtest(n=2, args={"init": 123, "cfg": cfg}, tocks=100) as st:
+        s = st.s[0]
+        sent = []
+        send = s.serf.send
+
+        async def _send(*a, payload, **kw):
+            if a[-1] == "update":
+                sent.append(payload)
+            await send(*a, payload=payload, **kw)
+
+        st.ex.enter_context(mock.patch.object(s.serf, "send", new=_send))
+
+        value = "abcdefghij" * 500
+        async with st.client(0) as c, st.client(1) as ci:
+            await c.set(P("foo.big"), value=value)
+            await trio.sleep(1)
+            assert (await ci.get(P("foo.big"))).value == value
+            assert len(sent) == 1
@@ -0,0 +1,143 @@
+import pytest
+import trio
+import mock
+
+from distkv.mock.mqtt import stdtest
+from distkv.server import ServerClient
+from distkv.util import P
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+N = 20
+
+
+async def _fill(c, n=N):
+    await c.set_many([(P("foo") | i, i) for i in range(n)])
+
+
+def _cmd(st, seq):
+    (sc,) = st.s[0]._clients
+    return sc.in_stream.get(seq, None)
+
+
+@pytest.mark.trio
+async def test_91_credit(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(args={"init": 123}, tocks=100) as st:
+        async with st.client() as c:
+            assert c._server_init.credit
+            await _fill(c)
+
+            async with c._stream("get_tree", path=P("foo"), credit=4) as req:
+                await trio.sleep(1)
+                cmd = _cmd(st, req.seq)
+                assert cmd._credit == 0
+                assert cmd._credit_evt is not None  # waiting
+
+                # two messages consumed: grant sent
+                await req.recv()
+                await req.recv()
+                await trio.sleep(1)
+                assert cmd._credit == 0
+                assert req.q.qsize() == 4
+
+                n = 2
+                async for _ in req:
+                    n += 1
+                assert n == N
+            await trio.sleep(1)
+            assert _cmd(st, req.seq) is None
+
+
+@pytest.mark.trio
+async def test_92_credit_stop(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(args={"init": 123}, tocks=100) as st:
+        async with st.client(credit=4) as c:
+            await _fill(c)
+            (sc,) = st.s[0]._clients
+
+            seq = c._seq + 1
+            n = 0
+            async for _ in c.get_tree(P("foo")):
+                n += 1
+                if n == 3:
+                    break
+            await trio.sleep(1)
+            assert seq not in sc.in_stream
+            assert seq not in sc.tasks
+
+
+@pytest.mark.trio
+async def test_93_credit_after_end(autojump_clock):  # pylint: disable=unused-argument
+    """Grants for a stream that has ended must not be processed as commands"""
+    msgs = []
+    _dispatch = ServerClient._dispatch
+
+    def dispatch(self, msg):
+        msgs.append(msg)
+        return _dispatch(self, msg)
+
+    async with stdtest(args={"init": 123}, tocks=100) as st:
+        st.ex.enter_context(mock.patch.object(ServerClient, "_dispatch", new=dispatch))
+        async with st.client(credit=10) as c:
+            await _fill(c, 25)
+            n = 0
+            async for _ in c.get_tree(P("foo")):
+                n += 1
+            assert n == 25
+            await trio.sleep(1)
+
+            # The server drops stray grants
+            await c._send(seq=c._seq, credit=5)
+            assert (await c.get(P("foo") | 1)).value == 1
+
+    assert all("action" in m for m in msgs)
+
+
+@pytest.mark.trio
+async def test_94_no_credit(autojump_clock):  # pylint: disable=unused-argument
+    """An old server doesn't announce flow control; don't use it"""
+    msgs = []
+    _dispatch = ServerClient._dispatch
+
+    def dispatch(self, msg):
+        msgs.append(msg)
+        return _dispatch(self, msg)
+
+    async with stdtest(args={"init": 123}, tocks=100) as st:
+        st.ex.enter_context(mock.patch.object(ServerClient, "_dispatch", new=dispatch))
+        async with st.client() as c:
+            await _fill(c)
+            del c._server_init["credit"]
+
+            n = 0
+            async for _ in c.get_tree(P("foo")):
+                n += 1
+            assert n == N
+
+    (msg,) = [m for m in msgs if m.action == "get_tree"]
+    assert "credit" not in msg
+
+
+@pytest.mark.trio
+async def test_95_watch_fetch_writes(autojump_clock):  # pylint: disable=unused-argument
+    """A fetching watch gets its initial state while updates are written"""
+    async with stdtest(args={"init": 123}, tocks=500) as st:
+        async with st.client(credit=4) as c, st.client() as cw:
+            await _fill(c)
+
+            async def writer():
+                for i in range(100):
+                    await cw.set(P("foo") | (i % N), value=-i)
+
+            n = 0
+            async with trio.open_nursery() as tg:
+                with trio.fail_after(60):
+                    async with c.watch(P("foo"), fetch=True) as w:
+                        tg.start_soon(writer)
+                        async for m in w:
+                            if m.get("state") == "uptodate":
+                                break
+                            n += 1
+            assert n >= N
@@ -0,0 +1,164 @@
+import msgpack
+import pytest
+import trio
+
+from distkv.mock.mqtt import stdtest
+from distkv.client import ServerError
+from distkv.server import Server, ServerClient, SCmd_watch
+from distkv.types import ConvName, plain_conv
+from distkv.codec import OpaqueValue, packer, unpacker, opaque_unpacker
+from distkv.util import P, Path, attrdict
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+CFG = {"server": {"opaque": True}}
+
+
+def test_80_codec():
+    v = OpaqueValue.pack({"a": [1, 2]})
+    data = packer({"value": v})
+    assert unpacker(data).value == {"a": (1, 2)}
+    r = opaque_unpacker(data).value
+    assert type(r) is OpaqueValue
+    assert r.data == v.data
+    assert r == {"a": (1, 2)}
+    assert r == v
+    assert r != {"a": (1, 3)}
+
+
+@pytest.mark.trio
+async def test_81_passthru(autojump_clock):  # pylint: disable=unused-argument
+    value = {"data": ({"x": 1, "y": "two"},) * 10}
+    args = {f"test_{i}": {"cfg": {"server": {"opaque": True}}} for i in range(2)}
+    args["test_0"]["init"] = 123
+    async with stdtest(n=2, tocks=100, **args) as st:
+        async with st.client(opaque=True) as c, st.client(1) as ci:
+            async with ci.watch(P("foo"), fetch=False) as w:
+                await c.set(P("foo.bar"), value=value)
+                res = await c.set(P("foo.bar"), value=value)
+                assert res.changed is False
+                await c.set_many([(P("foo.baz"), 42)])
+
+                async for msg in w:
+                    if msg.get("path") == P("foo.baz"):
+                        break
+                    if "path" in msg:
+                        assert msg.value == value
+            await trio.sleep(1)
+
+            for s in st.s:
+                e = s.root.follow(P("foo.bar"), create=False)
+                assert type(e.data) is OpaqueValue
+                assert e.data == value
+            assert (await ci.get(P("foo.bar"))).value == value
+            assert (await c.get(P("foo.baz"))).value == 42
+
+
+@pytest.mark.trio
+async def test_82_typed(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(args={"init": 123, "cfg": CFG}, tocks=100) as st:
+        (s,) = st.s
+        async with st.client(opaque=True) as c:
+            await c._request(
+                "set_internal",
+                path=P("type.int"),
+                value={
+                    "bad": ["foo", None],
+                    "good": [0, 1, 2],
+                    "code": "if not isinstance(value,int): raise ValueError('not an int')",
+                },
+            )
+            await c._request("set_internal", path=P("match.num.+"), value={"type": P("int")})
+
+            await c.set(P("num.one"), value=1)
+            with pytest.raises(ServerError):
+                await c.set(P("num.two"), value="two")
+            assert s.root.follow(P("num.one"), create=False).data == 1
+
+            # values in the meta tree are always decoded
+            await c.set(P(":n.hostmap.foo"), value=("localhost", 1234))
+            e = s.root.follow(P(":n.hostmap.foo"), create=False, nulls_ok=True)
+            assert type(e.data) is not OpaqueValue
+
+
+class _Stream:
+    def __init__(self):
+        self.data = bytearray()
+
+    async def send_all(self, data):
+        self.data += data
+
+
+@pytest.mark.trio
+async def test_83_old_client(autojump_clock):  # pylint: disable=unused-argument
+    """Clients that don't announce support get plain values"""
+    async with stdtest(args={"init": 123, "cfg": CFG}, tocks=100) as st:
+        (s,) = st.s
+        async with st.client(opaque=True) as c:
+            assert c._opaque
+            assert all(sc.opaque for sc in s._clients)
+            await c.set(P("foo.bar"), value={"a": 1})
+
+            sc = ServerClient(s, _Stream())
+            sc.user = attrdict(is_super_root=False)
+            res = await sc.cmd_get_value(attrdict(path=P("foo.bar")))
+            assert type(res.value) is not OpaqueValue
+            assert res.value == {"a": 1}
+
+            async with trio.open_nursery() as tg:
+                cmd = SCmd_watch(sc, attrdict(seq=1, path=P("foo")))
+                tg.start_soon(cmd.run)
+                await trio.sleep(0.1)
+                await c.set(P("foo.baz"), value={"b": 2})
+                await trio.sleep(0.1)
+                await sc._flush()
+                tg.cancel_scope.cancel()
+            u = msgpack.Unpacker(raw=False)  # extension types stay as they are
+            u.feed(sc.stream.data)
+            values = [m["value"] for m in u if "value" in m]
+            assert values == [{"b": 2}]
+
+            sc.opaque = True
+            res = await sc.cmd_get_value(attrdict(path=P("foo.bar")))
+            assert type(res.value) is OpaqueValue
+
+
+@pytest.mark.trio
+async def test_84_disabled(autojump_clock):  # pylint: disable=unused-argument
+    cfg = {"server": {"opaque": False}}
+    async with stdtest(args={"init": 123, "cfg": cfg}, tocks=100) as st:
+        (s,) = st.s
+        async with st.client(opaque=True) as c:
+            assert not c._opaque
+            await c.set(P("foo.bar"), value={"a": 1})
+            # a client that sends opaque values anyway
+            await c._request("set_value", path=P("foo.baz"), value=OpaqueValue.pack(2))
+            for n in ("bar", "baz"):
+                e = s.root.follow(P("foo") | n, create=False)
+                assert type(e.data) is not OpaqueValue
+
+
+@pytest.mark.trio
+async def test_85_plain_conv(autojump_clock):  # pylint: disable=unused-argument
+    """Same-named converters in different trees get their own wrapper"""
+    convs = [
+        Server(f"test_{i}", cfg={}).root.follow(Path(None, "conv", "foo"), nulls_ok=True)
+        for i in (0, 1)
+    ]
+    ca, cb = convs
+    assert type(ca) is ConvName
+    assert ca == cb  # entries compare by name
+    assert plain_conv(ca).conv is ca
+    assert plain_conv(cb).conv is cb
+    assert plain_conv(ca) is plain_conv(ca)
+
+
+@pytest.mark.trio
+async def test_86_default_off(autojump_clock):  # pylint: disable=unused-argument
+    """Older servers can't store opaque values, so they are off by default"""
+    async with stdtest(args={"init": 123}, tocks=100) as st:
+        async with st.client(opaque=True) as c:
+            assert not c._server_init.opaque
+            assert not c._opaque
@@ -0,0 +1,146 @@
+import pytest
+import trio
+import mock
+
+from distkv.mock.mqtt import stdtest
+from distkv.server import ServerClient
+from distkv.exceptions import ServerError, ServerClosedError
+from distkv.util import P
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.trio
+async def test_81_max_pending(autojump_clock):  # pylint: disable=unused-argument
+    """
+    Simple commands beyond ``max_pending`` wait for a slot, but don't
+    block running streams.
+    """
+    running = 0
+    max_running = 0
+    _get_tock = ServerClient.cmd_get_tock
+
+    async def get_tock(self, msg):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(running, max_running)
+        try:
+            await trio.sleep(10)
+            return await _get_tock(self, msg)
+        finally:
+            running -= 1
+
+    cfg = {"server": {"conn": {"max_pending": 1}}}
+    async with stdtest(args={"init": 123, "cfg": cfg}, tocks=100) as st:
+        st.ex.enter_context(mock.patch.object(ServerClient, "cmd_get_tock", new=get_tock))
+        async with st.client(credit=2) as c:
+            await c.set_many([(P("foo") | i, i) for i in range(10)])
+
+            async with trio.open_nursery() as tg:
+                for _ in range(3):
+                    tg.start_soon(c.get_tock)
+                await trio.sleep(1)
+                assert running == 1
+
+                t = trio.current_time()
+                n = 0
+                async for _ in c.get_tree(P("foo")):
+                    n += 1
+                assert n == 10
+                assert trio.current_time() - t < 5
+            assert max_running == 1
+
+
+@pytest.mark.trio
+async def test_82_client_pipeline(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(args={"init": 123}, tocks=2000) as st:
+        async with st.client() as c:
+            writes = 0
+            send = c._send_packed
+
+            async def count(data):
+                nonlocal writes
+                writes += 1
+                await send(data)
+
+            c._send_packed = count
+            async with c.pipeline(max_pending=100) as pl:
+                handles = [await pl.set(P("foo") | i, value=i) for i in range(500)]
+                r = await pl.get(P("foo") | 42)
+                assert (await r.get()).value == 42
+            assert pl.n_sent == 501
+            assert writes < 20
+            assert all(h.done for h in handles)
+            assert (await handles[-1].get()).tock > (await handles[0].get()).tock
+
+            del c._send_packed
+            n = 0
+            async for r in c.get_tree(P("foo")):
+                assert r.value == r.path[-1]
+                n += 1
+            assert n == 500
+
+
+@pytest.mark.trio
+async def test_83_pipeline_error(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(args={"init": 123}, tocks=200) as st:
+        async with st.client() as c:
+            await c.set(P("foo"), value=1)
+
+            # errors you didn't look at are raised at the end
+            with pytest.raises(ServerError):
+                async with c.pipeline() as pl:
+                    await pl.set(P("bar"), value=1)
+                    await pl.set(P("foo"), value=2, chain=None)
+                    await pl.set(P("baz"), value=1)
+            assert (await c.get(P("baz"))).value == 1
+
+            async with c.pipeline() as pl:
+                h = await pl.set(P("foo"), value=2, chain=None)
+                with pytest.raises(ServerError):
+                    await h.get()
+            assert (await c.get(P("foo"))).value == 1
+
+            # nothing unsent is sent when the block fails
+            with pytest.raises(RuntimeError):
+                async with c.pipeline() as pl:
+                    h = await pl.set(P("new.one"), value=1)
+                    raise RuntimeError("oops")
+            assert not pl._pending
+            assert h.seq not in c._handlers
+            with pytest.raises(ServerClosedError):
+                await h.get()
+            await trio.sleep(1)
+            assert "value" not in await c.get(P("new.one"))
+
+
+@pytest.mark.trio
+async def test_84_max_queued(autojump_clock):  # pylint: disable=unused-argument
+    """
+    The server stops reading when too many simple commands are queued.
+    """
+    queued = 0
+    _start = ServerClient._start_pending
+
+    async def start(self, msg, fn, scope):
+        nonlocal queued
+        await _start(self, msg, fn, scope)
+        queued = max(queued, len(self._queued))
+
+    _get_tock = ServerClient.cmd_get_tock
+
+    async def get_tock(self, msg):
+        await trio.sleep(1)
+        return await _get_tock(self, msg)
+
+    cfg = {"server": {"conn": {"max_pending": 2, "max_queued": 3, "buflen": 64}}}
+    async with stdtest(args={"init": 123, "cfg": cfg}, tocks=200) as st:
+        st.ex.enter_context(mock.patch.object(ServerClient, "_start_pending", new=start))
+        st.ex.enter_context(mock.patch.object(ServerClient, "cmd_get_tock", new=get_tock))
+        async with st.client() as c:
+            async with c.pipeline(max_pending=100) as pl:
+                handles = [await pl._request("get_tock") for _ in range(50)]
+            assert all(h.done for h in handles)
+            assert 3 <= queued < 10
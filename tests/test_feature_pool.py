@@ -0,0 +1,68 @@
+import pytest
+import trio
+
+from distkv.mock.mqtt import stdtest
+from distkv.client import PooledClient
+from distkv.util import P
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _addr(s):
+    for host, port, *_ in s.ports:
+        if host[0] != ":":
+            return host, port
+    raise RuntimeError("no address")
+
+
+@pytest.mark.trio
+async def test_81_pool(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(n=2, args={"init": 123}, tocks=1000) as st:
+        await st.s[1].is_serving
+        async with st.client(0, pool=4, hosts=[_addr(st.s[1])]) as c:
+            assert isinstance(c, PooledClient)
+            await trio.sleep(1)
+            assert len(c.connections) == 4
+            assert len(st.s[0]._clients) == 2
+            assert len(st.s[1]._clients) == 2
+
+            async def work(i):
+                for j in range(10):
+                    await c.set(P("foo") | i | j, value=j)
+                    await trio.sleep(0.01)
+
+            async with trio.open_nursery() as tg:
+                for i in range(10):
+                    tg.start_soon(work, i)
+            await trio.sleep(1)
+            for i in range(10):
+                assert (await c.get(P("foo") | i | 9)).value == 9
+
+            n = 0
+            async for _ in c.get_tree(P("foo")):
+                n += 1
+            assert n == 100
+
+
+@pytest.mark.trio
+async def test_82_failover(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(n=2, args={"init": 123}, tocks=1000) as st:
+        await st.s[1].is_serving
+        async with st.client(0, pool=2, hosts=[_addr(st.s[1])]) as c:
+            await c.set(P("foo"), value=1)
+            await trio.sleep(1)
+
+            # drop the connections to the first server
+            for sc in list(st.s[0]._clients):
+                await sc.stream.aclose()
+            t = trio.current_time()
+            for i in range(10):
+                await c.set(P("foo"), value=i)
+            assert trio.current_time() - t < 1
+
+            await trio.sleep(3)
+            assert len(c.connections) == 2
+            assert len(st.s[1]._clients) == 2
+            assert (await c.get(P("foo"))).value == 9
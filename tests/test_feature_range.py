@@ -0,0 +1,78 @@
+import pytest
+
+from distkv.mock.mqtt import stdtest
+from distkv.model import Entry
+from distkv.util import P
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _names(e, **kw):
+    return [k for k, _ in e.sub_range(**kw)]
+
+
+def test_81_sub_range():
+    root = Entry("root", None)
+    for k in ("c", 3, "a", None, 1.5, ("x", 1), "b", False, 10):
+        Entry(k, root)
+
+    assert _names(root) == [False, 1.5, 3, 10, "a", "b", "c", ("x", 1)]
+    assert _names(root, full=True)[0] is None
+    assert _names(root, start="a", end="c") == ["a", "b"]
+    assert _names(root, after="a", limit=1) == ["b"]
+    assert _names(root, after=3, limit=2) == [10, "a"]
+    assert _names(root, start="zz") == [("x", 1)]
+
+    # the index is kept up to date
+    Entry("bb", root)
+    root["b"]._chop()
+    assert _names(root, start="a", end="c") == ["a", "bb"]
+
+
+def test_82_sub_range_modify():
+    root = Entry("root", None)
+    for k in range(250):
+        Entry(k, root)
+    res = []
+    for k, v in root.sub_range():
+        res.append(k)
+        if k % 2 == 0:
+            root[k + 1]._chop()
+        if k == 150:
+            Entry(999, root)
+    assert res == list(range(0, 250, 2)) + [999]
+
+
+@pytest.mark.trio
+async def test_83_paging(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(args={"init": 123}, tocks=500) as st:
+        async with st.client() as c:
+            await c.set_many([(P("foo") | i | "x", i) for i in range(50)])
+            await c.set_many([(P("foo") | i, i) for i in range(50)])
+
+            res = []
+            after = {}
+            while True:
+                r = await c.list(P("foo"), limit=20, **after)
+                if not r:
+                    break
+                assert len(r) <= 20
+                res.extend(r)
+                after = {"after": r[-1]}
+            assert res == list(range(50))
+
+            await c.set_many([(P("bar") | f"k{i:02d}", i) for i in range(20)])
+            r = await c.list(P("bar"), with_data=True, start="k10", end="k13")
+            assert r == {"k10": 10, "k11": 11, "k12": 12}
+
+            res = []
+            async for r in c.get_tree(P("foo"), after=47):
+                res.append(tuple(r.path))
+            assert res == [(48,), (48, "x"), (49,), (49, "x")]
+
+            n = 0
+            async for r in c.get_tree(P("foo"), start=10, limit=5):
+                n += 1
+            assert n == 5 * 2
@@ -0,0 +1,116 @@
+import pytest
+import trio
+
+from distkv.codec import stream_unpacker
+from distkv.server import Server, ServerClient, StreamCommand
+from distkv.util import attrdict
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FakeStream:
+    """Collects whatever the server writes."""
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.writes = []
+
+    async def send_all(self, data):
+        if self.delay:
+            await trio.sleep(self.delay)
+        self.writes.append(bytes(data))
+
+    def msgs(self):
+        u = stream_unpacker()
+        for w in self.writes:
+            u.feed(w)
+        return list(u)
+
+
+def _client(delay=0, **cfg):
+    s = Server("test_0", cfg={"server": {"conn": cfg}})
+    stream = FakeStream(delay)
+    return ServerClient(s, stream), stream
+
+
+class SCmd_test(StreamCommand):
+    multiline = True
+
+    async def run(self):  # pylint: disable=arguments-differ
+        for i in range(3):
+            await self.send(value=i)
+
+
+@pytest.mark.trio
+async def test_81_unbuffered(autojump_clock):  # pylint: disable=unused-argument
+    sc, stream = _client()
+    await sc.send({"seq": 1, "value": "foo"})
+    assert len(stream.writes) == 1
+
+
+@pytest.mark.trio
+async def test_82_idle(autojump_clock):  # pylint: disable=unused-argument
+    sc, stream = _client()
+    async with trio.open_nursery() as tg:
+        tg.start_soon(sc._flusher)
+        await trio.sleep(0.1)
+        for i in range(3):
+            await sc.send({"seq": 1, "value": i}, buffered=True)
+        assert not stream.writes
+
+        await trio.sleep(0.1)
+        assert len(stream.writes) == 1
+        assert [m.value for m in stream.msgs()] == [0, 1, 2]
+        tg.cancel_scope.cancel()
+
+
+@pytest.mark.trio
+async def test_83_size(autojump_clock):  # pylint: disable=unused-argument
+    sc, stream = _client(send_buflen=100)
+    for i in range(10):
+        await sc.send({"seq": 1, "value": "x" * 30}, buffered=True)
+    assert 2 <= len(stream.writes) <= 5
+    assert all(len(w) >= 100 for w in stream.writes)
+
+
+@pytest.mark.trio
+async def test_84_order(autojump_clock):  # pylint: disable=unused-argument
+    sc, stream = _client()
+    await sc.send({"seq": 1, "value": 1}, buffered=True)
+    await sc.send({"seq": 1, "value": 2}, buffered=True)
+    await sc.send({"seq": 2, "value": 3})
+    assert len(stream.writes) == 1
+    assert [(m.seq, m.value) for m in stream.msgs()] == [(1, 1), (1, 2), (2, 3)]
+
+
+@pytest.mark.trio
+async def test_85_stream_end(autojump_clock):  # pylint: disable=unused-argument
+    sc, stream = _client()
+    cmd = SCmd_test(sc, attrdict(seq=5, action="test"))
+    await cmd()
+    assert len(stream.writes) == 1
+    msgs = stream.msgs()
+    assert [m.get("value") for m in msgs] == [None, 0, 1, 2, None]
+    assert msgs[0].state == "start"
+    assert msgs[-1].state == "end"
+    assert 5 not in sc.in_stream
+
+
+@pytest.mark.trio
+async def test_86_during_flush(autojump_clock):  # pylint: disable=unused-argument
+    """Data that arrive while the flusher is writing must not get stuck."""
+    sc, stream = _client(delay=0.01)
+    async with trio.open_nursery() as tg:
+        tg.start_soon(sc._flusher)
+        await trio.sleep(0.1)
+        await sc.send({"seq": 1, "value": 1}, buffered=True)
+        await trio.sleep(0.005)  # the flusher is now writing
+        assert not stream.writes
+        await sc.send({"seq": 1, "value": 2}, buffered=True)
+
+        await trio.sleep(10)
+        assert not sc._send_buf
+        assert [m.value for m in stream.msgs()] == [1, 2]
+        tg.cancel_scope.cancel()
@@ -214,3 +214,36 @@ code: "if not isinstance(value,int): raise ValueError('not an int')"
 
             pass  # client end
         pass  # server end
+
+
+@pytest.mark.trio
+async def test_73_change(autojump_clock):  # pylint: disable=unused-argument
+    async with stdtest(args={"init": 123}, tocks=80) as st:
+        (s,) = st.s
+        async with st.client() as c:
+            for name, typ in (("int", "int"), ("str", "str")):
+                await c._request(
+                    "set_internal",
+                    path=P("type") | name,
+                    value={
+                        "bad": [None, 1.5],
+                        "good": [{"int": 1, "str": "a"}[name], {"int": 2, "str": "b"}[name]],
+                        "code": f"if not isinstance(value,{typ}): raise ValueError('bad')",
+                    },
+                )
+            await c._request("set_internal", path=P("match.one.+"), value={"type": P("int")})
+            await c.set(P("one.a"), value=1)
+            with pytest.raises(ServerError):
+                await c.set(P("one.a"), value="x")
+            assert P("one.a")._data in s.root[None]["match"]._found
+
+            await c._request("set_internal", path=P("match.one.a"), value={"type": P("str")})
+            await c.set(P("one.a"), value="x")
+            with pytest.raises(ServerError):
+                await c.set(P("one.a"), value=1)
+            with pytest.raises(ServerError):
+                await c.set(P("one.b"), value="x")
+
+            await c._request("delete_internal", path=P("match.one.a"))
+            await c._request("delete_internal", path=P("match.one.+"))
+            await c.set(P("one.a"), value=1.5)
@@ -0,0 +1,238 @@
+import pytest
+import trio
+import mock
+
+from distkv.mock.mqtt import stdtest
+from distkv.model import Entry, Watcher, UpdateEvent, ResyncEvent
+from distkv.codec import stream_unpacker
+from distkv.server import Server, ServerClient, SCmd_watch
+from distkv.util import P, attrdict, NotGiven
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.trio
+async def test_81_fanout(autojump_clock):  # pylint: disable=unused-argument
+    """Many watchers get the same data, but it's serialized once"""
+    async with stdtest(args={"init": 123}, tocks=200) as st:
+        res = {}
+
+        async def watch(c, i, path, *, task_status=trio.TASK_STATUS_IGNORED):
+            async with c.watch(path, nchain=i % 2) as q:
+                task_status.started()
+                async for m in q:
+                    if "path" not in m:
+                        continue
+                    res.setdefault(i, []).append(m)
+
+        async with st.client() as c, trio.open_nursery() as tg:
+            for i in range(6):
+                await tg.start(watch, c, i, P("foo.bar") if i > 3 else P("foo"))
+
+            serialize = Entry.serialize
+            n_ser = 0
+
+            def ser(self, *a, **kw):
+                nonlocal n_ser
+                n_ser += 1
+                return serialize(self, *a, **kw)
+
+            with mock.patch.object(Entry, "serialize", new=ser):
+                for i in range(3):
+                    await c.set(P("foo.bar.baz") | i, value=i)
+                await trio.sleep(1)
+            tg.cancel_scope.cancel()
+
+        # once per write with and once without the change chain
+        assert n_ser == 2 * 3
+        assert len(res) == 6
+        for i, r in res.items():
+            assert [m.value for m in r] == [0, 1, 2]
+            assert [m.path for m in r] == [P("foo.bar.baz") | j for j in range(3)]
+            assert all(("chain" in m) == bool(i % 2) for m in r)
+            assert all(m.tock > 0 for m in r)
+
+
+async def _setter(s):
+    async def set(path, value):
+        async with s.next_event() as event:
+            await s.root.follow(path).set_data(event, value, server=s, tock=s.tock)
+
+    return set
+
+
+@pytest.mark.trio
+async def test_82_lag(autojump_clock):  # pylint: disable=unused-argument
+    """A watcher that falls behind gets the latest value of each entry"""
+    s = Server("test_0", cfg={})
+    s.node.tick = 0
+    set = await _setter(s)
+
+    async with Watcher(s.root.follow(P("foo")), q_len=3, lag_len=5) as w:
+        for i in range(3):
+            await set(P("foo.a"), i)
+        await set(P("foo.b"), 10)
+        await set(P("foo.a"), 3)
+        assert w.lagging
+        assert w.pending() == 4
+
+        res = []
+        while w.pending():
+            m = await w.__anext__()
+            res.append((m.entry.name, m.entry.data))
+        # the queue, then the collapsed updates in the order they happened
+        assert res == [("a", 3), ("a", 3), ("b", 10), ("a", 3)]
+        assert not w.lagging
+        assert w.n_lagged == 1
+        assert w.n_resynced == 0
+
+        await set(P("foo.c"), 20)
+        m = await w.__anext__()
+        assert m.entry.name == "c"
+
+
+@pytest.mark.trio
+async def test_83_resync(autojump_clock):  # pylint: disable=unused-argument
+    """A watcher that falls behind too much gets the changed subtree"""
+    s = Server("test_0", cfg={})
+    s.node.tick = 0
+    set = await _setter(s)
+    await set(P("foo.old"), 0)
+    await set(P("foo.x.old"), 0)
+
+    async with Watcher(s.root.follow(P("foo")), q_len=3, lag_len=5) as w:
+        for i in range(10):
+            await set(P("foo.x.y") | i, i)
+        assert w._resync is not None
+        await set(P("foo.x.z"), 99)
+        assert w.n_resynced == 1
+
+        res = []
+        while w.pending() or w.lagging:
+            m = await w.__anext__()
+            res.append((type(m), m.entry.name))
+        assert res[:2] == [(UpdateEvent, 0), (UpdateEvent, 1)]
+        assert len(res) == 11
+        assert sorted(res[2:], key=str) == sorted(
+            [(ResyncEvent, i) for i in range(2, 10)] + [(ResyncEvent, "z")], key=str
+        )
+
+
+@pytest.mark.trio
+async def test_86_resync_deleted(autojump_clock):  # pylint: disable=unused-argument
+    """A watcher that resyncs learns about entries which have been purged"""
+    s = Server("test_0", cfg={})
+    s.node.tick = 0
+    set = await _setter(s)
+    await set(P("foo.gone"), 0)
+    gone = s.root.follow(P("foo.gone"), create=False)
+
+    async with Watcher(s.root.follow(P("foo")), q_len=3, lag_len=5) as w:
+        for i in range(10):
+            await set(P("foo.x") | i, i)
+        assert w._resync is not None
+        await set(P("foo.gone"), NotGiven)
+        gone.purge_deleted()
+        assert "gone" not in s.root.follow(P("foo"))._sub
+
+        res = {}
+        with trio.move_on_after(1):
+            async for m in w:
+                res[m.entry.name] = m.entry.data
+        assert not w.lagging
+        assert res["gone"] is NotGiven
+        assert res[9] == 9
+        assert gone.path == P("foo.gone")
+
+
+@pytest.mark.trio
+async def test_87_resync_steps(autojump_clock):  # pylint: disable=unused-argument
+    """A resync walks big subtrees in steps"""
+    s = Server("test_0", cfg={})
+    s.node.tick = 0
+    set = await _setter(s)
+    for i in range(25):
+        await set(P("foo.old") | i, i)
+
+    async with Watcher(s.root.follow(P("foo")), q_len=3, lag_len=5) as w:
+        for i in range(10):
+            await set(P("foo.new") | i, i)
+        await set(P("foo.old.0"), 99)
+        assert w._resync[0] is s.root.follow(P("foo"))
+
+        n = 0
+        with mock.patch("distkv.model.RESYNC_STEP", new=10), trio.move_on_after(1):
+            async for m in w:
+                if isinstance(m, ResyncEvent):
+                    # the walk isn't done when the first result arrives
+                    assert n or w._walk is not None
+                    n += 1
+        assert not w.lagging
+        assert n == 9
+
+
+@pytest.mark.trio
+async def test_84_slow_client(autojump_clock):  # pylint: disable=unused-argument
+    """A slow client's watch doesn't break"""
+    async with stdtest(args={"init": 123}, tocks=1000) as st:
+        async with st.client() as c, st.client() as cw:
+            async with cw.watch(P("foo"), credit=5) as q:
+                for i in range(300):
+                    await c.set(P("foo") | i % 20, value=i)
+                await trio.sleep(1)
+
+                res = {}
+                async for m in q:
+                    if "path" not in m:
+                        continue
+                    res[m.path[-1]] = m.value
+                    if len(res) == 20 and all(v >= 280 for v in res.values()):
+                        break
+                assert res == {i: 280 + i for i in range(20)}
+
+                # the stream still works
+                await c.set(P("foo.bar"), value="baz")
+                async for m in q:
+                    if m.get("path") == P("foo.bar"):
+                        break
+
+
+class _Stream:
+    def __init__(self):
+        self.data = bytearray()
+
+    async def send_all(self, data):
+        self.data += data
+
+
+@pytest.mark.trio
+async def test_85_packed(autojump_clock):  # pylint: disable=unused-argument
+    """Watch replies are valid msgpack"""
+    s = Server("test_0", cfg={})
+    s.node.tick = 0
+    set = await _setter(s)
+
+    async with trio.open_nursery() as tg:
+        c = ServerClient(s, _Stream())
+        c.user = attrdict(is_super_root=False)
+        cmd = SCmd_watch(c, attrdict(seq=5, path=P("foo"), nchain=2))
+        tg.start_soon(cmd.run)
+        await trio.sleep(0.1)
+        for i in range(3):
+            await set(P("foo.bar") | i, {"x": i})
+        await trio.sleep(0.1)
+        await c._flush()
+        tg.cancel_scope.cancel()
+
+    u = stream_unpacker()
+    u.feed(c.stream.data)
+    res = [m for m in u if "path" in m]
+    assert len(res) == 3
+    for i, m in enumerate(res):
+        assert m.seq == 5
+        assert m.value == {"x": i}
+        assert m.chain.node == "test_0"
+        assert m.tock > 0
+        assert sorted(m.keys()) == ["chain", "depth", "path", "seq", "tock", "value"]
@@ -1,3 +1,4 @@
+import os
 import pytest
 import trio
 import anyio
@@ -6,7 +7,11 @@ from asyncscope import scope
 from distkv.mock.mqtt import stdtest
 
 from distkv.client import ServerError
-from distkv.util import PathLongener, P
+from distkv.codec import packer, compress_methods
+from distkv.model import Entry, Snapshot
+from distkv.server import Server
+from distkv.snapshot import pack_snapshot, SnapshotReader
+from distkv.util import PathLongener, P, MsgReader, MsgWriter, BackgroundMsgWriter, NotGiven
 from functools import partial
 
 import logging
@@ -354,3 +359,343 @@ async def test_03_three(autojump_clock):  # pylint: disable=unused-argument
             }
             pass  # client end
         pass  # server end
+
+
+@pytest.mark.trio
+async def test_22_snapshot(autojump_clock, tmpdir):  # pylint: disable=unused-argument
+    snap = str(tmpdir.join("snap"))
+    log = str(tmpdir.join("log"))
+    legacy = str(tmpdir.join("legacy"))
+
+    async def state(c):
+        r = await c._request("get_state", nodes=True, known=True, present=True, deleted=True)
+        del r["tock"]
+        del r["seq"]
+        return r
+
+    async def tree(c):
+        res = []
+        async for r in c.get_tree(P(":"), nchain=3):
+            r.pop("tock", None)
+            r.pop("seq", None)
+            res.append(r)
+        return sorted(res, key=lambda r: str(r.path))
+
+    async with stdtest(args={"init": 234}, tocks=100) as st:
+        async with st.client() as c:
+            await c.set(P("foo"), value="hello")
+            await c.set(P("foo.bar"), value="baz")
+            await c.set(P("foo") | True | "a", value=(1, 2))
+            await c.set(P("x.y.z"), value=P("a.b"))
+            await c.set(P("x.y"), value="oops")
+            await c.delete(P("x.y"))
+            await c.set(P("foo"), value="there")
+            await c._request("save", path=snap, snapshot=True, full=True)
+
+            await c._request("log", path=log, fetch=True, snapshot=True)
+            await c.set(P("foo.baz"), value="later")
+            await c.set(P("foo.bar"), value="again")
+            await trio.sleep(2)  # allow the writer to write
+            await c._request("log")
+            await c._request("save", path=legacy, full=True)
+            full_tree = await tree(c)
+
+    async with stdtest(run=False, tocks=100) as st:
+        (s,) = st.s
+        await s.load(snap, local=True)
+        evt = anyio.create_event()
+        await st.tg.spawn(partial(st.s[0].serve, ready_evt=evt))
+        await evt.wait()
+        async with st.client() as c:
+            assert (await c.get(P("foo"))).value == "there"
+            assert (await c.get(P("foo.bar"))).value == "baz"
+            assert (await c.get(P("foo") | True | "a")).value == (1, 2)
+            assert (await c.get(P("x.y.z"))).value == P("a.b")
+            assert (await c.get(P("x.y"))).get("value", None) is None
+
+    # Deleted entries are not saved, thus compare with loading the same
+    # state from a non-snapshot file
+    res = []
+    for path in (log, legacy):
+        async with stdtest(run=False, tocks=100) as st:
+            (s,) = st.s
+            await s.load(path, local=True)
+            evt = anyio.create_event()
+            await st.tg.spawn(partial(st.s[0].serve, ready_evt=evt))
+            await evt.wait()
+            async with st.client() as c:
+                assert await tree(c) == full_tree
+                res.append(await state(c))
+    assert res[0] == res[1]
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("kw", [dict(buflen=10), dict(), dict(mmap=True)])
+async def test_23_reader(tmpdir, kw):
+    path = str(tmpdir.join("msgs"))
+    msgs = [dict(path=P("a.b") | i, value="x" * i) for i in range(1000)]
+    async with MsgWriter(path=path) as w:
+        for m in msgs:
+            await w(m)
+    async with MsgReader(path=path, **kw) as r:
+        assert [m async for m in r] == msgs
+
+    open(path, "w").close()
+    async with MsgReader(path=path, **kw) as r:
+        assert [m async for m in r] == []
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("sync", [None, "fsync", "fdatasync"])
+async def test_24_background_writer(tmpdir, sync):
+    path = str(tmpdir.join("msgs"))
+    msgs = [dict(path=P("a.b") | i, value="x" * i) for i in range(100)]
+
+    async def read():
+        async with MsgReader(path=path) as r:
+            return [m async for m in r]
+
+    async with BackgroundMsgWriter(path=path, count=30, delay=0.1, sync=sync) as w:
+        for m in msgs[:60]:
+            await w(m)
+        await w.flush()
+        assert await read() == msgs[:60]
+        assert w.stats.messages == 60
+
+        await w(msgs[60])
+        await anyio.sleep(0.3)  # committed by the timer
+        assert await read() == msgs[:61]
+        assert w.stats.max_delay < 0.3
+
+        for m in msgs[61:]:
+            await w(m)
+    assert await read() == msgs
+    assert w.stats.messages == 100
+
+    with pytest.raises(ValueError):
+        BackgroundMsgWriter(path=path, sync="sometimes")
+
+
+@pytest.mark.trio
+async def test_25_consistent(autojump_clock):  # pylint: disable=unused-argument
+    """Updates that arrive during a save don't show up in it."""
+    msgs = []
+    async with stdtest(args={"init": 123}, tocks=50) as st:
+        (s,) = st.s
+        async with st.client() as c:
+            for k, v in (("a", 1), ("b", 2), ("c", 3)):
+                await c.set(P("foo") | k, value=v)
+
+            async def writer(msg):
+                msgs.append(msg)
+                if len(msgs) == 2:  # the state and the first entry
+                    await c.set(P("foo.b"), value=22)
+                    await c.delete(P("foo.c"))
+                    await c.set(P("foo.d"), value=4)
+
+            await s._save(writer, lambda _: None)
+            assert {m.path: m.value for m in msgs[1:]} == {
+                P(":"): 123,
+                P("foo.a"): 1,
+                P("foo.b"): 2,
+                P("foo.c"): 3,
+            }
+
+            res = {}
+            async for r in c.get_tree(P("foo"), nchain=0):
+                res[r.path] = r.value
+            assert res == {P("a"): 1, P("b"): 22, P("d"): 4}
+
+
+@pytest.mark.trio
+async def test_26_compact(autojump_clock, tmpdir):  # pylint: disable=unused-argument
+    path = str(tmpdir.join("log"))
+    cfg = {"server": {"save": {"compact": {"enabled": True, "min_size": 2000}}}}
+    async with stdtest(args={"init": 123, "cfg": cfg}, tocks=2000) as st:
+        (s,) = st.s
+        await s.run_saver(path=path, save_state=True)
+        async with st.client() as c:
+            for i in range(300):
+                await c.set(P("foo.bar"), value=i)
+                await c.set(P("foo.baz") | i % 3, value="x" * 20)
+            await trio.sleep(2)
+        await s.run_saver()  # stop logging
+        assert not os.path.exists(path + ".new")
+        assert os.path.getsize(path) < 3000
+
+    async with stdtest(run=False, tocks=2000) as st:
+        (s,) = st.s
+        await s.load(path, local=True)
+        assert s.root.follow(P("foo.bar")).data == 299
+        for i in range(3):
+            assert s.root.follow(P("foo.baz") | i).data == "x" * 20
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("method", compress_methods())
+async def test_27_compressed(tmpdir, method):
+    path = str(tmpdir.join("msgs"))
+    msgs = [dict(path=P("a.b") | i, value={"x": "y" * (i % 20)}) for i in range(1000)]
+    async with MsgWriter(path=path, buflen=10000, compress=method) as w:
+        for m in msgs:
+            await w(m)
+    assert os.path.getsize(path) < sum(len(packer(m)) for m in msgs) / 3
+    for mmap in (False, True):
+        async with MsgReader(path=path, mmap=mmap) as r:
+            assert [m async for m in r] == msgs
+
+    # raw data are written as-is
+    async with BackgroundMsgWriter(path=path, count=300, compress=method) as w:
+        await w.write_raw(packer("raw"))
+        for m in msgs:
+            await w(m)
+    with open(path, "rb") as f:
+        assert f.read(4) == packer("raw")
+    async with MsgReader(path=path) as r:
+        assert [m async for m in r] == ["raw"] + msgs
+
+
+@pytest.mark.trio
+async def test_28_compressed_log(autojump_clock, tmpdir):  # pylint: disable=unused-argument
+    path = str(tmpdir.join("log"))
+    cfg = {"server": {"save": {"compress": True}}}
+    async with stdtest(args={"init": 123, "cfg": cfg}, tocks=2000) as st:
+        (s,) = st.s
+        async with st.client() as c:
+            for i in range(100):
+                await c.set(P("foo.bar") | i, value=i)
+            await c._request("log", path=path, fetch=True, snapshot=True)
+            for i in range(100):
+                await c.set(P("foo.baz") | i, value=i)
+            await trio.sleep(2)
+            await c._request("log")
+
+    async with stdtest(run=False, tocks=2000) as st:
+        (s,) = st.s
+        await s.load(path, local=True)
+        for i in range(100):
+            assert s.root.follow(P("foo.bar") | i).data == i
+            assert s.root.follow(P("foo.baz") | i).data == i
+
+
+@pytest.mark.trio
+async def test_29_consistent_tree(autojump_clock):  # pylint: disable=unused-argument
+    """get_tree only uses a snapshot when asked to."""
+    async with stdtest(args={"init": 123}, tocks=100) as st:
+        (s,) = st.s
+        async with st.client() as c:
+            for i in range(10):
+                await c.set(P("foo") | i, value=i)
+
+            for consistent in (False, True):
+                res = []
+                async for r in c.get_tree(P("foo"), credit=2, consistent=consistent):
+                    if not res:
+                        assert bool(s.root._snapshots) is consistent
+                        await c.set(P("foo") | 9, value=-9)
+                        await c.delete(P("foo") | 8)
+                    res.append(r.value)
+                if consistent:
+                    assert res == list(range(10))
+                else:
+                    assert res == list(range(8)) + [-9]
+                await c.set(P("foo") | 9, value=9)
+                await c.set(P("foo") | 8, value=8)
+            assert not s.root._snapshots
+
+
+async def _setter(s):
+    async def set(path, value):
+        async with s.next_event() as event:
+            await s.root.follow(path).set_data(event, value, server=s, tock=s.tock)
+
+    return set
+
+
+@pytest.mark.trio
+async def test_30_snapshot_chop(autojump_clock):  # pylint: disable=unused-argument
+    """Snapshots belong to their tree; each keeps only what it needs."""
+    s = Server("test_0", cfg={})
+    s.node.tick = 0
+    set = await _setter(s)
+    for k in "abc":
+        await set(P("foo") | k, 1)
+    foo = s.root.follow(P("foo"))
+
+    with Snapshot(foo) as snap:
+        assert s.root._snapshots == {snap}
+        assert not Server("test_1", cfg={}).root._snapshots
+
+        # deleted before the second snapshot: kept only for the first one
+        await set(P("foo.a"), NotGiven)
+        foo["a"].purge_deleted()
+        assert "a" in foo._sub
+        # not changed while the first snapshot is active: removed at once
+        foo["b"].purge_deleted()
+        assert "b" not in foo._sub
+
+        snap2 = Snapshot(s.root)
+        snap2.__enter__()
+        await set(P("foo.c"), NotGiven)
+        foo["c"].purge_deleted()
+        assert snap.data(foo["a"]) == 1
+
+    assert "a" not in foo._sub
+    assert "c" in foo._sub  # the second snapshot still needs it
+    assert s.root._snapshots == {snap2}
+    snap2.__exit__(None, None, None)
+    assert "c" not in foo._sub
+    assert not s.root._snapshots
+
+
+@pytest.mark.trio
+async def test_31_pack_snapshot(autojump_clock, tmpdir):  # pylint: disable=unused-argument
+    """Packing a snapshot lets updates proceed, but doesn't include them."""
+    s = Server("test_0", cfg={})
+    s.node.tick = 0
+    set = await _setter(s)
+    for i in range(1000):
+        await set(P("foo") | i, i)
+    done = []
+
+    async def change():
+        await set(P("foo") | 0, "new")
+        await set(P("foo") | 1, NotGiven)
+        done.append("change")
+
+    async with trio.open_nursery() as tg:
+        tg.start_soon(change)
+        data = await pack_snapshot({"info": True}, s.root)
+        done.append("pack")
+    assert done == ["change", "pack"]
+    assert not s.root._snapshots
+
+    path = tmpdir.join("snap")
+    with open(path, "wb") as f:
+        f.write(data)
+    with SnapshotReader(path) as snap:
+        assert snap.info == {"info": True}
+        values = [value for _depth, _names, _chain, _tock, value in snap]
+    assert values == list(range(1000))
+
+
+@pytest.mark.trio
+async def test_32_plain_tree(autojump_clock, tmpdir):  # pylint: disable=unused-argument
+    """Snapshots work on trees whose root is a plain entry."""
+    root = Entry("root", None)
+    for i in range(3):
+        await root.follow(P("foo") | i).set(i)
+
+    e = root.follow(P("foo") | 0)
+    with Snapshot(e) as snap:
+        assert root._snapshots == {snap}
+        snap._save(e)
+        await e.set(99)
+        assert snap.data(e) == 0
+    assert not root._snapshots
+
+    path = tmpdir.join("snap")
+    with open(path, "wb") as f:
+        f.write(await pack_snapshot({}, root))
+    with SnapshotReader(path) as snap:
+        assert [value for *_, value in snap] == [99, 1, 2]
@@ -1,12 +1,15 @@
 import pytest
 import trio
+import anyio
 import mock
+from collections import defaultdict
+from functools import partial
 
 # doesn't work with MQTT because we can't split
 from distkv.mock.serf import stdtest
 import asyncserf
 import msgpack
-from distkv.util import attrdict, P, Path
+from distkv.util import attrdict, NotGiven, P, Path
 
 import logging
 
@@ -184,3 +187,156 @@ async def test_11_split1(autojump_clock, tocky):  # pylint: disable=unused-argum
 
     # Now make sure that updates are transmitted once
     assert n_two <= 2 * N + 1
+
+
+@pytest.mark.trio
+async def test_12_sync_shards(autojump_clock):  # pylint: disable=unused-argument
+    """
+    A new server fetches subtrees from several others.
+    """
+    cfg = {"server": {"sync": {"depth": 2, "peers": 3}}}
+    async with stdtest(
+        test_0={"init": 420}, test_3={"cfg": cfg}, n=4, run_3=False, tocks=1000
+    ) as st:
+        async with st.client(0) as c:
+            for i in range(10):
+                for j in range(3):
+                    await c.set(Path("sub", i, j), value=10 * i + j)
+            await c.set(P("top"), value="here")
+        await trio.sleep(20)
+
+        s = st.s[3]
+        peers = []
+        sync_client = s._sync_client
+
+        def counted(node):
+            peers.append(node)
+            return sync_client(node)
+
+        s._sync_client = counted
+        evt = anyio.create_event()
+        await st.tg.spawn(partial(s.serve, ready_evt=evt))
+        await evt.wait()
+        assert len(set(peers)) > 1
+
+        async with st.client(3) as c:
+            assert (await c.get(P(":"))).value == 420
+            assert (await c.get(P("top"))).value == "here"
+            for i in range(10):
+                for j in range(3):
+                    assert (await c.get(Path("sub", i, j))).value == 10 * i + j
+
+
+@pytest.mark.trio
+async def test_13_resync(autojump_clock):  # pylint: disable=unused-argument
+    """
+    A server fetches the subtrees which differ from another's.
+    """
+    async with stdtest(test_0={"init": 420}, n=2, tocks=1000) as st:
+        s0, s1 = st.s
+        async with st.client(0) as c:
+            for i in range(10):
+                for j in range(20):
+                    await c.set(Path("sub", i, j), value=i * j)
+        await trio.sleep(10)
+        assert s0.root.follow(P("sub")).digest == s1.root.follow(P("sub")).digest
+        st.split(1)
+
+        async def resync():
+            seen = defaultdict(dict)
+            async with s1._sync_client("test_0") as client:
+                nr = await s1._resync_tree(client, seen, [])
+            s1._seen_all(seen)
+            assert s0.root.follow(P("sub")).digest == s1.root.follow(P("sub")).digest
+            return nr
+
+        async with st.client(0) as c:
+            await c.set(Path("sub", 3, 4), value="new")
+            await c.delete(Path("sub", 5, 6))
+            assert s0.root.follow(P("sub")).digest != s1.root.follow(P("sub")).digest
+            assert await resync() == 2
+            assert s1.root.follow(Path("sub", 3, 4)).data == "new"
+            assert s1.root.follow(Path("sub", 5, 6)).data is NotGiven
+
+            for j in range(20):
+                await c.set(Path("sub", 7, j), value="newer")
+            for j in range(5):
+                await c.set(Path("sub", 11, j), value=j)
+            assert await resync() == 2  # one level and one new subtree
+            assert s1.root.follow(Path("sub", 7, 19)).data == "newer"
+            assert s1.root.follow(Path("sub", 11, 4)).data == 4
+
+        assert await resync() == 0
+
+
+@pytest.mark.trio
+async def test_14_resync_send(autojump_clock):  # pylint: disable=unused-argument
+    """
+    Entries fetched by a resync are broadcast in batches, with full chains.
+    """
+    args = {f"test_{i}": {"cfg": {"server": {"batch": {"enabled": True}}}} for i in range(3)}
+    args["test_0"]["init"] = 420
+    async with stdtest(n=3, tocks=1000, **args) as st:
+        s0 = st.s[0]
+        for i in range(3):
+            async with st.client(i) as c:
+                for j in range(10):
+                    await c.set(Path("sub", j), value=i * j)
+            await trio.sleep(1)
+        entries = [s0.root.follow(Path("sub", j)) for j in range(10)]
+
+        sent = []
+
+        async def send_event(action, msg):
+            sent.append((action, msg))
+
+        with mock.patch.object(s0, "_send_event", new=send_event):
+            await s0._send_entries(entries)
+        assert 1 <= len(sent) < 10  # Serf's messages are short
+        msgs = []
+        for action, msg in sent:
+            assert action == "update"
+            msgs.extend(msg["batch"])
+        assert len(msgs) == 10
+        for m in msgs:
+            depth = 0
+            chain = m["chain"]
+            while chain is not None:
+                depth += 1
+                chain = chain.get("prev")
+            assert depth == 3
+
+
+@pytest.mark.trio
+async def test_15_resync_error(autojump_clock):  # pylint: disable=unused-argument
+    """
+    A subtree which fails to fetch doesn't stop the resync.
+    """
+    async with stdtest(test_0={"init": 420}, n=2, tocks=1000) as st:
+        s0, s1 = st.s
+        async with st.client(0) as c:
+            for i in range(10):
+                for j in range(20):
+                    await c.set(Path("sub", i, j), value=i * j)
+        await trio.sleep(10)
+        st.split(1)
+
+        async with st.client(0) as c:
+            await c.set(Path("sub", 3, 4), value="new")
+            await c.delete(Path("sub", 5, 6))
+
+        fetch = s1._fetch_tree
+
+        async def fetch_tree(client, path, *a, **kw):
+            if path[:2] == ("sub", 3):
+                # ask for something that doesn't exist
+                path = ("sub", 3, "nope")
+            return await fetch(client, path, *a, **kw)
+
+        seen = defaultdict(dict)
+        with mock.patch.object(s1, "_fetch_tree", new=fetch_tree):
+            async with s1._sync_client("test_0") as client:
+                assert await s1._resync_tree(client, seen, []) == 2
+        s1._seen_all(seen)
+        assert s1.root.follow(Path("sub", 3, 4)).data == 12
+        assert s1.root.follow(Path("sub", 5, 6)).data is NotGiven
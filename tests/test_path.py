@@ -1,5 +1,5 @@
 import pytest
-from distkv.util import Path, yformat, yload, P
+from distkv.util import Path, PathShortener, PathLongener, yformat, yload, P
 from distkv.codec import packer, unpacker
 
 _valid = (
@@ -99,3 +99,20 @@ def test_yaml():
     b = "!P a.b.c\n...\n"
     assert yformat(a) == b
     assert yload(b) == a
+
+
+def test_shorten():
+    paths = [P("a.b"), P("a.b.c.d"), P("a.b.c.e.f"), P("a.b.c.e.g.h"), P("a.b.c.i"), P("a.b.j")]
+    short = [(0, ()), (0, ("c", "d")), (1, ("e", "f")), (2, ("g", "h")), (1, ("i",)), (0, ("j",))]
+
+    ps = PathShortener(P("a.b"))
+    pl = PathLongener(P("a.b"))
+    for p, (d, s) in zip(paths, short):
+        res = {"path": p}
+        ps(res)
+        assert (res["depth"], tuple(res["path"])) == (d, s)
+        pl(res)
+        assert res["path"] == p
+
+    with pytest.raises(RuntimeError):
+        ps({"path": P("a.c")})